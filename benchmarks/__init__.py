@@ -0,0 +1 @@
+"""Micro-benchmarks for Hue2MQTT."""
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of command payload validation.
+
+Compares validating a whole model with the validator used by Hue2MQTT.
+
+Usage: python -m benchmarks.validation
+"""
+import json
+import timeit
+from typing import Any, Dict
+
+from pydantic import parse_obj_as
+
+from hue2mqtt.schema import LightSetState
+from hue2mqtt.validation import get_validator
+
+PAYLOADS = [
+    '{"on": true}',
+    '{"on": true, "bri": 254}',
+    '{"xy": [0.3, 0.4], "transitiontime": 4}',
+]
+
+NUMBER = 20000
+
+
+def model_path(payload: str) -> Dict[str, Any]:
+    """The previous approach of constructing a model."""
+    return parse_obj_as(LightSetState, json.loads(payload)).dict()
+
+
+def validator_path(payload: str) -> Dict[str, Any]:
+    """The validator used by Hue2MQTT."""
+    return get_validator(LightSetState).validate(json.loads(payload))
+
+
+def main() -> None:
+    """Run the benchmark."""
+    for payload in PAYLOADS:
+        model = timeit.timeit(lambda: model_path(payload), number=NUMBER)  # noqa: B023
+        fast = timeit.timeit(lambda: validator_path(payload), number=NUMBER)  # noqa: B023
+        print(
+            f"{payload:45} model: {model / NUMBER * 1e6:6.2f}us "
+            f"validator: {fast / NUMBER * 1e6:6.2f}us "
+            f"({model / fast:.1f}x)",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,39 @@ from typing import Optional
 
 import click
 
+from .config import Hue2MQTTConfig
 from .discovery import discover_bridge
 from .hue2mqtt import Hue2MQTT
-
-loop = asyncio.get_event_loop()
+from .runtime import create_event_loop
 
 
 @click.command("hue2mqtt")
 @click.option("-v", "--verbose", is_flag=True)
 @click.option("-c", "--config-file", type=click.Path(exists=True))
 @click.option("--discover", is_flag=True)
-def app(*, verbose: bool, config_file: Optional[str], discover: bool) -> None:
+@click.option("--bridge-id", help="Bridge to select when discovering several.")
+@click.option("--probe-subnet", help="Also probe each host in a subnet for a bridge.")
+@click.option("--refresh", is_flag=True, help="Ignore previously discovered bridges.")
+def app(
+    *,
+    verbose: bool,
+    config_file: Optional[str],
+    discover: bool,
+    bridge_id: Optional[str],
+    probe_subnet: Optional[str],
+    refresh: bool,
+) -> None:
     """Main function for Hue2MQTT."""
     if discover:
-        loop.run_until_complete(discover_bridge())
+        asyncio.run(
+            discover_bridge(bridge_id=bridge_id, subnet=probe_subnet, refresh=refresh),
+        )
     else:
+        # The event loop must exist before the application is created
+        config = Hue2MQTTConfig.load(config_file)
+        loop = create_event_loop(config.runtime.loop)
+        asyncio.set_event_loop(loop)
+
         # Start application
         hue2mqtt = Hue2MQTT(verbose, config_file)
         loop.run_until_complete(hue2mqtt.run())
@@ -0,0 +1,170 @@
+"""
+CLIP v2 Event Processing.
+
+The CLIP v2 event stream of the bridge only contains the fields of each
+resource that have changed. These changes are applied directly to the last
+known state of the entity, rather than rebuilding the whole entity.
+
+The fields are converted to their v1 equivalents, so that the published
+entities keep the same schema.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+import aiohue
+from aiohttp.client_exceptions import ClientError
+from pydantic import BaseModel, parse_obj_as
+
+from .schema import GroupInfo, GroupState, LightInfo, LightState, SensorInfo
+
+LOGGER = logging.getLogger(__name__)
+
+RETRY_DELAY = 5
+
+# The v1 button event codes, by the name of the v2 event.
+BUTTON_EVENT_CODES = {
+    "initial_press": 0,
+    "repeat": 1,
+    "long_press": 1,
+    "short_release": 2,
+    "long_release": 3,
+}
+
+
+async def stream_updates(
+    bridge: aiohue.Bridge,
+) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+    """
+    Yield the type of each event, and the resource that it changed.
+
+    If the connection to the bridge drops, the stream is resumed from the
+    last event that was received.
+    """
+    last_event_id = None
+    while True:
+        try:
+            async for message in bridge.clip.stream_events(last_event_id):
+                last_event_id = message.get("id")
+                for event in message.get("data", []):
+                    for resource in event.get("data", []):
+                        yield event.get("type"), resource
+        except ClientError as e:
+            LOGGER.warning(f"CLIP event stream dropped, retry in {RETRY_DELAY}s: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+        else:
+            LOGGER.debug("CLIP event stream ended, resubscribing")
+
+
+async def fetch_resources(bridge: aiohue.Bridge) -> List[Dict[str, Any]]:
+    """Fetch all of the CLIP v2 resources, retrying until the bridge responds."""
+    while True:
+        try:
+            resources: Dict[str, List[Dict[str, Any]]] = await bridge.clip.resources()
+        except ClientError as e:
+            LOGGER.warning(
+                f"Unable to fetch CLIP resources, retry in {RETRY_DELAY}s: {e}",
+            )
+            await asyncio.sleep(RETRY_DELAY)
+        else:
+            return resources["data"]
+
+
+def to_bri(brightness: float) -> int:
+    """Convert a v2 brightness percentage to a v1 brightness, from 1 to 254."""
+    return max(1, min(254, round(brightness / 100 * 254)))
+
+
+def index_buttons(resources: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Get the control ID of each button, which is needed for v1 button events."""
+    return {
+        resource["id"]: resource["metadata"]["control_id"]
+        for resource in resources
+        if resource.get("type") == "button" and "metadata" in resource
+    }
+
+
+def parse_id_v1(resource: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Get the type and ID of the v1 entity that a resource belongs to."""
+    id_v1 = resource.get("id_v1")
+    if not id_v1:
+        return None
+    parts = id_v1.strip("/").split("/")
+    if len(parts) != 2:
+        return None
+    return parts[0], parts[1]
+
+
+def apply_light_update(light: LightInfo, resource: Dict[str, Any]) -> LightInfo:
+    """Apply the changed fields of a light resource to a light."""
+    changes: Dict[str, Any] = {}
+    if "on" in resource:
+        changes["on"] = resource["on"]["on"]
+    if "dimming" in resource:
+        changes["bri"] = to_bri(resource["dimming"]["brightness"])
+    if "color" in resource:
+        xy = resource["color"]["xy"]
+        changes["xy"] = (xy["x"], xy["y"])
+        changes["color_mode"] = "xy"
+    if resource.get("color_temperature", {}).get("mirek") is not None:
+        changes["ct"] = resource["color_temperature"]["mirek"]
+        changes["color_mode"] = "ct"
+    if resource.get("type") == "zigbee_connectivity" and "status" in resource:
+        changes["reachable"] = resource["status"] == "connected"
+
+    if not changes:
+        return light
+    if light.state is None:
+        state = parse_obj_as(LightState, changes)
+    else:
+        state = light.state.copy(update=changes)
+    return light.copy(update={"state": state})
+
+
+def apply_group_update(group: GroupInfo, resource: Dict[str, Any]) -> GroupInfo:
+    """
+    Apply the changed fields of a grouped light resource to a group.
+
+    A group is on if any of its lights are on, so whether all of the lights
+    are on is only known when the group is turned off.
+    """
+    action: Dict[str, Any] = {}
+    update: Dict[str, Any] = {}
+    if "on" in resource:
+        on = resource["on"]["on"]
+        action["on"] = on
+        all_on = group.state.all_on if on else False
+        update["state"] = GroupState(all_on=all_on, any_on=on)
+    if "dimming" in resource:
+        action["bri"] = to_bri(resource["dimming"]["brightness"])
+
+    if not action:
+        return group
+    update["action"] = group.action.copy(update=action)
+    return group.copy(update=update)
+
+
+def apply_sensor_update(
+    sensor: SensorInfo,
+    resource: Dict[str, Any],
+    buttons: Dict[str, int],
+) -> SensorInfo:
+    """Apply the changed fields of a motion, light level, temperature or button."""
+    changes: Dict[str, Any] = {}
+    if "motion" in resource:
+        changes["presence"] = resource["motion"]["motion"]
+    if resource.get("light", {}).get("light_level_valid"):
+        changes["lightlevel"] = resource["light"]["light_level"]
+    if resource.get("temperature", {}).get("temperature_valid"):
+        changes["temperature"] = round(resource["temperature"]["temperature"] * 100)
+    if "button" in resource and resource.get("id") in buttons:
+        code = BUTTON_EVENT_CODES.get(resource["button"].get("last_event"))
+        if code is not None:
+            changes["buttonevent"] = buttons[resource["id"]] * 1000 + code
+
+    if not changes:
+        return sensor
+    changes["lastupdated"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    state: BaseModel = sensor.state
+    return sensor.copy(update={"state": state.copy(update=changes)})
@@ -4,9 +4,11 @@ Configuration schema for Astoria.
 Common to all components.
 """
 from pathlib import Path
-from typing import IO, Optional
+from typing import IO, TYPE_CHECKING, Dict, List, Literal, Optional
 
-from pydantic import BaseModel, parse_obj_as
+from pydantic import BaseModel, confloat, conint, parse_obj_as
+
+from .schema import LightSetState
 
 # Backwards compatibility for TOML in stdlib from Python 3.11
 try:
@@ -14,6 +16,14 @@ try:
 except ModuleNotFoundError:
     import tomli as tomllib  # type: ignore[import,no-redef,unused-ignore]
 
+# Constrained types cannot be used in annotations without the pydantic plugin
+if TYPE_CHECKING:
+    Fraction = float
+    PositiveInt = int
+else:
+    Fraction = confloat(gt=0, le=1)
+    PositiveInt = conint(gt=0)
+
 
 class HueBridgeInfo(BaseModel):
     """MQTT Broker Information."""
@@ -38,6 +48,249 @@ class MQTTBrokerInfo(BaseModel):
     enable_tls: bool = False
     topic_prefix: str = "hue2mqtt"
     force_protocol_version_3_1: bool = False
+    topic_alias_maximum: int = 0
+    payload_encoding: Literal["json", "msgpack", "cbor"] = "json"
+    publisher_connections: int = 1
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class MetricsInfo(BaseModel):
+    """Metrics Publishing Information."""
+
+    enable_publish: bool = False
+    publish_interval: float = 60
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class ReconciliationInfo(BaseModel):
+    """
+    Periodic Reconciliation Information.
+
+    Intervals are in seconds. The jitter is a fraction of the interval.
+    """
+
+    enabled: bool = False
+    interval: float = 300
+    jitter: float = 0.1
+    max_backoff: float = 3600
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class EventStreamInfo(BaseModel):
+    """
+    Event Stream Information.
+
+    Times are in seconds.
+    """
+
+    backend: Literal["v1", "v2"] = "v1"
+    enable_watchdog: bool = False
+    stall_timeout: float = 600
+    max_backoff: float = 60
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class HAInfo(BaseModel):
+    """
+    High Availability Information.
+
+    Times are in seconds. The instance ID defaults to the hostname.
+    """
+
+    enabled: bool = False
+    instance_id: str = ""
+    share_group: str = "hue2mqtt"
+    heartbeat_interval: float = 2
+    lease_timeout: float = 6
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class LanesInfo(BaseModel):
+    """
+    Priority Lane Information.
+
+    Weights are the number of jobs run from each lane per round.
+    """
+
+    enabled: bool = False
+    command_weight: int = 8
+    status_weight: int = 4
+    state_weight: int = 1
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class InitialPublishInfo(BaseModel):
+    """Initial Publish Information."""
+
+    max_inflight: int = 100
+    chunk_size: int = 20
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class GroupsInfo(BaseModel):
+    """Group Information."""
+
+    derive_state: bool = False
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class RuntimeInfo(BaseModel):
+    """Runtime Information."""
+
+    loop: Literal["asyncio", "uvloop"] = "asyncio"
+    executor: Literal["none", "thread", "process"] = "none"
+    workers: int = 0
+    lag_monitor_interval: float = 1
+    lag_warning_threshold: float = 0.5
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class LoggingInfo(BaseModel):
+    """Logging Information."""
+
+    structured: bool = False
+    background: bool = False
+    rate_limit_interval: float = 0
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class CommandsInfo(BaseModel):
+    """
+    Commands Information.
+
+    The pending timeout is how long the cached state of a light is not
+    trusted for after a command is sent to it, in seconds.
+    """
+
+    suppress_redundant: bool = False
+    pending_timeout: float = 2
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class ScenesInfo(BaseModel):
+    """
+    Local Scene Information.
+
+    Each scene maps the uniqueid of a light to the state to set it to.
+    Intervals are in seconds.
+    """
+
+    light_interval: float = 0.1
+    group_interval: float = 1
+    definitions: Dict[str, Dict[str, LightSetState]] = {}
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class EffectsInfo(BaseModel):
+    """
+    Effects Information.
+
+    The budget share is the fraction of the rate limits of the bridge that
+    effects may use. Times are in seconds.
+    """
+
+    budget_share: Fraction = 0.5
+    min_interval: float = 0.5
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class HistoryInfo(BaseModel):
+    """
+    Sensor History Information.
+
+    Resolutions are in seconds. If a save file is given, the history is
+    saved to it at shutdown and loaded from it at startup.
+    """
+
+    enabled: bool = False
+    samples: PositiveInt = 100
+    resolutions: List[PositiveInt] = [60, 3600]
+    buckets: PositiveInt = 48
+    save_file: Optional[str] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class FilterRule(BaseModel):
+    """
+    Entity Filter Rule.
+
+    An entity matches if it matches every field that is set. Names are
+    matched with shell-style wildcards, e.g "Hallway *".
+    """
+
+    entity_type: Optional[Literal["light", "group", "sensor"]] = None
+    type: Optional[str] = None  # noqa: A003
+    model: Optional[str] = None
+    name: Optional[str] = None
+    room: Optional[str] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class FiltersInfo(BaseModel):
+    """Entity Filter Information."""
+
+    include: List[FilterRule] = []
+    exclude: List[FilterRule] = []
 
     class Config:
         """Pydantic config."""
@@ -50,6 +303,20 @@ class Hue2MQTTConfig(BaseModel):
 
     mqtt: MQTTBrokerInfo
     hue: HueBridgeInfo
+    metrics: MetricsInfo = MetricsInfo()
+    reconciliation: ReconciliationInfo = ReconciliationInfo()
+    events: EventStreamInfo = EventStreamInfo()
+    ha: HAInfo = HAInfo()
+    lanes: LanesInfo = LanesInfo()
+    groups: GroupsInfo = GroupsInfo()
+    initial_publish: InitialPublishInfo = InitialPublishInfo()
+    runtime: RuntimeInfo = RuntimeInfo()
+    logging: LoggingInfo = LoggingInfo()
+    commands: CommandsInfo = CommandsInfo()
+    scenes: ScenesInfo = ScenesInfo()
+    effects: EffectsInfo = EffectsInfo()
+    history: HistoryInfo = HistoryInfo()
+    filters: FiltersInfo = FiltersInfo()
 
     class Config:
         """Pydantic config."""
@@ -1,25 +1,413 @@
-"""Hue Bridge Discovery and Configuration."""
+"""
+Hue Bridge Discovery and Configuration.
 
+Bridges are searched for using several methods in parallel, so that they
+can be found quickly even when some methods are unavailable, e.g there is
+no internet access for N-UPnP. The bridges that are found are cached, and
+the cache is used for as long as the bridges still respond at the same
+address.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import struct
 import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import aiohttp
-from aiohue.discovery import discover_nupnp
+from aiohue import Bridge
+from aiohue.discovery import URL_NUPNP
 from aiohue.errors import LinkButtonNotPressed
+from aiohue.util import normalize_bridge_id
+from pydantic import BaseModel
 
+LOGGER = logging.getLogger(__name__)
 
-async def discover_bridge() -> None:
+MDNS_ADDRESS = ("224.0.0.251", 5353)
+MDNS_SERVICE = "_hue._tcp.local"
+SSDP_ADDRESS = ("239.255.255.250", 1900)
+
+SEARCH_TIMEOUT = 3.0
+PROBE_TIMEOUT = 2.0
+PROBE_CONCURRENCY = 64
+CACHE_TTL = 24 * 60 * 60
+
+DNS_TYPE_PTR = 12
+DNS_TYPE_TXT = 16
+DNS_CLASS_IN = 1
+DNS_UNICAST_RESPONSE = 0x8000
+
+
+class DiscoveredBridge(BaseModel):
+    """A Hue Bridge that was found on the network."""
+
+    id: str  # noqa: A003
+    host: str
+    source: str
+
+
+class DiscoveryCache(BaseModel):
+    """The bridges found by a previous discovery."""
+
+    timestamp: float
+    bridges: List[DiscoveredBridge]
+
+
+class _DatagramCollector(asyncio.DatagramProtocol):
+    """Collect the datagrams that are received, along with their sender."""
+
+    def __init__(self) -> None:
+        self.datagrams: List[Tuple[bytes, str]] = []
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.datagrams.append((data, addr[0]))
+
+
+async def _query_udp(
+    message: bytes,
+    address: Tuple[str, int],
+    timeout: float,
+) -> List[Tuple[bytes, str]]:
+    """Send a UDP query and collect the responses until the timeout."""
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        _DatagramCollector,
+        local_addr=("0.0.0.0", 0),  # noqa: S104
+    )
+    try:
+        transport.sendto(message, address)
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+    return protocol.datagrams
+
+
+def build_mdns_query(service: str = MDNS_SERVICE) -> bytes:
+    """
+    Build an mDNS query for the instances of a service.
+
+    The query is sent from an ephemeral port, so responders will reply to
+    us directly rather than to the multicast group.
+    """
+    header = struct.pack("!HHHHHH", 0, 0, 1, 0, 0, 0)
+    name = b"".join(
+        bytes([len(label)]) + label.encode() for label in service.split(".")
+    )
+    question = struct.pack("!HH", DNS_TYPE_PTR, DNS_CLASS_IN | DNS_UNICAST_RESPONSE)
+    return header + name + b"\x00" + question
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    """Get the offset of the end of a DNS name."""
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            # Compressed names end with a pointer
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def parse_mdns_properties(data: bytes) -> Dict[str, str]:
+    """
+    Get the TXT properties from an mDNS response.
+
+    Raises ValueError if the response is malformed.
+    """
+    try:
+        _, _, questions, *records = struct.unpack_from("!HHHHHH", data)
+        offset = 12
+        for _ in range(questions):
+            offset = _skip_name(data, offset) + 4
+
+        properties: Dict[str, str] = {}
+        for _ in range(sum(records)):
+            offset = _skip_name(data, offset)
+            record_type, _, _, length = struct.unpack_from("!HHIH", data, offset)
+            offset += 10
+            if offset + length > len(data):
+                raise ValueError("Record is longer than the response")
+            if record_type == DNS_TYPE_TXT:
+                end = offset + length
+                position = offset
+                while position < end:
+                    entry_length = data[position]
+                    entry = data[position + 1 : position + 1 + entry_length]
+                    key, _, value = entry.decode(errors="replace").partition("=")
+                    properties[key.lower()] = value
+                    position += 1 + entry_length
+            offset += length
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Truncated response: {e}") from e
+    return properties
+
+
+async def discover_mdns(
+    *,
+    timeout: float = SEARCH_TIMEOUT,
+    address: Tuple[str, int] = MDNS_ADDRESS,
+) -> List[DiscoveredBridge]:
+    """Discover bridges that advertise the Hue service using mDNS."""
+    bridges = []
+    for data, host in await _query_udp(build_mdns_query(), address, timeout):
+        try:
+            properties = parse_mdns_properties(data)
+        except ValueError as e:
+            LOGGER.debug(f"Ignoring mDNS response from {host}: {e}")
+            continue
+        if "bridgeid" in properties:
+            bridge_id = normalize_bridge_id(properties["bridgeid"])
+            bridges.append(DiscoveredBridge(id=bridge_id, host=host, source="mdns"))
+    return bridges
+
+
+def build_ssdp_search() -> bytes:
+    """Build an SSDP search request."""
+    return (
+        "M-SEARCH * HTTP/1.1\r\n"
+        f"HOST: {SSDP_ADDRESS[0]}:{SSDP_ADDRESS[1]}\r\n"
+        'MAN: "ssdp:discover"\r\n'
+        "MX: 2\r\n"
+        "ST: ssdp:all\r\n"
+        "\r\n"
+    ).encode()
+
+
+def parse_ssdp_headers(data: bytes) -> Dict[str, str]:
+    """Get the headers from an SSDP response."""
+    headers: Dict[str, str] = {}
+    for line in data.decode(errors="replace").splitlines()[1:]:
+        key, sep, value = line.partition(":")
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+async def discover_ssdp(
+    *,
+    timeout: float = SEARCH_TIMEOUT,
+    address: Tuple[str, int] = SSDP_ADDRESS,
+) -> List[DiscoveredBridge]:
+    """Discover bridges that respond to an SSDP search."""
+    bridges = []
+    for data, host in await _query_udp(build_ssdp_search(), address, timeout):
+        headers = parse_ssdp_headers(data)
+        if "hue-bridgeid" in headers:
+            bridge_id = normalize_bridge_id(headers["hue-bridgeid"])
+            bridges.append(DiscoveredBridge(id=bridge_id, host=host, source="ssdp"))
+    return bridges
+
+
+async def discover_nupnp(
+    session: aiohttp.ClientSession,
+    *,
+    timeout: float = SEARCH_TIMEOUT,
+) -> List[DiscoveredBridge]:
+    """Discover bridges using the N-UPnP service of Philips."""
+    async with session.get(
+        URL_NUPNP,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as res:
+        items = await res.json()
+    return [
+        DiscoveredBridge(
+            id=normalize_bridge_id(item["id"]),
+            host=item["internalipaddress"],
+            source="nupnp",
+        )
+        for item in items
+    ]
+
+
+async def probe_host(
+    session: aiohttp.ClientSession,
+    host: str,
+    *,
+    port: int = 80,
+    source: str = "probe",
+) -> Optional[DiscoveredBridge]:
+    """Check whether a host is a bridge, using its unauthenticated config."""
+    try:
+        async with session.get(
+            f"http://{host}:{port}/api/config",
+            timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT),
+        ) as res:
+            config = await res.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return None
+
+    if not isinstance(config, dict) or "bridgeid" not in config:
+        return None
+    bridge_id = normalize_bridge_id(config["bridgeid"])
+    return DiscoveredBridge(id=bridge_id, host=host, source=source)
+
+
+async def probe_subnet(
+    session: aiohttp.ClientSession,
+    subnet: str,
+    *,
+    port: int = 80,
+    concurrency: int = PROBE_CONCURRENCY,
+) -> List[DiscoveredBridge]:
+    """Probe every host in a subnet, a limited number at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(host: str) -> Optional[DiscoveredBridge]:
+        async with semaphore:
+            return await probe_host(session, host, port=port)
+
+    hosts = ipaddress.ip_network(subnet, strict=False).hosts()
+    results = await asyncio.gather(*(probe(str(host)) for host in hosts))
+    return [bridge for bridge in results if bridge is not None]
+
+
+def default_cache_file() -> Path:
+    """Get the path of the discovery cache."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(cache_home) / "hue2mqtt" / "bridges.json"
+
+
+def load_cache(
+    cache_file: Path,
+    *,
+    ttl: float = CACHE_TTL,
+) -> Optional[List[DiscoveredBridge]]:
+    """Load the cached bridges, if the cache exists and has not expired."""
+    try:
+        cache = DiscoveryCache.parse_file(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - cache.timestamp > ttl:
+        return None
+    return cache.bridges
+
+
+def save_cache(cache_file: Path, bridges: List[DiscoveredBridge]) -> None:
+    """Save the bridges to the cache."""
+    cache = DiscoveryCache(timestamp=time.time(), bridges=bridges)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(cache.json())
+    except OSError as e:
+        LOGGER.warning(f"Unable to save discovery cache: {e}")
+
+
+async def _verify_cache(
+    session: aiohttp.ClientSession,
+    bridges: List[DiscoveredBridge],
+    port: int,
+) -> bool:
+    """Check that the cached bridges still respond at the same address."""
+    found = await asyncio.gather(
+        *(probe_host(session, bridge.host, port=port) for bridge in bridges),
+    )
+    return all(
+        probe is not None and probe.id == bridge.id
+        for probe, bridge in zip(found, bridges)
+    )
+
+
+async def discover_bridges(
+    session: aiohttp.ClientSession,
+    *,
+    subnet: Optional[str] = None,
+    bridge_id: Optional[str] = None,
+    cache_file: Optional[Path] = None,
+    refresh: bool = False,
+    timeout: float = SEARCH_TIMEOUT,
+    probe_port: int = 80,
+) -> List[DiscoveredBridge]:
+    """
+    Find the Hue Bridges on the network.
+
+    The cached bridges are used if they still respond at the same address,
+    and include the bridge ID if one is given. Otherwise mDNS, SSDP, N-UPnP
+    and, if a subnet is given, a probe of the subnet are run in parallel.
+    Bridges found by several methods are only included once.
+
+    Raises ValueError if the subnet is invalid.
+    """
+    if cache_file is None:
+        cache_file = default_cache_file()
+    if subnet is not None:
+        # Errors from the searches are ignored, so check the subnet first
+        ipaddress.ip_network(subnet, strict=False)
+
+    if not refresh:
+        cached = load_cache(cache_file)
+        if (
+            cached
+            and (bridge_id is None or any(bridge.id == bridge_id for bridge in cached))
+            and await _verify_cache(session, cached, probe_port)
+        ):
+            LOGGER.debug("Using cached bridges")
+            return cached
+
+    searches = [
+        discover_mdns(timeout=timeout),
+        discover_ssdp(timeout=timeout),
+        discover_nupnp(session, timeout=timeout),
+    ]
+    if subnet is not None:
+        searches.append(probe_subnet(session, subnet, port=probe_port))
+
+    bridges: Dict[str, DiscoveredBridge] = {}
+    for result in await asyncio.gather(*searches, return_exceptions=True):
+        if isinstance(result, BaseException):
+            LOGGER.debug(f"Discovery method failed: {result!r}")
+            continue
+        for bridge in result:
+            bridges.setdefault(bridge.id, bridge)
+
+    found = sorted(bridges.values(), key=lambda bridge: bridge.id)
+    if found:
+        save_cache(cache_file, found)
+    return found
+
+
+async def discover_bridge(
+    *,
+    bridge_id: Optional[str] = None,
+    subnet: Optional[str] = None,
+    refresh: bool = False,
+) -> None:
     """Discover Hue Bridge and get username."""
     print("Searching for local bridges.")
 
+    selected_id = None if bridge_id is None else normalize_bridge_id(bridge_id)
+
     async with aiohttp.ClientSession() as session:
-        bridges = await discover_nupnp(session)
+        try:
+            bridges = await discover_bridges(
+                session,
+                subnet=subnet,
+                bridge_id=selected_id,
+                refresh=refresh,
+            )
+        except ValueError as e:
+            print(f"Error: invalid subnet: {e}")
+            sys.exit(1)
+        if selected_id is not None:
+            bridges = [bridge for bridge in bridges if bridge.id == selected_id]
 
-        if len(bridges) != 1:
-            print(f"Error: expected to find exactly 1 bridge, found {len(bridges)}")
+        if len(bridges) == 0:
+            print("Error: unable to find a bridge")
+            sys.exit(1)
+        elif len(bridges) > 1:
+            print("Found multiple bridges, please select one using --bridge-id:")
+            for bridge in bridges:
+                print(f"  {bridge.id} at {bridge.host}")
             sys.exit(1)
         else:
-            bridge = bridges[0]
-            print("Found bridge at", bridge.host)
+            found = bridges[0]
+            print("Found bridge at", found.host)
+            bridge = Bridge(found.host, session, bridge_id=found.id)
             try:
                 await bridge.create_user("hue2mqtt")
                 print("Your username is", bridge.username)
@@ -0,0 +1,251 @@
+"""
+Local Effects.
+
+Effects such as long fades, breathing and colour loops are broken down into
+keyframes. The bridge transitions natively between keyframes, so only a few
+commands are needed, and keyframes are spaced out so that an effect uses no
+more than its share of the command budget of the bridge.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+)
+
+from .messages import EffectRequest
+from .schema import GroupInfo, LightBaseState, LightInfo
+
+LOGGER = logging.getLogger(__name__)
+
+# The longest transition that the bridge supports, in deciseconds.
+MAX_TRANSITIONTIME = 65535
+
+HUE_RANGE = 65536
+
+
+class Keyframe(NamedTuple):
+    """A command to send to a light or group, at an offset from the start."""
+
+    offset: float
+    kind: str
+    id: int  # noqa: A003
+    command: Dict[str, Any]
+
+
+def _interpolate(start: Any, end: Any, fraction: float) -> Any:
+    """Interpolate between two values, or pairs of values."""
+    if start is None:
+        return end
+    if isinstance(end, tuple):
+        return tuple(_interpolate(a, b, fraction) for a, b in zip(start, end))
+    value = start + (end - start) * fraction
+    return round(value) if isinstance(end, int) else value
+
+
+def fade(
+    request: EffectRequest,
+    kind: str,
+    target_id: int,
+    start: Optional[LightBaseState],
+) -> Iterator[Keyframe]:
+    """
+    Fade to a brightness or colour.
+
+    Fades that are longer than the bridge supports are split into segments.
+    If the starting state is unknown, each segment fades to the target.
+    """
+    segments = math.ceil(request.duration * 10 / MAX_TRANSITIONTIME)
+    segment = request.duration / segments
+    targets = {
+        field: getattr(request, field)
+        for field in ("bri", "ct", "xy")
+        if getattr(request, field) is not None
+    }
+    for i in range(segments):
+        command: Dict[str, Any] = {"transitiontime": round(segment * 10)}
+        if i == 0:
+            command["on"] = True
+        for field, value in targets.items():
+            initial = None if start is None else getattr(start, field)
+            command[field] = _interpolate(initial, value, (i + 1) / segments)
+        yield Keyframe(i * segment, kind, target_id, command)
+
+
+def breathe(
+    request: EffectRequest,
+    kind: str,
+    target_id: int,
+    interval: float,
+) -> Iterator[Keyframe]:
+    """Alternate between the maximum and minimum brightness."""
+    half_period = max(request.period / 2, interval)
+    transitiontime = round(half_period * 10)
+    for i in range(max(int(request.duration / half_period), 1)):
+        bri = request.max_bri if i % 2 == 0 else request.min_bri
+        command: Dict[str, Any] = {"bri": bri, "transitiontime": transitiontime}
+        if i == 0:
+            command["on"] = True
+        yield Keyframe(i * half_period, kind, target_id, command)
+
+
+def colorloop(
+    request: EffectRequest,
+    light_ids: List[int],
+    interval: float,
+) -> Iterator[Keyframe]:
+    """
+    Cycle through the colour wheel, with the lights spread around it.
+
+    The commands to each light are staggered across the interval, so that
+    they are not all sent at once. The hue is incremented rather than set,
+    so that the bridge wraps around the colour wheel.
+    """
+    period = max(request.period, interval)
+    hue_inc = min(round(HUE_RANGE * interval / period), HUE_RANGE - 2)
+    transitiontime = round(interval * 10)
+    for step in range(max(math.ceil(request.duration / interval), 1)):
+        for i, light_id in enumerate(light_ids):
+            offset = (step + i / len(light_ids)) * interval
+            if step == 0:
+                command: Dict[str, Any] = {
+                    "on": True,
+                    "hue": HUE_RANGE * i // len(light_ids),
+                    "sat": request.sat,
+                    "transitiontime": transitiontime,
+                }
+            else:
+                command = {"hue_inc": hue_inc, "transitiontime": transitiontime}
+            yield Keyframe(offset, "light", light_id, command)
+
+
+def plan_effect(
+    request: EffectRequest,
+    *,
+    lights: List[LightInfo],
+    group: Optional[GroupInfo],
+    light_interval: float,
+    group_interval: float,
+    min_interval: float,
+) -> Iterator[Keyframe]:
+    """
+    Plan the keyframes of an effect on a light, or on the lights of a group.
+
+    Effects that set every light to the same state use group actions. The
+    intervals are the shortest time between commands that stays within the
+    budget for light commands and group actions respectively.
+
+    Raises ValueError if the effect cannot be run.
+    """
+    if request.duration <= 0:
+        raise ValueError("Duration must be positive")
+    if not lights:
+        raise ValueError("No known lights to run the effect on")
+
+    if request.effect == "colorloop":
+        interval = max(min_interval, light_interval * len(lights))
+        return colorloop(request, [light.id for light in lights], interval)
+
+    start: Optional[LightBaseState]
+    if group is not None:
+        kind, target_id, start = "group", group.id, group.action
+        interval = max(min_interval, group_interval)
+    else:
+        kind, target_id, start = "light", lights[0].id, lights[0].state
+        interval = max(min_interval, light_interval)
+
+    if request.effect == "fade":
+        if request.bri is None and request.ct is None and request.xy is None:
+            raise ValueError("A fade needs a target bri, ct or xy")
+        return fade(request, kind, target_id, start)
+    return breathe(request, kind, target_id, interval)
+
+
+class EffectScheduler:
+    """
+    Runs effects, with at most one effect on each light.
+
+    Starting an effect cancels any other effects on the same lights.
+    """
+
+    def __init__(self, send: Callable[[Keyframe], Awaitable[None]]) -> None:
+        self._send = send
+        self._effects: Dict[asyncio.Task[None], FrozenSet[int]] = {}
+
+    @property
+    def running(self) -> List[FrozenSet[int]]:
+        """The lights of each effect that is running."""
+        return list(self._effects.values())
+
+    def start(self, light_ids: Iterable[int], keyframes: Iterable[Keyframe]) -> None:
+        """Start an effect on some lights."""
+        lights = frozenset(light_ids)
+        self.cancel(lights)
+        task = asyncio.ensure_future(self._run(keyframes))
+        self._effects[task] = lights
+        task.add_done_callback(lambda task: self._effects.pop(task, None))
+
+    def cancel(self, light_ids: Iterable[int]) -> int:
+        """
+        Cancel the effects on any of the given lights.
+
+        Returns the number of effects that were cancelled.
+        """
+        lights = set(light_ids)
+        cancelled = 0
+        for task, effect_lights in list(self._effects.items()):
+            if effect_lights & lights:
+                task.cancel()
+                del self._effects[task]
+                cancelled += 1
+        return cancelled
+
+    def cancel_all(self) -> None:
+        """Cancel every effect."""
+        for task in self._effects:
+            task.cancel()
+        self._effects.clear()
+
+    async def _run(self, keyframes: Iterable[Keyframe]) -> None:
+        """
+        Send each keyframe at its offset from the start of the effect.
+
+        Keyframes are sent without waiting for the previous one to be
+        acknowledged by the bridge, so that slow requests do not delay them.
+        """
+        start = time.monotonic()
+        sending: Set[asyncio.Task[None]] = set()
+        try:
+            for keyframe in keyframes:
+                delay = start + keyframe.offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.ensure_future(self._send(keyframe))
+                sending.add(task)
+                task.add_done_callback(self._sent)
+                task.add_done_callback(sending.discard)
+            if sending:
+                await asyncio.wait(sending)
+        finally:
+            for task in sending:
+                task.cancel()
+
+    def _sent(self, task: "asyncio.Task[None]") -> None:
+        """Log a keyframe that could not be sent."""
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.warning(
+                "Unable to send effect keyframe: %s",
+                task.exception(),
+                extra={"rate_limited": True},
+            )
@@ -0,0 +1,85 @@
+"""
+Entity Filtering.
+
+Entities that nobody is interested in can be excluded, so that they are
+never validated, cached or published, and commands to them are rejected.
+Rules are matched against the raw data from the bridge, before any models
+are built, and the decision for each entity is cached.
+"""
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from .config import FilterRule, FiltersInfo
+
+
+def matches(
+    rule: FilterRule,
+    entity_type: str,
+    raw: Dict[str, Any],
+    rooms: Set[str],
+) -> bool:
+    """Determine whether an entity matches every field that is set in a rule."""
+    if rule.entity_type is not None and rule.entity_type != entity_type:
+        return False
+    if rule.type is not None and raw.get("type") != rule.type:
+        return False
+    if rule.model is not None and raw.get("modelid") != rule.model:
+        return False
+    if rule.name is not None and not fnmatchcase(str(raw.get("name", "")), rule.name):
+        return False
+    return rule.room is None or rule.room in rooms
+
+
+class EntityFilter:
+    """
+    Decides which entities are processed.
+
+    An entity is excluded if it matches any exclude rule. If there are any
+    include rules, it must also match one of them.
+    """
+
+    def __init__(self, settings: FiltersInfo) -> None:
+        self.settings = settings
+        self._enabled = bool(settings.include or settings.exclude)
+        self._rooms: Dict[Tuple[str, str], Set[str]] = {}
+        self._decisions: Dict[Tuple[str, str], bool] = {}
+
+    def update_rooms(self, groups: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Update the rooms that each light and sensor is in.
+
+        The cached decisions are cleared, as entities may have been moved
+        or renamed.
+        """
+        rooms: Dict[Tuple[str, str], Set[str]] = {}
+        for idx, raw in groups:
+            if raw.get("type") != "Room":
+                continue
+            name = raw["name"]
+            rooms.setdefault(("group", idx), set()).add(name)
+            for entity_type, ids in (("light", "lights"), ("sensor", "sensors")):
+                for entity_id in raw.get(ids, []):
+                    rooms.setdefault((entity_type, str(entity_id)), set()).add(name)
+        self._rooms = rooms
+        self._decisions.clear()
+
+    def allows(self, entity_type: str, entity_id: str, raw: Dict[str, Any]) -> bool:
+        """Determine whether an entity should be processed."""
+        if not self._enabled:
+            return True
+
+        key = (entity_type, str(entity_id))
+        decision = self._decisions.get(key)
+        if decision is None:
+            rooms = self._rooms.get(key, set())
+            decision = not any(
+                matches(rule, entity_type, raw, rooms) for rule in self.settings.exclude
+            ) and (
+                not self.settings.include
+                or any(
+                    matches(rule, entity_type, raw, rooms)
+                    for rule in self.settings.include
+                )
+            )
+            self._decisions[key] = decision
+        return decision
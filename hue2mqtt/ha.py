@@ -0,0 +1,106 @@
+"""
+High Availability.
+
+Several instances of Hue2MQTT can run against the same bridge. Commands
+are spread across them with MQTT shared subscriptions, whilst a leader is
+elected to publish state.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Match, Optional
+
+from pydantic import ValidationError, parse_obj_as
+
+from .config import HAInfo
+from .messages import HALeader
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Lease based leader election using retained MQTT messages.
+
+    The leader periodically publishes its instance ID as a heartbeat. If no
+    heartbeat is seen within the lease timeout, another instance claims the
+    leadership. If several instances claim it at once, the lowest ID wins.
+
+    A leader that exits cleanly resigns, so that another instance can take
+    over without waiting for the lease to expire.
+    """
+
+    def __init__(
+        self,
+        instance_id: str,
+        settings: HAInfo,
+        *,
+        publish: Callable[[HALeader], Awaitable[None]],
+        on_change: Callable[[bool], Awaitable[None]],
+    ) -> None:
+        self.instance_id = instance_id
+        self.settings = settings
+        self._publish = publish
+        self._on_change = on_change
+
+        self.leader: Optional[str] = None
+        # Wait for a full lease before claiming, to hear from any existing leader.
+        self._last_heartbeat = time.monotonic()
+
+    @property
+    def is_leader(self) -> bool:
+        """Determine if this instance is the leader."""
+        return self.leader == self.instance_id
+
+    async def _set_leader(self, leader: Optional[str]) -> None:
+        was_leader = self.is_leader
+        self.leader = leader
+        if was_leader != self.is_leader:
+            LOGGER.info(f"Leader is now {leader}")
+            await self._on_change(self.is_leader)
+
+    async def handle_leader(self, match: Match[str], payload: str) -> None:
+        """Handle a heartbeat from the leader."""
+        try:
+            message = parse_obj_as(HALeader, json.loads(payload))
+        except (json.JSONDecodeError, ValidationError) as e:
+            LOGGER.warning(f"Invalid leader message: {e}")
+            return
+
+        if message.instance == self.instance_id:
+            return
+
+        if self.is_leader:
+            # Another instance claimed the leadership at the same time.
+            if message.instance is not None and message.instance < self.instance_id:
+                await self._set_leader(message.instance)
+                self._last_heartbeat = time.monotonic()
+            return
+
+        self.leader = message.instance
+        if message.instance is None:
+            self._last_heartbeat = float("-inf")
+        else:
+            self._last_heartbeat = time.monotonic()
+
+    async def tick(self) -> None:
+        """Send a heartbeat if leader, otherwise claim the leadership if it has lapsed."""
+        if self.is_leader:
+            await self._publish(HALeader(instance=self.instance_id))
+        elif time.monotonic() - self._last_heartbeat > self.settings.lease_timeout:
+            LOGGER.info("Leader lease has expired, claiming leadership")
+            await self._publish(HALeader(instance=self.instance_id))
+            await self._set_leader(self.instance_id)
+
+    async def run(self) -> None:
+        """Take part in the election until cancelled."""
+        while True:
+            await self.tick()
+            await asyncio.sleep(self.settings.heartbeat_interval)
+
+    async def resign(self) -> None:
+        """Give up the leadership, if held."""
+        if self.is_leader:
+            await self._publish(HALeader(instance=None))
+            await self._set_leader(None)
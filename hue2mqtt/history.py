@@ -0,0 +1,195 @@
+"""
+Sensor History.
+
+Recent readings of each sensor are kept in fixed-size ring buffers, along
+with rollups of the readings at coarser resolutions, so that questions such
+as "how much motion was there in the last hour" can be answered without an
+external database. Memory use is bounded by the size of the buffers, no
+matter how long hue2mqtt has been running.
+"""
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .config import HistoryInfo
+from .messages import HistoryBucket, HistoryQuery, HistorySample, SensorHistoryReport
+from .schema import SensorInfo
+
+# The fields of the sensor state that are recorded.
+FIELDS = ("presence", "lightlevel", "temperature", "buttonevent")
+
+
+def is_new_reading(old_sensor: Optional[SensorInfo], sensor: SensorInfo) -> bool:
+    """
+    Determine whether a sensor has a reading that has not been recorded.
+
+    Changes to other parts of the sensor, such as its battery level, are
+    not readings. Repeated button presses have the same value, but are
+    updated at a different time.
+    """
+    if old_sensor is None:
+        return True
+    old_state, state = old_sensor.dict()["state"], sensor.dict()["state"]
+    return old_state.get("lastupdated") != state.get("lastupdated") or any(
+        old_state.get(field) != state.get(field) for field in FIELDS
+    )
+
+
+class Bucket:
+    """A rollup of the readings within a period of time."""
+
+    __slots__ = ("start", "count", "min", "max", "total")
+
+    def __init__(self, start: float, value: float) -> None:
+        self.start = start
+        self.count = 1
+        self.min = value
+        self.max = value
+        self.total = value
+
+    @classmethod
+    def restore(cls, saved: List[float]) -> "Bucket":
+        """Restore a rollup that was saved."""
+        start, count, low, high, total = saved
+        bucket = cls(start, total)
+        bucket.count, bucket.min, bucket.max = int(count), low, high
+        return bucket
+
+    def save(self) -> List[float]:
+        """Get the rollup, so that it can be saved."""
+        return [self.start, self.count, self.min, self.max, self.total]
+
+    def add(self, value: float) -> None:
+        """Add a reading to the rollup."""
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.total += value
+
+
+class FieldHistory:
+    """The recent readings of one field of a sensor, and their rollups."""
+
+    def __init__(self, samples: int, resolutions: List[int], buckets: int) -> None:
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=samples)
+        self.rollups: Dict[int, Deque[Bucket]] = {
+            resolution: deque(maxlen=buckets) for resolution in resolutions
+        }
+
+    def record(self, timestamp: float, value: float) -> None:
+        """Record a reading."""
+        self.samples.append((timestamp, value))
+        for resolution, rollup in self.rollups.items():
+            start = timestamp - timestamp % resolution
+            if rollup and rollup[-1].start >= start:
+                rollup[-1].add(value)
+            else:
+                rollup.append(Bucket(start, value))
+
+
+class SensorHistory:
+    """The recent readings of every sensor."""
+
+    def __init__(self, settings: HistoryInfo) -> None:
+        self.settings = settings
+        self._sensors: Dict[str, Dict[str, FieldHistory]] = {}
+
+    def _field(self, uniqueid: str, field: str) -> FieldHistory:
+        """Get the history of a field of a sensor, creating it if needed."""
+        fields = self._sensors.setdefault(uniqueid, {})
+        if field not in fields:
+            fields[field] = FieldHistory(
+                self.settings.samples,
+                self.settings.resolutions,
+                self.settings.buckets,
+            )
+        return fields[field]
+
+    def record(self, sensor: SensorInfo, timestamp: Optional[float] = None) -> None:
+        """Record the readings of a sensor."""
+        if timestamp is None:
+            timestamp = time.time()
+        state = sensor.dict()["state"]
+        for field in FIELDS:
+            value = state.get(field)
+            if value is not None:
+                self._field(sensor.uniqueid, field).record(timestamp, float(value))
+
+    def query(
+        self,
+        uniqueid: str,
+        query: HistoryQuery,
+        now: Optional[float] = None,
+    ) -> SensorHistoryReport:
+        """
+        Get the readings of a sensor, or their rollups at a resolution.
+
+        Raises KeyError if there are no readings of the field, and ValueError
+        if the resolution is not recorded.
+        """
+        history = self._sensors[uniqueid][query.field]
+        since = float("-inf")
+        if query.since is not None:
+            since = (time.time() if now is None else now) - query.since
+
+        report = SensorHistoryReport(uniqueid=uniqueid, field=query.field)
+        if query.resolution is None:
+            report.samples = [
+                HistorySample(time=timestamp, value=value)
+                for timestamp, value in history.samples
+                if timestamp >= since
+            ]
+            return report
+
+        if query.resolution not in history.rollups:
+            raise ValueError(f"Resolution {query.resolution}s is not recorded")
+        report.rollups = [
+            HistoryBucket(
+                start=bucket.start,
+                count=bucket.count,
+                min=bucket.min,
+                max=bucket.max,
+                mean=bucket.total / bucket.count,
+            )
+            for bucket in history.rollups[query.resolution]
+            if bucket.start + query.resolution > since
+        ]
+        return report
+
+    def save(self, path: Path) -> None:
+        """Save the readings to a file."""
+        data = {
+            uniqueid: {
+                field: {
+                    "samples": list(history.samples),
+                    "rollups": {
+                        str(resolution): [bucket.save() for bucket in rollup]
+                        for resolution, rollup in history.rollups.items()
+                    },
+                }
+                for field, history in fields.items()
+            }
+            for uniqueid, fields in self._sensors.items()
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data))
+
+    def load(self, path: Path) -> None:
+        """
+        Load readings that were saved to a file.
+
+        Rollups at resolutions that are no longer recorded are discarded, and
+        the buffers are truncated if they are now smaller.
+        """
+        data: Dict[str, Dict[str, Any]] = json.loads(path.read_text())
+        for uniqueid, fields in data.items():
+            for field, saved in fields.items():
+                history = self._field(uniqueid, field)
+                history.samples.extend((t, v) for t, v in saved["samples"])
+                for resolution, buckets in saved["rollups"].items():
+                    rollup = history.rollups.get(int(resolution))
+                    if rollup is None:
+                        continue
+                    rollup.extend(Bucket.restore(bucket) for bucket in buckets)
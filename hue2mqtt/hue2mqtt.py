@@ -8,38 +8,94 @@ and managing the event loop.
 import asyncio
 import json
 import logging
+import random
 import signal
+import socket
 import sys
+import time
+from functools import partial
+from pathlib import Path
 from signal import SIGHUP, SIGINT, SIGTERM
 from types import FrameType
-from typing import Match, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Match,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
 import aiohue
 from aiohttp.client import ClientSession
-from pydantic import ValidationError, parse_obj_as
+from aiohttp.client_exceptions import ClientError
+from gmqtt.mqtt.handler import MQTTConnectError
+from pydantic import BaseModel, ValidationError, parse_obj_as
 
 from hue2mqtt import __version__
-from hue2mqtt.messages import BridgeInfo, Hue2MQTTStatus
+from hue2mqtt.messages import (
+    BridgeInfo,
+    EffectRequest,
+    GroupList,
+    HAEffectsCancelled,
+    HALeader,
+    HistoryQuery,
+    Hue2MQTTStatus,
+    LightList,
+    QueryError,
+    SceneCapture,
+    SceneList,
+    SceneRecall,
+    SensorList,
+    StateQuery,
+)
 from hue2mqtt.schema import (
     GroupInfo,
     GroupSetState,
     LightInfo,
     LightSetState,
+    LightState,
     SensorInfo,
 )
 
+from .clip import (
+    apply_group_update,
+    apply_light_update,
+    apply_sensor_update,
+    fetch_resources,
+    index_buttons,
+    parse_id_v1,
+    stream_updates,
+)
 from .config import Hue2MQTTConfig
-from .mqtt.wrapper import MQTTWrapper
+from .effects import EffectScheduler, Keyframe, plan_effect
+from .filters import EntityFilter
+from .ha import LeaderElection
+from .history import SensorHistory, is_new_reading
+from .lanes import COMMAND, STATE, STATUS, LaneScheduler
+from .log import configure_logging
+from .metrics import Metrics
+from .mqtt.wrapper import MQTTWrapper, PublishHandle
+from .pacing import Pacer
+from .runtime import Offloader, build_models
+from .scenes import RecallPlan, SceneStore, capture_state, plan_recall
+from .state import StateCache
+from .suppression import PendingCommands, remove_redundant
+from .validation import get_validator
 
 LOGGER = logging.getLogger(__name__)
 
-loop = asyncio.get_event_loop()
-
 
 class Hue2MQTT:
     """Hue to MQTT Bridge."""
 
     config: Hue2MQTTConfig
+    _bridge: aiohue.Bridge
 
     def __init__(
         self,
@@ -50,23 +106,52 @@ class Hue2MQTT:
     ) -> None:
         self.config = Hue2MQTTConfig.load(config_file)
         self.name = name
+        self._config_file = config_file
+        self._state = StateCache()
+        self._metrics = Metrics()
+        self._lanes = LaneScheduler(self.config.lanes, self._metrics)
+        self._offloader = Offloader(self.config.runtime)
+        self._scenes = SceneStore(self.config.scenes.definitions)
+        self._light_pacer = Pacer(self.config.scenes.light_interval)
+        self._group_pacer = Pacer(self.config.scenes.group_interval)
+        self._effects = EffectScheduler(self._send_keyframe)
+        self._pending = PendingCommands(self.config.commands.pending_timeout)
+        self._effect_light_pacer = Pacer(0)
+        self._effect_group_pacer = Pacer(0)
+        self._update_effect_budget()
+        self._history = SensorHistory(self.config.history)
+        self._filter = EntityFilter(self.config.filters)
+        self._tasks: List[asyncio.Task[None]] = []
+        self._running = False
+        self._status_online = False
+        self._event_stream: Optional[asyncio.Task[None]] = None
+        self._initial_pending: Set[Tuple[str, str]] = set()
 
         self._setup_logging(verbose)
+        self._load_history()
         self._setup_event_loop()
+        self._setup_ha()
         self._setup_mqtt()
 
     def _setup_logging(self, verbose: bool, *, welcome_message: bool = True) -> None:
+        settings = self.config.logging
         if verbose:
-            logging.basicConfig(
+            configure_logging(
                 level=logging.DEBUG,
-                format=f"%(asctime)s {self.name} %(name)s %(levelname)s %(message)s",
+                fmt=f"%(asctime)s {self.name} %(name)s %(levelname)s %(message)s",
                 datefmt="%Y-%m-%d %H:%M:%S",
+                structured=settings.structured,
+                background=settings.background,
+                rate_limit_interval=settings.rate_limit_interval,
             )
         else:
-            logging.basicConfig(
+            configure_logging(
                 level=logging.INFO,
-                format=f"%(asctime)s {self.name} %(levelname)s %(message)s",
+                fmt=f"%(asctime)s {self.name} %(levelname)s %(message)s",
                 datefmt="%Y-%m-%d %H:%M:%S",
+                structured=settings.structured,
+                background=settings.background,
+                rate_limit_interval=settings.rate_limit_interval,
             )
 
             # Suppress INFO messages from gmqtt
@@ -75,20 +160,147 @@ class Hue2MQTT:
         if welcome_message:
             LOGGER.info(f"Hue2MQTT v{__version__} - {self.__doc__}")
 
+    def _load_history(self) -> None:
+        """Load the sensor history that was saved at the last shutdown."""
+        save_file = self.config.history.save_file
+        if not self.config.history.enabled or save_file is None:
+            return
+        try:
+            self._history.load(Path(save_file))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.warning(f"Unable to load sensor history: {e}")
+
+    def _save_history(self) -> None:
+        """Save the sensor history, so that it can be loaded at the next startup."""
+        save_file = self.config.history.save_file
+        if not self.config.history.enabled or save_file is None:
+            return
+        try:
+            self._history.save(Path(save_file))
+        except OSError as e:
+            LOGGER.warning(f"Unable to save sensor history: {e}")
+
     def _setup_event_loop(self) -> None:
-        loop.add_signal_handler(SIGHUP, self.halt)
+        loop = asyncio.get_event_loop()
+        loop.add_signal_handler(SIGHUP, self.reload)
         loop.add_signal_handler(SIGINT, self.halt)
         loop.add_signal_handler(SIGTERM, self.halt)
 
+    def _setup_ha(self) -> None:
+        self._election: Optional[LeaderElection] = None
+        if self.config.ha.enabled:
+            instance_id = self.config.ha.instance_id or socket.gethostname()
+            LOGGER.info(f"High availability enabled, instance ID: {instance_id}")
+            self._election = LeaderElection(
+                instance_id,
+                self.config.ha,
+                publish=self._publish_leader,
+                on_change=self._handle_leader_change,
+            )
+
     def _setup_mqtt(self) -> None:
+        self._entity_topics: Dict[Tuple[str, object], PublishHandle] = {}
+
+        client_name = self.name
+        share_group = None
+        if self._election is not None:
+            # Each instance needs a distinct client ID
+            client_name = f"{self.name}-{self._election.instance_id}"
+            share_group = self.config.ha.share_group
+
         self._mqtt = MQTTWrapper(
-            self.name,
+            client_name,
             self.config.mqtt,
             last_will=Hue2MQTTStatus(online=False),
         )
 
-        self._mqtt.subscribe("light/+/set", self.handle_set_light)
-        self._mqtt.subscribe("group/+/set", self.handle_set_group)
+        commands = {
+            "light/+/set": self.handle_set_light,
+            "group/+/set": self.handle_set_group,
+            "room/+/set": self.handle_set_room,
+            "light/by-name/+/set": self.handle_set_light_by_name,
+            "light/by-type/+/set": self.handle_set_light_by_type,
+            "scene/+/set": self.handle_set_scene,
+        }
+        for topic, command_handler in commands.items():
+            self._mqtt.subscribe(
+                topic,
+                self._lanes.prioritise(COMMAND, command_handler),
+                share_group=share_group,
+            )
+
+        # Every instance keeps its own scenes and effects, and so receives these
+        broadcasts = {
+            "scene/+/capture": self.handle_capture_scene,
+            "light/+/effect": self.handle_light_effect,
+            "group/+/effect": self.handle_group_effect,
+        }
+        for topic, command_handler in broadcasts.items():
+            self._mqtt.subscribe(topic, self._lanes.prioritise(COMMAND, command_handler))
+
+        requests = {
+            "get/light/+": self.handle_get_light,
+            "get/lights": self.handle_get_lights,
+            "get/group/+": self.handle_get_group,
+            "get/groups": self.handle_get_groups,
+            "get/sensor/+": self.handle_get_sensor,
+            "get/sensors": self.handle_get_sensors,
+            "get/history/+": self.handle_get_history,
+            "get/scenes": self.handle_get_scenes,
+            "get/metrics": self.handle_get_metrics,
+        }
+        for topic, handler in requests.items():
+            self._mqtt.subscribe_request(topic, handler, share_group=share_group)
+
+        if self._election is not None:
+            self._mqtt.subscribe("ha/leader", self._election.handle_leader)
+            self._mqtt.subscribe("ha/effects/cancel", self._handle_effects_cancelled)
+            if self.config.mqtt.payload_encoding == "json":
+                self._mqtt.subscribe("status", self._handle_status)
+
+    @property
+    def is_publisher(self) -> bool:
+        """
+        Determine if this instance should publish state.
+
+        Only the leader publishes state when high availability is enabled.
+        """
+        return self._election is None or self._election.is_leader
+
+    async def _publish_leader(self, message: HALeader) -> None:
+        """Publish a leader election message."""
+        self._mqtt.publish("ha/leader", message, retain=True, force_json=True)
+
+        # The status cannot be watched for last wills in binary encodings,
+        # so it is reasserted with each heartbeat instead.
+        if message.instance is not None and self.config.mqtt.payload_encoding != "json":
+            await self._publish_bridge_status()
+
+    async def _handle_status(self, match: Match[str], payload: str) -> None:
+        """
+        Reassert the status if it has been marked as offline by a last will.
+
+        The last will of any instance marks the status as offline, so the
+        leader publishes it again if it should be online.
+        """
+        if not self.is_publisher or not self._status_online:
+            return
+        try:
+            status = parse_obj_as(Hue2MQTTStatus, json.loads(payload))
+        except (json.JSONDecodeError, ValidationError):
+            return
+        if not status.online:
+            self._metrics.increment("ha_status_reasserted")
+            await self._publish_bridge_status()
+
+    async def _handle_leader_change(self, is_leader: bool) -> None:
+        """Take over publishing state when elected leader."""
+        if is_leader:
+            self._metrics.increment("ha_elected")
+            await self._publish_bridge_status()
+            self.republish()
 
     def _exit(self, signals: signal.Signals, frame_type: FrameType) -> None:
         sys.exit(0)
@@ -106,16 +318,202 @@ class Hue2MQTT:
                 self.halt()
                 return
             await self._publish_bridge_status()
-            await self.main(websession)
+            self._start_background_tasks()
+            try:
+                await self.main(websession)
+            finally:
+                self._effects.cancel_all()
+                self._stop_background_tasks()
+                self._save_history()
 
         LOGGER.info("Disconnecting from MQTT Broker")
         await self._publish_bridge_status(online=False)
+        if self._election is not None:
+            await self._election.resign()
         await self._mqtt.disconnect()
+        self._offloader.shutdown()
+
+    def _start_background_tasks(self) -> None:
+        """Start the tasks that run alongside the event stream."""
+        self._running = True
+        if self.config.metrics.enable_publish:
+            self._tasks.append(asyncio.ensure_future(self._publish_metrics_periodically()))
+        if self.config.reconciliation.enabled:
+            self._tasks.append(asyncio.ensure_future(self._reconcile_periodically()))
+        if self._election is not None:
+            self._tasks.append(asyncio.ensure_future(self._election.run()))
+        if self.config.lanes.enabled:
+            self._tasks.append(asyncio.ensure_future(self._lanes.run()))
+        if self.config.runtime.lag_monitor_interval > 0:
+            self._tasks.append(asyncio.ensure_future(self._monitor_loop_lag()))
+
+    def _stop_background_tasks(self) -> None:
+        """Stop the tasks that run alongside the event stream."""
+        self._running = False
+        self._lanes.stop()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
 
     def halt(self) -> None:
         """Stop the component."""
         sys.exit(-1)
 
+    def reload(self) -> None:
+        """Reload the config file without restarting."""
+        asyncio.ensure_future(self._reload())
+
+    async def _reload(self) -> None:
+        """
+        Reload the config file and apply the changes.
+
+        Most settings are read as they are used, and so take effect
+        immediately. The connections to the broker and the bridge are only
+        re-established if their settings have changed.
+        """
+        LOGGER.info("Reloading config")
+        try:
+            config = Hue2MQTTConfig.load(self._config_file)
+        except (OSError, ValueError) as e:
+            LOGGER.error(f"Unable to reload config, keeping current config: {e}")
+            return
+
+        old_config, self.config = self.config, config
+
+        self._lanes.settings = config.lanes
+        self._scenes.load(config.scenes.definitions)
+        self._light_pacer.interval = config.scenes.light_interval
+        self._group_pacer.interval = config.scenes.group_interval
+        self._pending.timeout = config.commands.pending_timeout
+        self._update_effect_budget()
+        if self._election is not None:
+            self._election.settings = config.ha
+        if (config.ha.enabled, config.ha.instance_id) != (
+            old_config.ha.enabled,
+            old_config.ha.instance_id,
+        ):
+            LOGGER.warning("Changes to high availability require a restart")
+        if (config.runtime.loop, config.runtime.executor, config.runtime.workers) != (
+            old_config.runtime.loop,
+            old_config.runtime.executor,
+            old_config.runtime.workers,
+        ):
+            LOGGER.warning("Changes to the event loop or executor require a restart")
+        if config.history != old_config.history:
+            LOGGER.warning("Changes to sensor history require a restart")
+        if config.logging != old_config.logging:
+            LOGGER.warning("Changes to logging require a restart")
+        if config.filters != old_config.filters:
+            await self._apply_filters(EntityFilter(config.filters))
+
+        if config.mqtt != old_config.mqtt:
+            await self._reconnect_mqtt(old_config)
+        if config.hue != old_config.hue:
+            await self._reconnect_bridge(old_config)
+
+        # Restart the background tasks, as some may have been enabled or disabled
+        if self._running:
+            self._stop_background_tasks()
+            self._start_background_tasks()
+
+        LOGGER.info("Reloaded config")
+
+    async def _reconnect_mqtt(self, old_config: Hue2MQTTConfig) -> None:
+        """Reconnect to the broker, reverting to the old settings on failure."""
+        LOGGER.info("MQTT settings have changed, reconnecting to broker")
+        await self._publish_bridge_status(online=False)
+        await self._mqtt.disconnect()
+
+        try:
+            self._setup_mqtt()
+            await self._mqtt.connect()
+        except (OSError, ValueError, MQTTConnectError) as e:
+            LOGGER.error(f"Unable to connect with new MQTT settings, reverting: {e}")
+            self.config.mqtt = old_config.mqtt
+            self._setup_mqtt()
+            try:
+                await self._mqtt.connect()
+            except (OSError, ValueError, MQTTConnectError) as e:
+                LOGGER.error(f"Unable to reconnect with old MQTT settings: {e}")
+                return
+
+        await self._publish_bridge_status()
+        self.republish()
+
+    async def _reconnect_bridge(self, old_config: Hue2MQTTConfig) -> None:
+        """Reconnect to the bridge, reverting to the old settings on failure."""
+        LOGGER.info("Hue settings have changed, reconnecting to bridge")
+        old_bridge = self._bridge
+        try:
+            await self._setup_bridge(old_bridge.websession)
+        except (
+            ClientError,
+            asyncio.TimeoutError,
+            aiohue.errors.AiohueException,
+        ) as e:
+            LOGGER.error(f"Unable to connect with new Hue settings, reverting: {e}")
+            self.config.hue = old_config.hue
+            self._bridge = old_bridge
+            return
+
+        # Effects were sending to the old bridge
+        self._effects.cancel_all()
+        await self._publish_bridge_status()
+        await self.reconcile()
+
+        # Resubscribe to the event stream of the new bridge
+        if self._event_stream is not None:
+            self._event_stream.cancel()
+
+    async def _apply_filters(self, entity_filter: EntityFilter) -> None:
+        """
+        Start using new filters.
+
+        Cached entities that are now filtered are forgotten, and the bridge
+        is reconciled so that entities that are no longer filtered are
+        published.
+        """
+        self._filter = entity_filter
+        groups = self._bridge.groups._items
+        entity_filter.update_rooms((idx, item.raw) for idx, item in groups.items())
+
+        def filtered(entity_type: str, items: Any, entity_id: int) -> bool:
+            item = items.get(str(entity_id))
+            return item is not None and not entity_filter.allows(
+                entity_type,
+                str(entity_id),
+                item.raw,
+            )
+
+        for light in list(self._state.lights.values()):
+            if filtered("light", self._bridge.lights._items, light.id):
+                self._state.remove_light(light.uniqueid)
+        for group in list(self._state.groups.values()):
+            if filtered("group", groups, group.id):
+                self._state.remove_group(group.id)
+        if self._bridge.sensors is not None:
+            for sensor in list(self._state.sensors.values()):
+                if filtered("sensor", self._bridge.sensors._items, sensor.id):
+                    self._state.remove_sensor(sensor.uniqueid)
+
+        try:
+            await self.reconcile()
+        except (
+            ClientError,
+            asyncio.TimeoutError,
+            aiohue.errors.AiohueException,
+        ) as e:
+            LOGGER.warning(f"Unable to fetch entities with the new filters: {e}")
+
+    def republish(self) -> None:
+        """Publish the cached state of every entity."""
+        for light in self._state.lights.values():
+            self.publish_light(light)
+        for group in self._state.groups.values():
+            self.publish_group(group)
+        for sensor in self._state.sensors.values():
+            self.publish_sensor(sensor)
+
     async def _setup_bridge(self, websession: ClientSession) -> None:
         """Connect to the Hue Bridge."""
         self._bridge = aiohue.Bridge(
@@ -126,13 +524,17 @@ class Hue2MQTT:
         LOGGER.info(f"Connecting to Hue Bridge at {self.config.hue.ip}")
         await self._bridge.initialize()
 
+        LOGGER.info(f"Bridge Name: {self._bridge.config.name}")
+        LOGGER.info(f"Bridge MAC: {self._bridge.config.mac}")
+        LOGGER.info(f"API Version: {self._bridge.config.apiversion}")
+
     async def _publish_bridge_status(self, *, online: bool = True) -> None:
         """Publish info about the Hue Bridge."""
-        if online:
-            LOGGER.info(f"Bridge Name: {self._bridge.config.name}")
-            LOGGER.info(f"Bridge MAC: {self._bridge.config.mac}")
-            LOGGER.info(f"API Version: {self._bridge.config.apiversion}")
+        self._status_online = online
+        if not self.is_publisher:
+            return
 
+        if online:
             info = BridgeInfo(
                 name=self._bridge.config.name,
                 mac_address=self._bridge.config.mac,
@@ -142,19 +544,57 @@ class Hue2MQTT:
         else:
             message = Hue2MQTTStatus(online=online)
 
-        self._mqtt.publish("status", message)
+        self._lanes.submit(STATUS, partial(self._mqtt.publish, "status", message))
+
+    def _entity_topic(self, entity_type: str, entity_id: object) -> PublishHandle:
+        """Get the topic for an entity, creating it when the entity is first seen."""
+        key = (entity_type, entity_id)
+        try:
+            return self._entity_topics[key]
+        except KeyError:
+            handle = self._mqtt.publish_handle(f"{entity_type}/{entity_id}", retain=True)
+            self._entity_topics[key] = handle
+            return handle
 
     def publish_light(self, light: LightInfo) -> None:
         """Publish information about a light to MQTT."""
-        self._mqtt.publish(f"light/{light.uniqueid}", light, retain=True)
+        self._state.update_light(light)
+        if self.is_publisher:
+            handle = self._entity_topic("light", light.uniqueid)
+            self._lanes.submit(STATE, partial(handle.publish, light))
+
+        if self.config.groups.derive_state:
+            self._derive_groups(light)
+
+    def _derive_groups(self, light: LightInfo) -> None:
+        """
+        Publish the groups containing a light, if their state has changed.
+
+        The state of the groups is derived from the cached state of their
+        lights, rather than waiting for the bridge to send a group event.
+        """
+        for group in self._state.groups_with_light(light.id):
+            state = self._state.derive_group_state(group)
+            if state is not None and state != group.state:
+                self._metrics.increment("group_states_derived")
+                self.publish_group(group.copy(update={"state": state}))
 
     def publish_group(self, group: GroupInfo) -> None:
         """Publish information about a group to MQTT."""
-        self._mqtt.publish(f"group/{group.id}", group, retain=True)
+        self._state.update_group(group)
+        if self.is_publisher:
+            handle = self._entity_topic("group", group.id)
+            self._lanes.submit(STATE, partial(handle.publish, group))
 
     def publish_sensor(self, sensor: SensorInfo) -> None:
         """Publish information about a group to MQTT."""
-        self._mqtt.publish(f"sensor/{sensor.uniqueid}", sensor, retain=True)
+        if self._history.settings.enabled:
+            if is_new_reading(self._state.sensors.get(sensor.uniqueid), sensor):
+                self._history.record(sensor)
+        self._state.update_sensor(sensor)
+        if self.is_publisher:
+            handle = self._entity_topic("sensor", sensor.uniqueid)
+            self._lanes.submit(STATE, partial(handle.publish, sensor))
 
     async def handle_set_light(self, match: Match[str], payload: str) -> None:
         """Handle an update to a light."""
@@ -164,70 +604,1004 @@ class Hue2MQTT:
         for light_id in self._bridge.lights:
             light = self._bridge.lights[light_id]
             if light.uniqueid == uniqueid:
+                entity = {"entity_type": "light", "entity": uniqueid}
+                if not self._filter.allows("light", light.id, light.raw):
+                    LOGGER.debug("Ignoring command for filtered light %s", light.name)
+                    self._metrics.increment("commands_filtered")
+                    return
                 try:
-                    state = parse_obj_as(LightSetState, json.loads(payload))
-                    LOGGER.info(f"Updating {light.name}")
-                    await light.set_state(**state.dict())
+                    data, force = self._parse_command(payload)
+                    state = get_validator(LightSetState).validate(data)
+                    # The cached state is not settled whilst an effect is running
+                    cancelled = self._cancel_effects([int(light.id)])
+                    pending = self._pending.any_pending([int(light.id)])
+                    if not force and not cancelled and not pending:
+                        cached = self._state.lights.get(uniqueid)
+                        state = self._remove_redundant(
+                            state,
+                            [] if cached is None else [cached.state],
+                        )
+                    if not state:
+                        LOGGER.debug("Ignoring redundant command for %s", light.name)
+                        return
+                    LOGGER.info("Updating %s", light.name, extra=entity)
+                    self._pending.add([int(light.id)])
+                    await light.set_state(**state)
                 except json.JSONDecodeError:
-                    LOGGER.warning(f"Bad JSON on light request: {payload}")
+                    LOGGER.warning(
+                        "Bad JSON on light request: %s",
+                        payload,
+                        extra={**entity, "rate_limited": True},
+                    )
                 except TypeError:
-                    LOGGER.warning(f"Expected dictionary, got: {payload}")
+                    LOGGER.warning(
+                        "Expected dictionary, got: %s",
+                        payload,
+                        extra={**entity, "rate_limited": True},
+                    )
                 except ValidationError as e:
-                    LOGGER.warning(f"Invalid light state: {e}")
+                    LOGGER.warning(
+                        "Invalid light state: %s",
+                        e,
+                        extra={**entity, "rate_limited": True},
+                    )
                 return
-        LOGGER.warning(f"Unknown light uniqueid: {uniqueid}")
+        LOGGER.warning(
+            "Unknown light uniqueid: %s",
+            uniqueid,
+            extra={"entity_type": "light", "entity": uniqueid, "rate_limited": True},
+        )
 
     async def handle_set_group(self, match: Match[str], payload: str) -> None:
         """Handle an update to a group."""
         groupid = match.group(1)
+        entity = {"entity_type": "group", "entity": groupid}
 
         try:
             group = self._bridge.groups[groupid]
-            state = parse_obj_as(GroupSetState, json.loads(payload))
-            LOGGER.info(f"Updating group {group.name}")
-            await group.set_action(**state.dict())
+            if not self._filter.allows("group", group.id, group.raw):
+                LOGGER.debug("Ignoring command for filtered group %s", group.name)
+                self._metrics.increment("commands_filtered")
+                return
+            data, force = self._parse_command(payload)
+            state = get_validator(GroupSetState).validate(data)
+            cached_group = self._state.groups.get(int(group.id))
+            light_ids = [] if cached_group is None else cached_group.lights
+            cancelled = self._cancel_effects(light_ids)
+            pending = self._pending.any_pending(light_ids)
+            if not force and not cancelled and not pending:
+                states = self._group_light_states(int(group.id))
+                state = self._remove_redundant(state, states)
+            if not state:
+                LOGGER.debug("Ignoring redundant command for group %s", group.name)
+                return
+            LOGGER.info("Updating group %s", group.name, extra=entity)
+            self._pending.add(light_ids)
+            await group.set_action(**state)
         except IndexError:
-            LOGGER.warning(f"Unknown group id: {groupid}")
+            LOGGER.warning(
+                "Unknown group id: %s",
+                groupid,
+                extra={**entity, "rate_limited": True},
+            )
         except json.JSONDecodeError:
-            LOGGER.warning(f"Bad JSON on light request: {payload}")
+            LOGGER.warning(
+                "Bad JSON on light request: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
         except TypeError:
-            LOGGER.warning(f"Expected dictionary, got: {payload}")
+            LOGGER.warning(
+                "Expected dictionary, got: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
         except ValidationError as e:
-            LOGGER.warning(f"Invalid light state: {e}")
+            LOGGER.warning(
+                "Invalid light state: %s",
+                e,
+                extra={**entity, "rate_limited": True},
+            )
 
-    async def main(self, websession: ClientSession) -> None:
-        """Main method of the data component."""
-        # Publish initial info about lights
-        for idx, light_raw in self._bridge.lights._items.items():
-            light = LightInfo(id=idx, **light_raw.raw)
-            self.publish_light(light)
+    async def handle_set_scene(self, match: Match[str], payload: str) -> None:
+        """Handle a request to recall a scene."""
+        name = match.group(1)
+        entity = {"entity_type": "scene", "entity": name}
 
-        # Publish initial info about groups
-        for idx, group_raw in self._bridge.groups._items.items():
-            group = GroupInfo(id=idx, **group_raw.raw)
-            self.publish_group(group)
+        scene = self._scenes.get(name)
+        if scene is None:
+            LOGGER.warning(
+                "Unknown scene: %s",
+                name,
+                extra={**entity, "rate_limited": True},
+            )
+            return
 
-        # Publish initial info about sensors
-        for idx, sensor_raw in self._bridge.sensors._items.items():
-            if "uniqueid" in sensor_raw.raw and "productname" in sensor_raw.raw:
-                sensor = SensorInfo(id=idx, **sensor_raw.raw)
-                self.publish_sensor(sensor)
+        try:
+            recall = parse_obj_as(SceneRecall, json.loads(payload or "{}"))
+        except json.JSONDecodeError:
+            LOGGER.warning(
+                "Bad JSON on scene request: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        except ValidationError as e:
+            LOGGER.warning(
+                "Invalid scene request: %s",
+                e,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+
+        commands: Dict[int, Dict[str, Any]] = {}
+        for uniqueid, command in scene.items():
+            light = self._state.lights.get(uniqueid)
+            if light is None:
+                LOGGER.warning(
+                    "Unknown light %s in scene %s",
+                    uniqueid,
+                    name,
+                    extra={**entity, "rate_limited": True},
+                )
+                continue
+            if recall.transitiontime is not None:
+                command = {**command, "transitiontime": recall.transitiontime}
+            commands[light.id] = command
+
+        self._cancel_effects(commands)
+        LOGGER.info("Recalling scene %s", name, extra=entity)
+        start = time.monotonic()
+        plan = plan_recall(commands, self._state.groups.values())
+        await self._dispatch(plan, entity)
+        self._metrics.increment("scene_group_commands", len(plan.groups))
+        self._metrics.increment("scene_light_commands", len(plan.lights))
+        self._metrics.observe("scene_recall", time.monotonic() - start)
+
+    async def handle_set_room(self, match: Match[str], payload: str) -> None:
+        """Handle an update to the lights in the rooms with a given name."""
+        name = match.group(1)
+        lights: List[Optional[LightInfo]] = []
+        for room in self._state.rooms_named(name):
+            lights.extend(self._state.light_by_id(light_id) for light_id in room.lights)
+        known = [light for light in lights if light is not None]
+        await self._set_lights("room", name, known, payload)
+
+    async def handle_set_light_by_name(self, match: Match[str], payload: str) -> None:
+        """Handle an update to the lights with a given name."""
+        name = match.group(1)
+        lights = self._state.lights_named(name)
+        await self._set_lights("light_name", name, lights, payload)
+
+    async def handle_set_light_by_type(self, match: Match[str], payload: str) -> None:
+        """Handle an update to the lights of a given type."""
+        light_type = match.group(1)
+        lights = self._state.lights_of_type(light_type)
+        await self._set_lights("light_type", light_type, lights, payload)
+
+    async def _set_lights(
+        self,
+        entity_type: str,
+        entity_id: str,
+        lights: List[LightInfo],
+        payload: str,
+    ) -> None:
+        """
+        Send a command to several lights.
+
+        The command is validated once, and redundant fields are removed for
+        each light. Lights that are left with the same command are set with
+        a single group action if a group contains exactly those lights.
+        """
+        entity = {"entity_type": entity_type, "entity": entity_id}
+        if not lights:
+            LOGGER.warning(
+                "No lights match %s: %s",
+                entity_type,
+                entity_id,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+
+        try:
+            data, force = self._parse_command(payload)
+            state = get_validator(LightSetState).validate(data)
+        except json.JSONDecodeError:
+            LOGGER.warning(
+                "Bad JSON on light request: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        except TypeError:
+            LOGGER.warning(
+                "Expected dictionary, got: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        except ValidationError as e:
+            LOGGER.warning(
+                "Invalid light state: %s",
+                e,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+
+        cancelled = self._cancel_effects(light.id for light in lights)
+        commands: Dict[int, Dict[str, Any]] = {}
+        for light in lights:
+            command = state
+            if not force and not cancelled and not self._pending.any_pending([light.id]):
+                command = self._remove_redundant(state, [light.state])
+            if command:
+                commands[light.id] = command
+        if not commands:
+            LOGGER.debug("Ignoring redundant command for %s %s", entity_type, entity_id)
+            return
+
+        LOGGER.info("Updating %d lights", len(commands), extra=entity)
+        plan = plan_recall(commands, self._state.groups.values())
+        await self._dispatch(plan, entity)
+        self._metrics.increment("fan_out_group_commands", len(plan.groups))
+        self._metrics.increment("fan_out_light_commands", len(plan.lights))
+
+    async def _dispatch(self, plan: RecallPlan, entity: Dict[str, str]) -> None:
+        """Send the commands of a plan concurrently, within the rate limits."""
+        self._pending.add(light_id for light_id, _ in plan.lights)
+        for group_id, _ in plan.groups:
+            group = self._state.groups.get(group_id)
+            if group is not None:
+                self._pending.add(group.lights)
+        results = await asyncio.gather(
+            *(self._set_group_paced(group_id, cmd) for group_id, cmd in plan.groups),
+            *(self._set_light_paced(light_id, cmd) for light_id, cmd in plan.lights),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                LOGGER.warning(
+                    "Unable to update part of %s %s: %s",
+                    *entity.values(),
+                    result,
+                    extra=entity,
+                )
+
+    async def _set_group_paced(self, group_id: int, command: Dict[str, Any]) -> None:
+        """Set the action of a group, within the rate limit of the bridge."""
+        await self._group_pacer.wait()
+        await self._bridge.groups[str(group_id)].set_action(**command)
+
+    async def _set_light_paced(self, light_id: int, command: Dict[str, Any]) -> None:
+        """Set the state of a light, within the rate limit of the bridge."""
+        await self._light_pacer.wait()
+        await self._bridge.lights[str(light_id)].set_state(**command)
+
+    async def handle_light_effect(self, match: Match[str], payload: str) -> None:
+        """Handle a request to run an effect on a light."""
+        uniqueid = match.group(1)
+        light = self._state.lights.get(uniqueid)
+        if light is None:
+            LOGGER.warning(
+                "Unknown light uniqueid: %s",
+                uniqueid,
+                extra={"entity_type": "light", "entity": uniqueid, "rate_limited": True},
+            )
+            return
+        self._start_effect("light", uniqueid, payload, [light], None)
+
+    async def handle_group_effect(self, match: Match[str], payload: str) -> None:
+        """Handle a request to run an effect on the lights of a group."""
+        groupid = match.group(1)
+        group = self._state.groups.get(int(groupid)) if groupid.isdigit() else None
+        if group is None:
+            LOGGER.warning(
+                "Unknown group id: %s",
+                groupid,
+                extra={"entity_type": "group", "entity": groupid, "rate_limited": True},
+            )
+            return
+        lights = [self._state.light_by_id(light_id) for light_id in group.lights]
+        known = [light for light in lights if light is not None]
+        self._start_effect("group", groupid, payload, known, group)
+
+    def _update_effect_budget(self) -> None:
+        """
+        Limit effects to their share of the rate limits of the bridge.
+
+        The share is shared by every running effect, rather than each one.
+        """
+        budget_share = self.config.effects.budget_share
+        self._effect_light_pacer.interval = self._light_pacer.interval / budget_share
+        self._effect_group_pacer.interval = self._group_pacer.interval / budget_share
+
+    def _start_effect(
+        self,
+        entity_type: str,
+        entity_id: str,
+        payload: str,
+        lights: List[LightInfo],
+        group: Optional[GroupInfo],
+    ) -> None:
+        """Plan an effect and start running it."""
+        entity = {"entity_type": entity_type, "entity": entity_id}
+        light_ids = {light.id for light in lights}
+
+        # Effects on other lights keep running, and take an equal share of the budget
+        concurrent = 1 + sum(
+            1 for effect_lights in self._effects.running if not effect_lights & light_ids
+        )
+        try:
+            request = parse_obj_as(EffectRequest, json.loads(payload))
+            keyframes = plan_effect(
+                request,
+                lights=lights,
+                group=group,
+                light_interval=self._effect_light_pacer.interval * concurrent,
+                group_interval=self._effect_group_pacer.interval * concurrent,
+                min_interval=self.config.effects.min_interval,
+            )
+        except json.JSONDecodeError:
+            LOGGER.warning(
+                "Bad JSON on effect request: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        except ValueError as e:
+            LOGGER.warning(
+                "Invalid effect: %s",
+                e,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+
+        LOGGER.info("Starting %s effect on %s %s", request.effect, *entity.values())
+        self._effects.start(light_ids, keyframes)
+        self._metrics.increment("effects_started")
+
+    async def _send_keyframe(self, keyframe: Keyframe) -> None:
+        """
+        Send a keyframe of an effect, within the budget for effects.
+
+        Every instance runs each effect, so that another can take over if the
+        leader stops, but only the leader sends the keyframes.
+        """
+        if not self.is_publisher:
+            return
+        if keyframe.kind == "group":
+            await self._effect_group_pacer.wait()
+            await self._set_group_paced(keyframe.id, keyframe.command)
+        else:
+            await self._effect_light_pacer.wait()
+            await self._set_light_paced(keyframe.id, keyframe.command)
+        self._metrics.increment("effect_commands")
+
+    def _cancel_effects(self, light_ids: Iterable[int]) -> int:
+        """
+        Cancel any effects on the lights, as a command has been sent to them.
+
+        The command may only have been received by this instance, so the
+        other instances are told to cancel their effects too.
+        """
+        lights = sorted(set(light_ids))
+        cancelled = self._effects.cancel(lights)
+        if cancelled:
+            self._metrics.increment("effects_cancelled", cancelled)
+            if self._election is not None:
+                message = HAEffectsCancelled(
+                    instance=self._election.instance_id,
+                    lights=lights,
+                )
+                self._mqtt.publish("ha/effects/cancel", message, force_json=True)
+        return cancelled
+
+    async def _handle_effects_cancelled(self, match: Match[str], payload: str) -> None:
+        """Cancel the effects that another instance has cancelled."""
+        try:
+            message = parse_obj_as(HAEffectsCancelled, json.loads(payload))
+        except (json.JSONDecodeError, ValidationError) as e:
+            LOGGER.warning(f"Invalid effect cancellation message: {e}")
+            return
+
+        if self._election is None or message.instance == self._election.instance_id:
+            return
+        cancelled = self._effects.cancel(message.lights)
+        if cancelled:
+            self._metrics.increment("effects_cancelled", cancelled)
+
+    async def handle_capture_scene(self, match: Match[str], payload: str) -> None:
+        """Handle a request to capture the current state of lights as a scene."""
+        name = match.group(1)
+        entity = {"entity_type": "scene", "entity": name}
+
+        try:
+            capture = parse_obj_as(SceneCapture, json.loads(payload or "{}"))
+        except json.JSONDecodeError:
+            LOGGER.warning(
+                "Bad JSON on scene request: %s",
+                payload,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        except ValidationError as e:
+            LOGGER.warning(
+                "Invalid scene request: %s",
+                e,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+
+        lights = [self._state.lights.get(uniqueid) for uniqueid in capture.lights]
+        if capture.group is not None:
+            group = self._state.groups.get(capture.group)
+            if group is not None:
+                lights.extend(self._state.light_by_id(idx) for idx in group.lights)
+
+        scene = {
+            light.uniqueid: capture_state(light.state)
+            for light in lights
+            if light is not None and light.state is not None
+        }
+        if not scene:
+            LOGGER.warning(
+                "No known lights to capture in scene %s",
+                name,
+                extra={**entity, "rate_limited": True},
+            )
+            return
+        LOGGER.info("Captured scene %s", name, extra=entity)
+        self._scenes.capture(name, scene)
+
+    def _parse_command(self, payload: str) -> Tuple[Any, bool]:
+        """
+        Decode the payload of a command.
+
+        Returns the command, and whether it should be sent to the bridge even
+        if it is redundant.
+        """
+        data = json.loads(payload)
+        force = False
+        if isinstance(data, dict):
+            force = bool(data.pop("force", False))
+        return data, force
+
+    def _remove_redundant(
+        self,
+        state: Dict[str, Any],
+        current: List[Optional[LightState]],
+    ) -> Dict[str, Any]:
+        """
+        Remove the fields of a command that would not change the lights.
+
+        Nothing is removed unless suppression is enabled and the state of
+        all of the lights is known.
+        """
+        if not self.config.commands.suppress_redundant or not state:
+            return state
+        if any(light_state is None for light_state in current):
+            return state
+
+        remaining = remove_redundant(
+            state,
+            [light_state for light_state in current if light_state is not None],
+        )
+        suppressed = len(state) - len(remaining)
+        if not remaining:
+            self._metrics.increment("commands_suppressed")
+        elif suppressed > 0:
+            self._metrics.increment("command_fields_suppressed", suppressed)
+        return remaining
+
+    def _group_light_states(self, group_id: int) -> List[Optional[LightState]]:
+        """Get the cached state of the lights in a group, or None if unknown."""
+        group = self._state.groups.get(group_id)
+        if group is None:
+            return [None]
+        states: List[Optional[LightState]] = []
+        for light_id in group.lights:
+            light = self._state.light_by_id(light_id)
+            states.append(None if light is None else light.state)
+        return states
+
+    async def _publish_metrics_periodically(self) -> None:
+        """Publish the metrics at a regular interval."""
+        while True:
+            await asyncio.sleep(self.config.metrics.publish_interval)
+            self._mqtt.publish("metrics", self._metrics.report())
+
+    async def _monitor_loop_lag(self) -> None:
+        """
+        Measure how late the event loop is to wake up after sleeping.
+
+        A large lag means that the event loop is busy, and that events and
+        commands are waiting to be handled.
+        """
+        while True:
+            interval = self.config.runtime.lag_monitor_interval
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(time.monotonic() - start - interval, 0)
+            self._metrics.observe("loop_lag", lag)
+            if lag > self.config.runtime.lag_warning_threshold:
+                LOGGER.warning(
+                    "Event loop is lagging by %.3fs",
+                    lag,
+                    extra={"lag": lag, "rate_limited": True},
+                )
+
+    async def _reconcile_periodically(self) -> None:
+        """
+        Reconcile the published state with the bridge at a regular interval.
+
+        The interval is randomised by the jitter, and is doubled up to the
+        maximum backoff whilst the bridge is failing to respond.
+        """
+        delay = self.config.reconciliation.interval
+        while True:
+            jitter = self.config.reconciliation.jitter
+            await asyncio.sleep(delay * random.uniform(1 - jitter, 1 + jitter))  # noqa: S311
+            start = time.monotonic()
+            try:
+                drift = await self.reconcile()
+            except (
+                ClientError,
+                asyncio.TimeoutError,
+                aiohue.errors.AiohueException,
+            ) as e:
+                self._metrics.increment("reconcile_failures")
+                delay = min(delay * 2, self.config.reconciliation.max_backoff)
+                LOGGER.warning(f"Unable to reconcile with bridge, retry in {delay}s: {e}")
+            except ValidationError as e:
+                # Retrying sooner will not help, as the bridge is responding
+                self._metrics.increment("reconcile_failures")
+                delay = self.config.reconciliation.interval
+                LOGGER.error(f"Invalid data from bridge, unable to reconcile: {e}")
             else:
-                LOGGER.debug(f"Ignoring virtual sensor: {sensor_raw.name}")
+                self._metrics.observe("reconcile_duration", time.monotonic() - start)
+                delay = self.config.reconciliation.interval
+                if drift > 0:
+                    LOGGER.info(
+                        "Reconciliation republished %d drifted entities",
+                        drift,
+                        extra={"drift": drift, "duration": time.monotonic() - start},
+                    )
+
+    async def reconcile(self) -> int:
+        """
+        Fetch the full state of the bridge and publish anything that has drifted.
+
+        Only entities that differ from the cached state are published.
+
+        Returns the number of entities that were republished.
+        """
+        await self._bridge.lights.update()
+        await self._bridge.groups.update()
+        if self._bridge.sensors is not None:
+            await self._bridge.sensors.update()
+        self._metrics.increment("reconcile_runs")
+        lights, groups, sensors = await self._fetch_entities()
+
+        drift = 0
+        for light in lights:
+            if self._state.lights.get(light.uniqueid) != light:
+                self._metrics.increment("reconcile_drift_lights")
+                self.publish_light(light)
+                drift += 1
+
+        for group in groups:
+            if self._state.groups.get(group.id) != group:
+                self._metrics.increment("reconcile_drift_groups")
+                self.publish_group(group)
+                drift += 1
+
+        for sensor in sensors:
+            if self._state.sensors.get(sensor.uniqueid) != sensor:
+                self._metrics.increment("reconcile_drift_sensors")
+                self.publish_sensor(sensor)
+                drift += 1
+
+        return drift
+
+    async def _fetch_entities(
+        self,
+    ) -> Tuple[List[LightInfo], List[GroupInfo], List[SensorInfo]]:
+        """
+        Build the info of every entity from the state held by aiohue.
+
+        Validating every entity is CPU-heavy on large installs, so it is
+        offloaded to the pool of workers if one is configured. Entities that
+        are invalid are logged and skipped.
+        """
+        groups = [(idx, item.raw) for idx, item in self._bridge.groups._items.items()]
+        self._filter.update_rooms(groups)
+        groups = [
+            (idx, raw) for idx, raw in groups if self._filter.allows("group", idx, raw)
+        ]
+        lights = [
+            (idx, item.raw)
+            for idx, item in self._bridge.lights._items.items()
+            if self._filter.allows("light", idx, item.raw)
+        ]
+        sensors = []
+        if self._bridge.sensors is not None:
+            for idx, item in self._bridge.sensors._items.items():
+                if "uniqueid" not in item.raw or "productname" not in item.raw:
+                    LOGGER.debug("Ignoring virtual sensor: %s", item.name)
+                elif self._filter.allows("sensor", idx, item.raw):
+                    sensors.append((idx, item.raw))
+
+        (
+            (light_models, light_errors),
+            (group_models, group_errors),
+            (sensor_models, sensor_errors),
+        ) = await asyncio.gather(
+            self._offloader.run(build_models, LightInfo, lights),
+            self._offloader.run(build_models, GroupInfo, groups),
+            self._offloader.run(build_models, SensorInfo, sensors),
+        )
+        for entity_type, errors in (
+            ("light", light_errors),
+            ("group", group_errors),
+            ("sensor", sensor_errors),
+        ):
+            for idx, error in errors:
+                self._metrics.increment("invalid_entities")
+                LOGGER.warning(
+                    "Ignoring invalid %s %s from bridge: %s",
+                    entity_type,
+                    idx,
+                    error,
+                    extra={
+                        "entity_type": entity_type,
+                        "entity": idx,
+                        "rate_limited": True,
+                    },
+                )
+        return light_models, group_models, sensor_models
+
+    def _parse_query(self, payload: str) -> StateQuery:
+        """Parse the filter on a query. An empty payload matches everything."""
+        if len(payload) == 0:
+            return StateQuery()
+        return parse_obj_as(StateQuery, json.loads(payload))
+
+    async def handle_get_light(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of a light."""
+        uniqueid = match.group(1)
+        try:
+            return self._state.lights[uniqueid]
+        except KeyError:
+            return QueryError(error=f"Unknown light uniqueid: {uniqueid}")
+
+    async def handle_get_lights(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of lights."""
+        try:
+            query = self._parse_query(payload)
+            return LightList(lights=self._state.query_lights(query))
+        except json.JSONDecodeError:
+            return QueryError(error=f"Bad JSON on query: {payload}")
+        except (TypeError, ValueError) as e:
+            return QueryError(error=f"Invalid query: {e}")
+
+    async def handle_get_group(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of a group."""
+        groupid = match.group(1)
+        try:
+            return self._state.groups[int(groupid)]
+        except (KeyError, ValueError):
+            return QueryError(error=f"Unknown group id: {groupid}")
+
+    async def handle_get_groups(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of groups."""
+        try:
+            query = self._parse_query(payload)
+            return GroupList(groups=self._state.query_groups(query))
+        except json.JSONDecodeError:
+            return QueryError(error=f"Bad JSON on query: {payload}")
+        except (TypeError, ValueError) as e:
+            return QueryError(error=f"Invalid query: {e}")
+
+    async def handle_get_sensor(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of a sensor."""
+        uniqueid = match.group(1)
+        try:
+            return self._state.sensors[uniqueid]
+        except KeyError:
+            return QueryError(error=f"Unknown sensor uniqueid: {uniqueid}")
+
+    async def handle_get_sensors(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the cached state of sensors."""
+        try:
+            query = self._parse_query(payload)
+            return SensorList(sensors=self._state.query_sensors(query))
+        except json.JSONDecodeError:
+            return QueryError(error=f"Bad JSON on query: {payload}")
+        except (TypeError, ValueError) as e:
+            return QueryError(error=f"Invalid query: {e}")
+
+    async def handle_get_history(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the recent readings of a sensor."""
+        uniqueid = match.group(1)
+        if not self._history.settings.enabled:
+            return QueryError(error="Sensor history is disabled")
+        try:
+            query = parse_obj_as(HistoryQuery, json.loads(payload))
+            return self._history.query(uniqueid, query)
+        except json.JSONDecodeError:
+            return QueryError(error=f"Bad JSON on query: {payload}")
+        except KeyError:
+            return QueryError(error=f"No history for sensor: {uniqueid}")
+        except (TypeError, ValueError) as e:
+            return QueryError(error=f"Invalid query: {e}")
+
+    async def handle_get_scenes(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the scenes that can be recalled."""
+        return SceneList(scenes=self._scenes.scenes)
+
+    async def handle_get_metrics(self, match: Match[str], payload: str) -> BaseModel:
+        """Handle a query for the current metrics."""
+        return self._metrics.report()
+
+    async def main(self, websession: ClientSession) -> None:
+        """Main method of the data component."""
+        initial_publish = asyncio.ensure_future(self._publish_initial_state())
+        initial_publish.add_done_callback(self._initial_publish_done)
 
         # Publish updates
         try:
-            async for updated_object in self._bridge.listen_events():
-                if isinstance(updated_object, aiohue.groups.Group):
-                    group = GroupInfo(id=updated_object.id, **updated_object.raw)
-                    self.publish_group(group)
-                elif isinstance(updated_object, aiohue.lights.Light):
-                    light = LightInfo(id=updated_object.id, **updated_object.raw)
-                    self.publish_light(light)
-                elif isinstance(updated_object, aiohue.sensors.GenericSensor):
-                    sensor = SensorInfo(id=updated_object.id, **updated_object.raw)
-                    self.publish_sensor(sensor)
-                else:
-                    LOGGER.warning("Unknown object")
+            await self._listen_events()
         except GeneratorExit:
             LOGGER.warning("Exited loop")
+        finally:
+            initial_publish.cancel()
+
+    def _initial_publish_done(self, task: "asyncio.Task[None]") -> None:
+        """Log a failure to publish the initial state."""
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.error(
+                "Unable to publish initial state: %s",
+                task.exception(),
+                exc_info=task.exception(),
+            )
+
+    async def _initial_state(self) -> List[Tuple[Tuple[str, str], Callable[[], None]]]:
+        """Get the jobs that publish the initial state of each entity."""
+        lights, groups, sensors = await self._fetch_entities()
+        jobs: List[Tuple[Tuple[str, str], Callable[[], None]]] = []
+        for light in lights:
+            jobs.append((("light", light.uniqueid), partial(self.publish_light, light)))
+        for group in groups:
+            jobs.append((("group", str(group.id)), partial(self.publish_group, group)))
+        for sensor in sensors:
+            jobs.append(
+                (("sensor", sensor.uniqueid), partial(self.publish_sensor, sensor)),
+            )
+        return jobs
+
+    async def _publish_initial_state(self) -> None:
+        """
+        Publish the initial state of every entity, without flooding the broker.
+
+        Entities are published in chunks. Before each chunk, we wait until
+        the previous chunk has left the state lane, and the number of messages
+        that the broker has not acknowledged is below the inflight limit.
+        Live events are handled between chunks, and any entity that has
+        already been published by an event is skipped, so that it is not
+        overwritten with the older state.
+        """
+        settings = self.config.initial_publish
+        start = time.monotonic()
+        jobs = await self._initial_state()
+        self._initial_pending = {key for key, _ in jobs}
+
+        chunk_size = max(settings.chunk_size, 1)
+        for i in range(0, len(jobs), chunk_size):
+            if settings.max_inflight > 0:
+                await self._lanes.wait_drained(STATE)
+                await self._mqtt.wait_for_capacity(settings.max_inflight)
+            for key, publish in jobs[i : i + chunk_size]:
+                if key in self._initial_pending:
+                    self._initial_pending.discard(key)
+                    publish()
+            await asyncio.sleep(0)
+
+        # Fully published once the broker has acknowledged everything
+        await self._lanes.wait_drained(STATE)
+        await self._mqtt.wait_for_capacity(1)
+        duration = time.monotonic() - start
+        self._metrics.observe("initial_publish", duration)
+        LOGGER.info(
+            "Published initial state of %d entities in %.2fs",
+            len(jobs),
+            duration,
+            extra={"entities": len(jobs), "duration": duration},
+        )
+
+    def handle_event(self, updated_object: object) -> None:
+        """Publish an object that has been updated by the event stream."""
+        model: Type[BaseModel]
+        if isinstance(updated_object, aiohue.groups.Group):
+            entity_type, model = "group", GroupInfo
+        elif isinstance(updated_object, aiohue.lights.Light):
+            entity_type, model = "light", LightInfo
+        elif isinstance(updated_object, aiohue.sensors.GenericSensor):
+            entity_type, model = "sensor", SensorInfo
+        else:
+            LOGGER.warning(
+                "Unknown object: %s",
+                type(updated_object).__name__,
+                extra={"rate_limited": True},
+            )
+            return
+
+        # Filtered entities are dropped before the model is built
+        if not self._filter.allows(entity_type, updated_object.id, updated_object.raw):
+            self._metrics.increment("events_filtered")
+            return
+        self._handle_update(model(id=updated_object.id, **updated_object.raw))
+
+    def _handle_update(self, entity: BaseModel) -> None:
+        """Publish an entity that has been updated by the event stream."""
+        if isinstance(entity, GroupInfo):
+            self._initial_pending.discard(("group", str(entity.id)))
+            cached = self._state.groups.get(entity.id)
+            if (
+                self.config.groups.derive_state
+                and cached is not None
+                and cached.dict(exclude={"action"}) == entity.dict(exclude={"action"})
+            ):
+                # The bridge has caught up with the state that was derived. The
+                # action is not derived, so is cached without publishing.
+                self._state.update_group(entity)
+                self._metrics.increment("group_states_confirmed")
+                return
+            self.publish_group(entity)
+        elif isinstance(entity, LightInfo):
+            self._initial_pending.discard(("light", entity.uniqueid))
+            self.publish_light(entity)
+        elif isinstance(entity, SensorInfo):
+            self._initial_pending.discard(("sensor", entity.uniqueid))
+            self.publish_sensor(entity)
+
+    async def _clip_events(self) -> AsyncIterator[BaseModel]:
+        """Yield the entities that are changed by the CLIP v2 event stream."""
+        buttons = index_buttons(await fetch_resources(self._bridge))
+        async for event_type, resource in stream_updates(self._bridge):
+            entity = None
+            if event_type == "update":
+                entity = self._apply_clip_update(resource, buttons)
+            if entity is None:
+                self._metrics.increment("clip_events_ignored")
+            else:
+                yield entity
+
+    def _apply_clip_update(
+        self,
+        resource: Dict[str, Any],
+        buttons: Dict[str, int],
+    ) -> Optional[BaseModel]:
+        """
+        Apply the changed fields of a CLIP v2 resource to its v1 entity.
+
+        Changes are applied to the cached state of the entity. If it has not
+        been published yet, they are applied to the state held by aiohue.
+        """
+        ids = parse_id_v1(resource)
+        if ids is None or not ids[1].isdigit():
+            return None
+        kind, idx = ids
+
+        # Filtered entities are never cached, so are only checked when not cached
+        if kind == "lights":
+            light = self._state.light_by_id(int(idx))
+            item = self._bridge.lights._items.get(idx)
+            if light is None and item is not None:
+                if self._filter.allows("light", idx, item.raw):
+                    light = LightInfo(id=int(idx), **item.raw)
+            return None if light is None else apply_light_update(light, resource)
+        elif kind == "groups":
+            group = self._state.groups.get(int(idx))
+            item = self._bridge.groups._items.get(idx)
+            if group is None and item is not None:
+                if self._filter.allows("group", idx, item.raw):
+                    group = GroupInfo(id=int(idx), **item.raw)
+            return None if group is None else apply_group_update(group, resource)
+        elif kind == "sensors":
+            sensor = self._state.sensor_by_id(int(idx))
+            if sensor is None and self._bridge.sensors is not None:
+                item = self._bridge.sensors._items.get(idx)
+                if (
+                    item is not None
+                    and {"uniqueid", "productname"} <= item.raw.keys()
+                    and self._filter.allows("sensor", idx, item.raw)
+                ):
+                    sensor = SensorInfo(id=int(idx), **item.raw)
+            if sensor is None:
+                return None
+            return apply_sensor_update(sensor, resource, buttons)
+        return None
+
+    async def _listen_events(self) -> None:
+        """
+        Publish updates from the event stream of the bridge.
+
+        If the watchdog is enabled, the stream is considered to have stalled
+        when no events arrive within the stall timeout, and is resubscribed
+        once the bridge is known to be reachable. The events that were missed
+        in the meantime are recovered by reconciling with the bridge.
+
+        The stream is also resubscribed if the bridge is replaced by a reload.
+        """
+        while True:
+            bridge = self._bridge
+            self._last_event = time.monotonic()
+            self._event_stream = asyncio.ensure_future(self._consume_events())
+            try:
+                await self._event_stream
+            except asyncio.CancelledError:
+                if bridge is self._bridge:
+                    raise
+                continue
+            finally:
+                self._event_stream = None
+
+            if not self.config.events.enable_watchdog:
+                return
+
+            self._metrics.increment("event_stream_restarts")
+            await self._wait_for_bridge()
+            stall = time.monotonic() - self._last_event
+            self._metrics.observe("event_stream_stall", stall)
+
+    async def _consume_events(self) -> None:
+        """Publish updates until the event stream ends or stalls."""
+        settings = self.config.events
+        timeout = settings.stall_timeout if settings.enable_watchdog else None
+        events: AsyncIterator[Any]
+        if settings.backend == "v2":
+            events = self._clip_events()
+            handle: Callable[[Any], None] = self._handle_update
+        else:
+            events = self._bridge.listen_events()
+            handle = self.handle_event
+        try:
+            while True:
+                updated_object = await asyncio.wait_for(events.__anext__(), timeout)
+                self._metrics.observe("event_gap", time.monotonic() - self._last_event)
+                self._last_event = time.monotonic()
+                handle(updated_object)
+        except StopAsyncIteration:
+            if settings.enable_watchdog:
+                LOGGER.warning("Event stream ended unexpectedly")
+        except asyncio.TimeoutError:
+            LOGGER.info(f"No events received for {timeout}s, resubscribing")
+
+    async def _wait_for_bridge(self) -> None:
+        """
+        Wait until the bridge responds to requests.
+
+        The status is published as offline whilst the bridge is unreachable,
+        and retries back off up to the maximum backoff.
+        """
+        delay = 1.0
+        online = True
+        while True:
+            try:
+                await self._bridge.config.update()
+                await self.reconcile()
+            except (
+                ClientError,
+                asyncio.TimeoutError,
+                aiohue.errors.AiohueException,
+            ) as e:
+                LOGGER.warning(f"Unable to reach bridge, retry in {delay}s: {e}")
+                if online:
+                    online = False
+                    await self._publish_bridge_status(online=False)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.config.events.max_backoff)
+            else:
+                if not online:
+                    await self._publish_bridge_status()
+                return
@@ -0,0 +1,125 @@
+"""
+Priority Lanes.
+
+Work is queued into lanes, so that user-issued commands and status
+messages are not held up behind bulk state publishes.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import wraps
+from typing import Callable, Deque, Dict, List, Match, Optional, Tuple
+
+from .config import LanesInfo
+from .metrics import Metrics
+from .mqtt.wrapper import Handler
+
+LOGGER = logging.getLogger(__name__)
+
+Job = Callable[[], object]
+
+COMMAND = "command"
+STATUS = "status"
+STATE = "state"
+
+
+class LaneScheduler:
+    """
+    Runs queued jobs from each lane by weighted round robin.
+
+    In each round, up to the weight of each lane of jobs are run, in lane
+    priority order, before yielding to the event loop. Commands are always
+    checked first, so they wait behind at most one round of other work.
+
+    Jobs are run immediately if the scheduler is disabled or not running.
+    """
+
+    LANES = (COMMAND, STATUS, STATE)
+
+    def __init__(self, settings: LanesInfo, metrics: Metrics) -> None:
+        self.settings = settings
+        self._metrics = metrics
+        self._queues: Dict[str, Deque[Tuple[float, Job]]] = {
+            lane: deque() for lane in self.LANES
+        }
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drain_waiters: Dict[str, List[asyncio.Future[None]]] = {
+            lane: [] for lane in self.LANES
+        }
+
+    @property
+    def weights(self) -> Dict[str, int]:
+        """The number of jobs to run from each lane per round."""
+        return {
+            COMMAND: self.settings.command_weight,
+            STATUS: self.settings.status_weight,
+            STATE: self.settings.state_weight,
+        }
+
+    def submit(self, lane: str, job: Job) -> None:
+        """Queue a job to run in a lane."""
+        if self._wakeup is None or not self.settings.enabled:
+            job()
+            return
+
+        self._queues[lane].append((time.monotonic(), job))
+        self._wakeup.set()
+
+    def prioritise(self, lane: str, handler: Handler) -> Handler:
+        """Wrap an MQTT handler so that it is started from a lane."""
+
+        @wraps(handler)
+        async def prioritised(match: Match[str], payload: str) -> None:
+            self.submit(lane, lambda: asyncio.ensure_future(handler(match, payload)))
+
+        return prioritised
+
+    async def wait_drained(self, lane: str) -> None:
+        """Wait until every job that is queued in a lane has been run."""
+        if not self._queues[lane]:
+            return
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._drain_waiters[lane].append(waiter)
+        try:
+            await waiter
+        finally:
+            self._drain_waiters[lane].remove(waiter)
+
+    async def run(self) -> None:
+        """Run queued jobs until cancelled, then run any that remain."""
+        wakeup = self._wakeup = asyncio.Event()
+        try:
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+                while any(self._queues.values()):
+                    self._run_round()
+                    await asyncio.sleep(0)
+        finally:
+            # Unless another run has already taken over
+            if self._wakeup is wakeup:
+                self.stop()
+
+    def stop(self) -> None:
+        """Run any queued jobs, and run jobs immediately from now on."""
+        self._wakeup = None
+        while any(self._queues.values()):
+            self._run_round()
+
+    def _run_round(self) -> None:
+        """Run up to the weight of each lane of jobs."""
+        for lane, weight in self.weights.items():
+            queue = self._queues[lane]
+            for _ in range(min(max(weight, 1), len(queue))):
+                enqueued, job = queue.popleft()
+                self._metrics.observe(f"lane_{lane}_latency", time.monotonic() - enqueued)
+                try:
+                    job()
+                except Exception:
+                    LOGGER.exception(f"Error running job in {lane} lane")
+            if not queue:
+                for waiter in self._drain_waiters[lane]:
+                    if not waiter.done():
+                        waiter.set_result(None)
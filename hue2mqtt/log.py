@@ -0,0 +1,152 @@
+"""
+Logging Configuration.
+
+Records can be written as text or as structured JSON. They can also be
+handed to a background thread to be formatted and written, so that logging
+does not block the event loop. Repetitive messages can be rate limited.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Attributes that every record has, and so are not extra fields.
+RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None)),
+) | {"message", "asctime", "rate_limited"}
+
+# The number of rate limited messages to remember suppressed counts for.
+MAX_MESSAGES = 1000
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as JSON objects, including any extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:  # noqa: A003
+        """Format a record."""
+        data: Dict[str, Any] = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limit how often repetitive messages are logged.
+
+    Only records with rate_limited set in their extra fields are limited.
+    Records with the same message template, about the same entity if any,
+    are logged at most once per interval, and the number that were
+    suppressed is added to the next one.
+
+    Messages that have not been logged for an interval are forgotten, so
+    that messages about many different entities do not build up. Messages
+    with a suppressed count are kept until they are next logged, unless
+    there are more than MAX_MESSAGES messages.
+    """
+
+    def __init__(self, interval: float) -> None:
+        super().__init__()
+        self.interval = interval
+        self._last: Dict[Tuple[str, int, str, object], Tuple[float, int]] = {}
+        self._last_pruned = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:  # noqa: A003
+        """Determine whether a record should be logged."""
+        if not getattr(record, "rate_limited", False):
+            return True
+
+        entity = getattr(record, "entity", None)
+        key = (record.name, record.levelno, str(record.msg), entity)
+        now = time.monotonic()
+        if now - self._last_pruned >= self.interval:
+            self._prune(now)
+        last, suppressed = self._last.get(key, (-self.interval, 0))
+        if now - last < self.interval:
+            self._last[key] = (last, suppressed + 1)
+            return False
+
+        self._last[key] = (now, 0)
+        if suppressed > 0:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+    def _prune(self, now: float) -> None:
+        """Forget the messages that have not been logged for an interval."""
+        self._last = {
+            key: (last, suppressed)
+            for key, (last, suppressed) in self._last.items()
+            if now - last < self.interval or suppressed > 0
+        }
+        if len(self._last) > MAX_MESSAGES:
+            self._last = {
+                key: (last, suppressed)
+                for key, (last, suppressed) in self._last.items()
+                if now - last < self.interval
+            }
+        self._last_pruned = now
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records without formatting them.
+
+    The records are formatted by the handlers of the queue listener, in
+    its thread, rather than by the thread that logged them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Prepare a record to be queued."""
+        return record
+
+
+def configure_logging(
+    *,
+    level: int,
+    fmt: str,
+    datefmt: str,
+    structured: bool = False,
+    background: bool = False,
+    rate_limit_interval: float = 0,
+) -> Optional[logging.handlers.QueueListener]:
+    """
+    Configure the root logger, if it has not already been configured.
+
+    Returns the queue listener if records are written in the background.
+    """
+    if logging.getLogger().handlers:
+        return None
+
+    handler = logging.StreamHandler()
+    if structured:
+        handler.setFormatter(JSONFormatter(datefmt=datefmt))
+    else:
+        handler.setFormatter(logging.Formatter(fmt, datefmt))
+
+    listener = None
+    root_handler: logging.Handler = handler
+    if background:
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        root_handler = LazyQueueHandler(records)
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
+        # Only stopped here, as stopping the listener twice fails
+        atexit.register(listener.stop)
+
+    if rate_limit_interval > 0:
+        root_handler.addFilter(RateLimitFilter(rate_limit_interval))
+
+    logging.basicConfig(level=level, handlers=[root_handler])
+    return listener
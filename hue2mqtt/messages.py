@@ -1,8 +1,10 @@
 """Schemas for MQTT Messages."""
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 from pydantic import BaseModel
 
+from .schema import GroupInfo, LightInfo, SensorInfo
+
 
 class BridgeInfo(BaseModel):
     """Information about the Hue Bridge."""
@@ -17,3 +19,169 @@ class Hue2MQTTStatus(BaseModel):
 
     online: bool
     bridge: Optional[BridgeInfo] = None
+
+
+class StateQuery(BaseModel):
+    """A filter on a query for the cached state of entities."""
+
+    room: Optional[str] = None
+    reachable: Optional[bool] = None
+    on: Optional[bool] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class QueryError(BaseModel):
+    """Response to a query that could not be answered."""
+
+    error: str
+
+
+class LightList(BaseModel):
+    """Response to a query for lights."""
+
+    lights: List[LightInfo]
+
+
+class GroupList(BaseModel):
+    """Response to a query for groups."""
+
+    groups: List[GroupInfo]
+
+
+class SensorList(BaseModel):
+    """Response to a query for sensors."""
+
+    sensors: List[SensorInfo]
+
+
+class SceneList(BaseModel):
+    """Response to a query for scenes."""
+
+    scenes: Dict[str, Dict[str, Dict[str, Any]]]
+
+
+class SceneRecall(BaseModel):
+    """A request to recall a scene."""
+
+    transitiontime: Optional[int] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class SceneCapture(BaseModel):
+    """
+    A request to capture the current state of lights as a scene.
+
+    The lights are given by uniqueid, or as the lights in a group.
+    """
+
+    lights: List[str] = []
+    group: Optional[int] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class EffectRequest(BaseModel):
+    """
+    A request to run an effect.
+
+    Times are in seconds.
+    """
+
+    effect: Literal["fade", "breathe", "colorloop"]
+    duration: float
+    period: float = 4
+    bri: Optional[int] = None
+    ct: Optional[int] = None
+    xy: Optional[Tuple[float, float]] = None
+    min_bri: int = 1
+    max_bri: int = 254
+    sat: int = 254
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class HistoryQuery(BaseModel):
+    """
+    A query for the recent readings of a sensor.
+
+    If a resolution is given, rollups at that resolution are returned rather
+    than the readings. Times are in seconds.
+    """
+
+    field: Literal["presence", "lightlevel", "temperature", "buttonevent"]
+    resolution: Optional[int] = None
+    since: Optional[float] = None
+
+    class Config:
+        """Pydantic config."""
+
+        extra = "forbid"
+
+
+class HistorySample(BaseModel):
+    """A reading of a sensor, at a UNIX timestamp."""
+
+    time: float
+    value: float
+
+
+class HistoryBucket(BaseModel):
+    """A rollup of the readings of a sensor, from a UNIX timestamp."""
+
+    start: float
+    count: int
+    min: float  # noqa: A003
+    max: float  # noqa: A003
+    mean: float
+
+
+class SensorHistoryReport(BaseModel):
+    """Response to a query for the recent readings of a sensor."""
+
+    uniqueid: str
+    field: str
+    samples: List[HistorySample] = []
+    rollups: List[HistoryBucket] = []
+
+
+class TimingSummary(BaseModel):
+    """Summary of a series of durations, in seconds."""
+
+    count: int = 0
+    total: float = 0
+    last: float = 0
+    max: float = 0  # noqa: A003
+
+
+class Hue2MQTTMetrics(BaseModel):
+    """Metrics about the behaviour of Hue2MQTT."""
+
+    counters: Dict[str, int]
+    timings: Dict[str, TimingSummary]
+
+
+class HALeader(BaseModel):
+    """The current leader of a group of Hue2MQTT instances."""
+
+    instance: Optional[str]
+
+
+class HAEffectsCancelled(BaseModel):
+    """The lights whose effects have been cancelled by a Hue2MQTT instance."""
+
+    instance: str
+    lights: List[int]
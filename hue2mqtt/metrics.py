@@ -0,0 +1,39 @@
+"""
+Runtime Metrics.
+
+Counters and timings that describe the behaviour of Hue2MQTT, so that
+problems such as drift or stalls can be observed over MQTT.
+"""
+from typing import Dict
+
+from .messages import Hue2MQTTMetrics, TimingSummary
+
+
+class Metrics:
+    """A collection of counters and timings."""
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.timings: Dict[str, TimingSummary] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increment a counter."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration."""
+        try:
+            summary = self.timings[name]
+        except KeyError:
+            summary = self.timings[name] = TimingSummary()
+        summary.count += 1
+        summary.total += seconds
+        summary.last = seconds
+        summary.max = max(summary.max, seconds)
+
+    def report(self) -> Hue2MQTTMetrics:
+        """Get a snapshot of the metrics."""
+        return Hue2MQTTMetrics(
+            counters=dict(self.counters),
+            timings={name: summary.copy() for name, summary in self.timings.items()},
+        )
@@ -0,0 +1,61 @@
+"""
+MQTT Payload Encoding.
+
+Payloads are encoded as JSON by default. More compact binary encodings
+can be used if the library for them is installed.
+"""
+from typing import Callable, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+Encoder = Callable[[BaseModel], Union[str, bytes]]
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+
+
+def encode_json(payload: BaseModel) -> str:
+    """Encode a payload as JSON."""
+    return payload.json(by_alias=True, exclude_none=True)
+
+
+def get_encoder(encoding: str) -> Tuple[Encoder, Optional[str]]:
+    """
+    Get the encoder for an encoding.
+
+    Also returns the content type that should be advertised alongside the
+    payload. JSON is not advertised, as it is the default.
+
+    Raises ValueError if the library for the encoding is not installed.
+    """
+    if encoding == "json":
+        return encode_json, None
+
+    if encoding == "msgpack":
+        try:
+            import msgpack
+        except ModuleNotFoundError as e:
+            raise ValueError("msgpack must be installed to use msgpack") from e
+
+        def encode_msgpack(payload: BaseModel) -> bytes:
+            encoded: bytes = msgpack.packb(payload.dict(by_alias=True, exclude_none=True))
+            return encoded
+
+        return encode_msgpack, CONTENT_TYPES[encoding]
+
+    if encoding == "cbor":
+        try:
+            import cbor2
+        except ModuleNotFoundError as e:
+            raise ValueError("cbor2 must be installed to use cbor") from e
+
+        def encode_cbor(payload: BaseModel) -> bytes:
+            encoded: bytes = cbor2.dumps(payload.dict(by_alias=True, exclude_none=True))
+            return encoded
+
+        return encode_cbor, CONTENT_TYPES[encoding]
+
+    raise ValueError(f"Unknown payload encoding: {encoding}")
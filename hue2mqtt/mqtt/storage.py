@@ -0,0 +1,87 @@
+"""
+MQTT Inflight Message Storage.
+
+gmqtt keeps every QoS 1 message that has not been acknowledged by the
+broker, so that it can be resent on reconnection. Tracking them allows
+publishers to wait for the broker to catch up, rather than flooding it.
+"""
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+from gmqtt.storage import PersistentStorage
+
+
+class InflightWindow:
+    """
+    The number of messages that have not been acknowledged.
+
+    A window can be shared by the storage of several connections, so that
+    the limit applies to all of them together.
+    """
+
+    def __init__(self) -> None:
+        self.inflight = 0
+        self._capacity_waiters: List[Tuple[int, asyncio.Future[None]]] = []
+
+    def add(self) -> None:
+        """Count a message that has been sent."""
+        self.inflight += 1
+
+    def remove(self, count: int = 1) -> None:
+        """Count messages that have been acknowledged or discarded."""
+        self.inflight -= count
+        for limit, waiter in self._capacity_waiters:
+            if self.inflight < limit and not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_capacity(self, limit: int) -> None:
+        """Wait until fewer than limit messages have not been acknowledged."""
+        if self.inflight < limit:
+            return
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        entry = (limit, waiter)
+        self._capacity_waiters.append(entry)
+        try:
+            await waiter
+        finally:
+            self._capacity_waiters.remove(entry)
+
+
+class InflightStorage(PersistentStorage):
+    """Storage for unacknowledged messages that can be waited on."""
+
+    def __init__(self, window: Optional[InflightWindow] = None) -> None:
+        super().__init__()
+        self.window = window or InflightWindow()
+        self._mids: Set[int] = set()
+
+    @property
+    def inflight(self) -> int:
+        """The number of messages in this storage that have not been acknowledged."""
+        return len(self._mids)
+
+    def push_message(self, mid: int, raw_package: bytes) -> None:
+        """Store a message until it is acknowledged."""
+        super().push_message(mid, raw_package)
+        if mid not in self._mids:
+            self._mids.add(mid)
+            self.window.add()
+
+    def remove_message_by_mid(self, mid: int) -> None:
+        """Remove a message that has been acknowledged."""
+        super().remove_message_by_mid(mid)
+        if mid in self._mids:
+            self._mids.discard(mid)
+            self.window.remove()
+
+    def clear(self) -> None:
+        """Remove all of the messages."""
+        super().clear()
+        count = len(self._mids)
+        self._mids.clear()
+        self.window.remove(count)
+
+    async def wait_for_capacity(self, limit: int) -> None:
+        """Wait until fewer than limit messages in the window are unacknowledged."""
+        await self.window.wait_for_capacity(limit)
@@ -5,7 +5,7 @@ Allows topic strings to be constructed, along with regex to match them.
 """
 
 from re import compile
-from typing import Dict, Match, Optional, Pattern, Sequence
+from typing import Any, Dict, Match, Optional, Pattern, Sequence, Tuple
 
 
 class Topic:
@@ -13,15 +13,31 @@ class Topic:
     An MQTT Topic.
 
     A topic that may be published or subscribed to.
+
+    Topics are immutable, so the string, hash and regex are only computed once.
     """
 
+    __slots__ = ("parts", "_str", "_hash", "_regex")
+
     WILDCARDS: Dict[str, str] = {
         "+": "([^/]+)",
         "#": "(.+)",
     }
 
+    parts: Tuple[str, ...]
+    _str: str
+    _hash: int
+    _regex: Optional[Pattern[str]]
+
     def __init__(self, parts: Sequence[str]) -> None:
-        self.parts = parts
+        parts = tuple(parts)
+        object.__setattr__(self, "parts", parts)
+        object.__setattr__(self, "_str", "/".join(str(p) for p in parts))
+        object.__setattr__(self, "_hash", hash(parts))
+        object.__setattr__(self, "_regex", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Topic is immutable")
 
     def match(self, topic: str) -> Optional[Match[str]]:
         """Perform a regex match on a topic."""
@@ -45,13 +61,13 @@ class Topic:
         return cls(topic.split("/"))
 
     def __str__(self) -> str:
-        return "/".join(str(p) for p in self.parts)
+        return self._str
 
     def __repr__(self) -> str:
         return f'Topic("{self}")'
 
     def __hash__(self) -> int:
-        return hash(repr(self))
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
         try:
@@ -75,11 +91,15 @@ class Topic:
 
         Any wildcard fields are available as capture groups.
         """
-        handled_parts = []
-        for p in self.parts:
-            try:
-                handled_parts.append(self.WILDCARDS[p])
-            except KeyError:
-                handled_parts.append(p)
-
-        return compile("^" + "/".join(handled_parts) + "$")
+        if self._regex is None:
+            handled_parts = []
+            for p in self.parts:
+                try:
+                    handled_parts.append(self.WILDCARDS[p])
+                except KeyError:
+                    handled_parts.append(p)
+
+            regex = compile("^" + "/".join(handled_parts) + "$")
+            object.__setattr__(self, "_regex", regex)
+            return regex
+        return self._regex
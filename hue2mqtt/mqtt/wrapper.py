@@ -2,6 +2,7 @@
 
 import asyncio
 import logging
+import zlib
 from typing import Any, Callable, Coroutine, Dict, List, Match, Optional
 
 import gmqtt
@@ -9,11 +10,14 @@ from pydantic import BaseModel
 
 from hue2mqtt.config import MQTTBrokerInfo
 
+from .encoding import Encoder, encode_json, get_encoder
+from .storage import InflightStorage, InflightWindow
 from .topic import Topic
 
 LOGGER = logging.getLogger(__name__)
 
 Handler = Callable[[Match[str], str], Coroutine[Any, Any, None]]
+RequestHandler = Callable[[Match[str], str], Coroutine[Any, Any, BaseModel]]
 
 
 class MQTTWrapper:
@@ -39,10 +43,17 @@ class MQTTWrapper:
         self._last_will = last_will
 
         self._topic_handlers: Dict[Topic, Handler] = {}
+        self._request_handlers: Dict[Topic, RequestHandler] = {}
+        self._subscriptions: Dict[Topic, str] = {}
 
+        self._encode, self._content_type = get_encoder(broker_info.payload_encoding)
+
+        self._window = InflightWindow()
+        self._storage = InflightStorage(self._window)
         self._client = gmqtt.Client(
             self._client_name,
             will_message=self.last_will_message,
+            persistent_storage=self._storage,
         )
 
         self._client.reconnect_retries = 0
@@ -50,23 +61,52 @@ class MQTTWrapper:
         self._client.on_message = self.on_message
         self._client.on_connect = self.on_connect
 
+        # The client that owns the subscriptions and last will is also the
+        # first publisher. Any others only publish.
+        self._publishers = [Publisher(self._client)]
+        for i in range(1, broker_info.publisher_connections):
+            client = gmqtt.Client(
+                f"{self._client_name}-publisher-{i}",
+                persistent_storage=InflightStorage(self._window),
+            )
+            client.reconnect_retries = 0
+            client.on_connect = self.on_connect
+            self._publishers.append(Publisher(client))
+
     @property
     def is_connected(self) -> bool:
         """Determine if the client connected to the broker."""
         return self._client.is_connected
 
+    @property
+    def inflight(self) -> int:
+        """The number of published messages that have not been acknowledged."""
+        return self._window.inflight
+
+    async def wait_for_capacity(self, limit: int) -> None:
+        """Wait until fewer than limit published messages are unacknowledged."""
+        await self._window.wait_for_capacity(limit)
+
     @property
     def last_will_message(self) -> Optional[gmqtt.Message]:
         """Last will and testament message for this client."""
         if self._last_will is not None:
             return gmqtt.Message(
                 self.mqtt_prefix + "/" + "status",
-                self._last_will.json(),
+                self._encode(self._last_will),
                 retain=True,
+                **self._content_type_properties,
             )
         else:
             return None
 
+    @property
+    def _content_type_properties(self) -> Dict[str, Any]:
+        """MQTT 5 properties that advertise the payload encoding."""
+        if self._content_type is None:
+            return {}
+        return {"content_type": self._content_type}
+
     @property
     def mqtt_prefix(self) -> str:
         """The topic prefix for MQTT."""
@@ -82,16 +122,22 @@ class MQTTWrapper:
 
         if self._broker_info.enable_auth:
             LOGGER.debug("MQTT Auth enabled")
-            self._client.set_auth_credentials(
-                self._broker_info.username,
-                self._broker_info.password,
-            )
-
-        await self._client.connect(
-            self._broker_info.host,
-            port=self._broker_info.port,
-            ssl=self._broker_info.enable_tls,
-            version=mqtt_version,
+            for publisher in self._publishers:
+                publisher.client.set_auth_credentials(
+                    self._broker_info.username,
+                    self._broker_info.password,
+                )
+
+        await asyncio.gather(
+            *(
+                publisher.client.connect(
+                    self._broker_info.host,
+                    port=self._broker_info.port,
+                    ssl=self._broker_info.enable_tls,
+                    version=mqtt_version,
+                )
+                for publisher in self._publishers
+            ),
         )
 
     async def disconnect(self) -> None:
@@ -101,7 +147,9 @@ class MQTTWrapper:
                 "Attempting disconnection, but client is already disconnected.",
             )
 
-        await self._client.disconnect()
+        await asyncio.gather(
+            *(publisher.client.disconnect() for publisher in self._publishers),
+        )
 
         if self.is_connected:
             raise RuntimeError("Disconnection was attempted, but was unsuccessful")
@@ -114,9 +162,22 @@ class MQTTWrapper:
         properties: Dict[str, List[int]],
     ) -> None:
         """Callback for mqtt connection."""
-        for topic in self._topic_handlers:
-            LOGGER.debug(f"Subscribing to {topic}")
-            client.subscribe(str(topic))
+        broker_alias_maximum = properties.get("topic_alias_maximum", [0])[0]
+        for publisher in self._publishers:
+            if publisher.client is client:
+                # Topic aliases are negotiated with the broker on each connection.
+                publisher.topic_aliases = {}
+                publisher.topic_alias_maximum = min(
+                    self._broker_info.topic_alias_maximum,
+                    broker_alias_maximum,
+                )
+
+        if client is not self._client:
+            return
+
+        for subscription in self._subscriptions.values():
+            LOGGER.debug(f"Subscribing to {subscription}")
+            client.subscribe(subscription)
 
     async def on_message(
         self,
@@ -124,18 +185,69 @@ class MQTTWrapper:
         topic: str,
         payload: bytes,
         qos: int,
-        properties: Dict[str, int],
+        properties: Dict[str, Any],
     ) -> gmqtt.constants.PubRecReasonCode:
         """Callback for mqtt messages."""
-        LOGGER.debug(f"Message received on {topic} with payload: {payload!r}")
+        LOGGER.debug("Message received on %s with payload: %r", topic, payload)
         for t, handler in self._topic_handlers.items():
             match = t.match(topic)
             if match:
-                LOGGER.debug(f"Calling {handler.__name__} to handle {topic}")
+                LOGGER.debug("Calling %s to handle %s", handler.__name__, topic)
                 asyncio.ensure_future(handler(match, payload.decode()))
 
+        for t, request_handler in self._request_handlers.items():
+            match = t.match(topic)
+            if match:
+                LOGGER.debug("Calling %s to handle %s", request_handler.__name__, topic)
+                asyncio.ensure_future(
+                    self._handle_request(
+                        request_handler,
+                        match,
+                        payload.decode(),
+                        topic,
+                        properties,
+                    ),
+                )
+
         return gmqtt.constants.PubRecReasonCode.SUCCESS
 
+    async def _handle_request(
+        self,
+        handler: RequestHandler,
+        match: Match[str],
+        payload: str,
+        topic: str,
+        properties: Dict[str, Any],
+    ) -> None:
+        """
+        Call a request handler and send the response.
+
+        The response is sent to the MQTT 5 response topic of the request,
+        along with any correlation data. If the request does not have a
+        response topic, e.g when using MQTT 3.1.1, the response is sent
+        to the request topic with /response appended.
+        """
+        response = await handler(match, payload)
+
+        response_properties: Dict[str, Any] = {}
+        if "correlation_data" in properties:
+            response_properties["correlation_data"] = properties["correlation_data"][0]
+
+        if "response_topic" in properties:
+            response_topic = properties["response_topic"][0]
+        else:
+            response_topic = f"{topic}/response"
+
+        try:
+            self.publish(
+                response_topic,
+                response,
+                auto_prefix_topic=False,
+                **response_properties,
+            )
+        except ValueError as e:
+            LOGGER.warning(f"Unable to send response to request on {topic}: {e}")
+
     def publish(
         self,
         topic: str,
@@ -143,13 +255,48 @@ class MQTTWrapper:
         *,
         retain: bool = False,
         auto_prefix_topic: bool = True,
+        force_json: bool = False,
+        **properties: Any,
     ) -> None:
-        """Publish a payload to the broker."""
-        if not self.is_connected:
-            LOGGER.error(
-                "Attempted to publish message, but client is not connected.",
-            )
+        """
+        Publish a payload to the broker.
+
+        If force_json is set, the payload is encoded as JSON regardless of
+        the configured payload encoding.
+
+        Topics outside of the prefix, such as the response topics of
+        requests, are not given topic aliases, as they are chosen by clients
+        and may not be published to again.
+
+        Any extra keyword arguments are sent as MQTT 5 properties.
+        """
+        topic_complete = self._publishable_topic(topic, auto_prefix_topic)
+        self._publish(
+            str(topic_complete),
+            payload,
+            retain,
+            properties,
+            encode=encode_json if force_json else None,
+            alias=auto_prefix_topic,
+        )
+
+    def publish_handle(
+        self,
+        topic: str,
+        *,
+        retain: bool = False,
+        auto_prefix_topic: bool = True,
+    ) -> "PublishHandle":
+        """
+        Get a handle to publish to a topic repeatedly.
 
+        The topic is parsed and validated once, rather than on every publish.
+        """
+        topic_complete = self._publishable_topic(topic, auto_prefix_topic)
+        return PublishHandle(self, topic_complete, retain=retain)
+
+    def _publishable_topic(self, topic: str, auto_prefix_topic: bool) -> Topic:
+        """Parse a topic, and check that it can be published to."""
         prefix = self._broker_info.topic_prefix
 
         if len(topic) == 0:
@@ -162,28 +309,153 @@ class MQTTWrapper:
         if not topic_complete.is_publishable:
             raise ValueError(f"Cannot publish to MQTT topic: {topic_complete}")
 
-        self._client.publish(
-            str(topic_complete),
-            payload.json(by_alias=True, exclude_none=True),
+        return topic_complete
+
+    def _publish(
+        self,
+        topic_str: str,
+        payload: BaseModel,
+        retain: bool,
+        properties: Dict[str, Any],
+        *,
+        encode: Optional[Encoder] = None,
+        alias: bool = True,
+    ) -> None:
+        """Publish a payload to a topic that is known to be valid."""
+        if not self.is_connected:
+            LOGGER.error(
+                "Attempted to publish message, but client is not connected.",
+            )
+
+        if len(self._publishers) == 1:
+            publisher = self._publishers[0]
+        else:
+            # Each topic is always published on the same connection, so that
+            # the messages on a topic stay in order.
+            shard = zlib.crc32(topic_str.encode()) % len(self._publishers)
+            publisher = self._publishers[shard]
+
+        if alias and publisher.topic_alias_maximum > 0:
+            topic_str = publisher.apply_topic_alias(topic_str, properties)
+
+        if encode is None:
+            encoded = self._encode(payload)
+            properties = {**self._content_type_properties, **properties}
+        else:
+            encoded = encode(payload)
+
+        publisher.client.publish(
+            topic_str,
+            encoded,
             qos=1,
             retain=retain,
+            **properties,
         )
 
     def subscribe(
         self,
         topic: str,
         callback: Handler,
+        *,
+        share_group: Optional[str] = None,
     ) -> None:
         """
         Subscribe to an MQTT Topic.
 
         Callback is called when a message arrives.
 
+        If a share group is given, an MQTT shared subscription is used, so
+        that each message is only delivered to one client in the group.
+
         Should be called before the MQTT wrapper is connected.
         """
+        topic_complete = self._subscription_topic(topic, share_group)
+        self._topic_handlers[topic_complete] = callback
+
+    def subscribe_request(
+        self,
+        topic: str,
+        callback: RequestHandler,
+        *,
+        share_group: Optional[str] = None,
+    ) -> None:
+        """
+        Subscribe to an MQTT Topic that expects a response.
+
+        Callback is called when a request arrives, and the returned
+        payload is sent back to the requester.
+
+        If a share group is given, an MQTT shared subscription is used, so
+        that each request is only answered by one client in the group.
+
+        Should be called before the MQTT wrapper is connected.
+        """
+        topic_complete = self._subscription_topic(topic, share_group)
+        self._request_handlers[topic_complete] = callback
+
+    def _subscription_topic(self, topic: str, share_group: Optional[str]) -> Topic:
+        """Parse a topic to subscribe to, and record the subscription."""
         if len(topic) == 0:
             topic_complete = Topic.parse(self.mqtt_prefix)
         else:
             topic_complete = Topic.parse(f"{self._broker_info.topic_prefix}/{topic}")
 
-        self._topic_handlers[topic_complete] = callback
+        if share_group is None:
+            self._subscriptions[topic_complete] = str(topic_complete)
+        else:
+            self._subscriptions[topic_complete] = f"$share/{share_group}/{topic_complete}"
+
+        return topic_complete
+
+
+class Publisher:
+    """A connection to the broker that is used to publish messages."""
+
+    def __init__(self, client: gmqtt.Client) -> None:
+        self.client = client
+        self.topic_alias_maximum = 0
+        self.topic_aliases: Dict[str, int] = {}
+
+    def apply_topic_alias(self, topic: str, properties: Dict[str, Any]) -> str:
+        """
+        Use an MQTT 5 topic alias for a topic, if one is available.
+
+        Aliases are allocated to topics in the order that they are first
+        published until the negotiated maximum is reached. The first publish
+        to a topic sends the full topic along with its new alias, after which
+        the topic is omitted.
+
+        Returns the topic string that should be sent.
+        """
+        alias = self.topic_aliases.get(topic)
+        if alias is not None:
+            properties["topic_alias"] = alias
+            return ""
+
+        if len(self.topic_aliases) < self.topic_alias_maximum:
+            alias = len(self.topic_aliases) + 1
+            self.topic_aliases[topic] = alias
+            properties["topic_alias"] = alias
+        return topic
+
+
+class PublishHandle:
+    """
+    A validated topic that can be published to repeatedly.
+
+    Obtained from MQTTWrapper.publish_handle.
+    """
+
+    def __init__(self, wrapper: MQTTWrapper, topic: Topic, *, retain: bool) -> None:
+        self.topic = topic
+        self.retain = retain
+        self._wrapper = wrapper
+        self._topic_str = str(topic)
+
+    def publish(self, payload: BaseModel, **properties: Any) -> None:
+        """
+        Publish a payload to the topic.
+
+        Any extra keyword arguments are sent as MQTT 5 properties.
+        """
+        self._wrapper._publish(self._topic_str, payload, self.retain, properties)
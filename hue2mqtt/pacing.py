@@ -0,0 +1,30 @@
+"""
+Request Pacing.
+
+The Hue Bridge can only handle around ten light commands, or one group
+command, per second. Requests beyond that are delayed or dropped by the
+bridge, so bursts of commands are spread out to stay within its limits.
+"""
+import asyncio
+import time
+
+
+class Pacer:
+    """
+    Space out requests, so that they stay within a rate limit.
+
+    Each request reserves the next free slot, so that concurrent requests
+    are sent at a steady rate, rather than all at once.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next_slot = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the next free slot."""
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
@@ -0,0 +1,95 @@
+"""
+Runtime Configuration.
+
+Creates the event loop, and manages the pool of workers that CPU-heavy
+batches of work can be offloaded to, so that the event loop is kept free
+to handle events and commands.
+"""
+import asyncio
+import logging
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from .config import RuntimeInfo
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+
+def create_event_loop(implementation: str) -> asyncio.AbstractEventLoop:
+    """
+    Create an event loop using the given implementation.
+
+    uvloop is used if requested and installed, otherwise the default asyncio
+    event loop is used.
+    """
+    if implementation == "uvloop":
+        try:
+            import uvloop
+        except ModuleNotFoundError:
+            LOGGER.warning("uvloop is not installed, using the asyncio event loop")
+        else:
+            loop: asyncio.AbstractEventLoop = uvloop.new_event_loop()
+            return loop
+    return asyncio.new_event_loop()
+
+
+def build_models(
+    model: Type[M],
+    items: List[Tuple[str, Dict[str, Any]]],
+) -> Tuple[List[M], List[Tuple[str, str]]]:
+    """
+    Build a model for each of the raw items from the bridge.
+
+    Items that are invalid are skipped, so that they do not prevent the
+    others from being built. The ID of each is returned along with the
+    error, so that they can be logged by the caller.
+
+    This is a module level function, so that it can be sent to a process pool.
+    """
+    models: List[M] = []
+    errors: List[Tuple[str, str]] = []
+    for idx, raw in items:
+        try:
+            models.append(model(id=idx, **raw))
+        except ValidationError as e:
+            errors.append((idx, str(e)))
+    return models, errors
+
+
+class Offloader:
+    """Run batches of CPU-heavy work in a pool of workers."""
+
+    def __init__(self, settings: RuntimeInfo) -> None:
+        self._executor: Optional[Executor] = None
+        workers = settings.workers or None
+        if settings.executor == "thread":
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="hue2mqtt")
+        elif settings.executor == "process":
+            self._executor = ProcessPoolExecutor(workers)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run a function in the pool of workers.
+
+        If there is no pool, the function is run immediately.
+        """
+        if self._executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    def shutdown(self) -> None:
+        """Stop the workers."""
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,124 @@
+"""
+Local Scenes.
+
+Scenes are stored by hue2mqtt rather than on the bridge. They are either
+defined in the config file, or captured from the current state of the
+lights. Recalling a scene uses as few commands to the bridge as possible.
+"""
+import json
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .schema import GroupInfo, LightSetState, LightState
+
+# The command to set each light in a scene to, by the uniqueid of the light.
+Scene = Dict[str, Dict[str, Any]]
+
+# The field that sets the colour of a light, by its colour mode.
+COLOR_MODE_FIELDS = {
+    "ct": ("ct",),
+    "hs": ("hue", "sat"),
+    "xy": ("xy",),
+}
+
+
+class RecallPlan(NamedTuple):
+    """The commands that recall a scene, by group or light ID."""
+
+    groups: List[Tuple[int, Dict[str, Any]]]
+    lights: List[Tuple[int, Dict[str, Any]]]
+
+
+def capture_state(state: LightState) -> Dict[str, Any]:
+    """
+    Get the command that would return a light to its current state.
+
+    Only the colour of the current colour mode is captured, as the others
+    are not in effect. If the colour mode is unknown, the xy colour is
+    captured, as the bridge reports it in every colour mode.
+    """
+    if not state.on:
+        return {"on": False}
+
+    command: Dict[str, Any] = {"on": True}
+    fields = ["bri", *COLOR_MODE_FIELDS.get(state.color_mode or "xy", ())]
+    for field in fields:
+        value = getattr(state, field)
+        if value is not None:
+            command[field] = value
+    return command
+
+
+def plan_recall(
+    commands: Dict[int, Dict[str, Any]],
+    groups: Iterable[GroupInfo],
+) -> RecallPlan:
+    """
+    Plan the fewest commands that set the lights of a scene.
+
+    Lights that are set to the same state are set by a single group action,
+    if a group contains exactly those lights. The remaining lights are set
+    one at a time.
+    """
+    lights_by_command: Dict[str, List[int]] = {}
+    for light_id, command in commands.items():
+        key = json.dumps(command, sort_keys=True)
+        lights_by_command.setdefault(key, []).append(light_id)
+
+    group_ids = {frozenset(group.lights): group.id for group in groups}
+    plan = RecallPlan(groups=[], lights=[])
+    for light_ids in lights_by_command.values():
+        command = commands[light_ids[0]]
+        group_id = group_ids.get(frozenset(light_ids))
+        if group_id is not None and len(light_ids) > 1:
+            plan.groups.append((group_id, command))
+        else:
+            plan.lights.extend((light_id, command) for light_id in sorted(light_ids))
+    return plan
+
+
+class SceneStore:
+    """
+    The scenes that can be recalled.
+
+    Captured scenes are kept in memory, separately from the scenes in the
+    config file. They replace any scene of the same name from the config
+    file until the config is reloaded.
+    """
+
+    def __init__(self, definitions: Dict[str, Dict[str, LightSetState]]) -> None:
+        self._defined: Dict[str, Scene] = {}
+        self._captured: Dict[str, Scene] = {}
+        self.load(definitions)
+
+    def load(self, definitions: Dict[str, Dict[str, LightSetState]]) -> None:
+        """
+        Load the scenes that are defined in the config file.
+
+        Scenes that are no longer defined are removed, and captured scenes
+        are kept unless the config file defines a scene of the same name.
+        """
+        self._defined = {
+            name: {
+                uniqueid: state.dict(exclude_none=True)
+                for uniqueid, state in states.items()
+            }
+            for name, states in definitions.items()
+        }
+        for name in self._defined:
+            self._captured.pop(name, None)
+
+    @property
+    def scenes(self) -> Dict[str, Scene]:
+        """All of the scenes, by name."""
+        return {**self._defined, **self._captured}
+
+    def get(self, name: str) -> Optional[Scene]:
+        """Get a scene by name."""
+        scene = self._captured.get(name)
+        if scene is None:
+            scene = self._defined.get(name)
+        return scene
+
+    def capture(self, name: str, scene: Scene) -> None:
+        """Store a scene that has been captured."""
+        self._captured[name] = scene
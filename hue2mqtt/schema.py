@@ -135,6 +135,7 @@ class OpenCloseSensorState(GenericSensorState):
 
 SensorState = create_model(
     "SensorState",
+    __module__=__name__,
     __base__=(
         LightLevelSensorState,
         PresenceSensorState,
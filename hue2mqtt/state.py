@@ -0,0 +1,180 @@
+"""
+In-memory State Cache.
+
+Holds the last known state of every entity that has been published,
+so that reads can be answered without a round trip to the Hue Bridge.
+"""
+from typing import Dict, List, Optional, Set
+
+from .messages import StateQuery
+from .schema import GroupInfo, GroupState, LightInfo, SensorInfo
+
+
+class StateCache:
+    """The last known state of the entities on the Hue Bridge."""
+
+    def __init__(self) -> None:
+        self.lights: Dict[str, LightInfo] = {}
+        self.groups: Dict[int, GroupInfo] = {}
+        self.sensors: Dict[str, SensorInfo] = {}
+
+        self._light_uniqueids: Dict[int, str] = {}
+        self._sensor_uniqueids: Dict[int, str] = {}
+        self._light_groups: Dict[int, Set[int]] = {}
+        self._light_names: Dict[str, Set[str]] = {}
+        self._light_types: Dict[str, Set[str]] = {}
+        self._room_names: Dict[str, Set[int]] = {}
+
+    def update_light(self, light: LightInfo) -> None:
+        """Store the latest state of a light."""
+        old_light = self.lights.get(light.uniqueid)
+        if old_light is not None:
+            self._light_names.get(old_light.name, set()).discard(light.uniqueid)
+            self._light_types.get(old_light.type, set()).discard(light.uniqueid)
+
+        self.lights[light.uniqueid] = light
+        self._light_uniqueids[light.id] = light.uniqueid
+        self._light_names.setdefault(light.name, set()).add(light.uniqueid)
+        self._light_types.setdefault(light.type, set()).add(light.uniqueid)
+
+    def update_group(self, group: GroupInfo) -> None:
+        """Store the latest state of a group."""
+        old_group = self.groups.get(group.id)
+        if old_group is not None:
+            if old_group.lights != group.lights:
+                for light_id in old_group.lights:
+                    self._light_groups.get(light_id, set()).discard(group.id)
+            self._room_names.get(old_group.name, set()).discard(group.id)
+
+        self.groups[group.id] = group
+        for light_id in group.lights:
+            self._light_groups.setdefault(light_id, set()).add(group.id)
+        if group.type == "Room":
+            self._room_names.setdefault(group.name, set()).add(group.id)
+
+    def update_sensor(self, sensor: SensorInfo) -> None:
+        """Store the latest state of a sensor."""
+        self.sensors[sensor.uniqueid] = sensor
+        self._sensor_uniqueids[sensor.id] = sensor.uniqueid
+
+    def remove_light(self, uniqueid: str) -> None:
+        """Forget a light."""
+        light = self.lights.pop(uniqueid, None)
+        if light is not None:
+            self._light_uniqueids.pop(light.id, None)
+            self._light_names.get(light.name, set()).discard(uniqueid)
+            self._light_types.get(light.type, set()).discard(uniqueid)
+
+    def remove_group(self, group_id: int) -> None:
+        """Forget a group."""
+        group = self.groups.pop(group_id, None)
+        if group is not None:
+            for light_id in group.lights:
+                self._light_groups.get(light_id, set()).discard(group_id)
+            self._room_names.get(group.name, set()).discard(group_id)
+
+    def remove_sensor(self, uniqueid: str) -> None:
+        """Forget a sensor."""
+        sensor = self.sensors.pop(uniqueid, None)
+        if sensor is not None:
+            self._sensor_uniqueids.pop(sensor.id, None)
+
+    def light_by_id(self, light_id: int) -> Optional[LightInfo]:
+        """Get a light by its bridge ID."""
+        try:
+            return self.lights[self._light_uniqueids[light_id]]
+        except KeyError:
+            return None
+
+    def sensor_by_id(self, sensor_id: int) -> Optional[SensorInfo]:
+        """Get a sensor by its bridge ID."""
+        try:
+            return self.sensors[self._sensor_uniqueids[sensor_id]]
+        except KeyError:
+            return None
+
+    def lights_named(self, name: str) -> List[LightInfo]:
+        """Get the lights with a given name."""
+        return [self.lights[uniqueid] for uniqueid in self._light_names.get(name, ())]
+
+    def lights_of_type(self, light_type: str) -> List[LightInfo]:
+        """Get the lights of a given type, e.g Extended color light."""
+        uniqueids = self._light_types.get(light_type, ())
+        return [self.lights[uniqueid] for uniqueid in uniqueids]
+
+    def rooms_named(self, room: str) -> List[GroupInfo]:
+        """Get the rooms with a given name."""
+        return [self.groups[group_id] for group_id in self._room_names.get(room, ())]
+
+    def groups_with_light(self, light_id: int) -> List[GroupInfo]:
+        """Get the groups that contain a light."""
+        return [
+            self.groups[group_id] for group_id in self._light_groups.get(light_id, ())
+        ]
+
+    def derive_group_state(self, group: GroupInfo) -> Optional[GroupState]:
+        """
+        Derive the state of a group from the cached state of its lights.
+
+        Returns None if the state of any of the lights is unknown.
+        """
+        states = []
+        for light_id in group.lights:
+            light = self.light_by_id(light_id)
+            if light is None or light.state is None:
+                return None
+            states.append(bool(light.state.on))
+
+        return GroupState(all_on=all(states), any_on=any(states))
+
+    def _room_members(self, room: str, attr: str) -> Set[int]:
+        """Get the ids of the lights or sensors in the rooms with a given name."""
+        members: Set[int] = set()
+        for group in self.rooms_named(room):
+            members.update(getattr(group, attr))
+        return members
+
+    def query_lights(self, query: StateQuery) -> List[LightInfo]:
+        """Find the lights that match a query."""
+        lights = list(self.lights.values())
+        if query.room is not None:
+            members = self._room_members(query.room, "lights")
+            lights = [light for light in lights if light.id in members]
+        if query.reachable is not None:
+            lights = [
+                light
+                for light in lights
+                if light.state is not None and light.state.reachable == query.reachable
+            ]
+        if query.on is not None:
+            lights = [
+                light
+                for light in lights
+                if light.state is not None and bool(light.state.on) == query.on
+            ]
+        return lights
+
+    def query_groups(self, query: StateQuery) -> List[GroupInfo]:
+        """
+        Find the groups that match a query.
+
+        A group is considered to be on if any of its lights are on.
+        """
+        groups = list(self.groups.values())
+        if query.room is not None:
+            groups = [group for group in groups if group.name == query.room]
+        if query.reachable is not None:
+            raise ValueError("Groups cannot be filtered by reachable")
+        if query.on is not None:
+            groups = [group for group in groups if group.state.any_on == query.on]
+        return groups
+
+    def query_sensors(self, query: StateQuery) -> List[SensorInfo]:
+        """Find the sensors that match a query."""
+        sensors = list(self.sensors.values())
+        if query.room is not None:
+            members = self._room_members(query.room, "sensors")
+            sensors = [sensor for sensor in sensors if sensor.id in members]
+        if query.reachable is not None or query.on is not None:
+            raise ValueError("Sensors can only be filtered by room")
+        return sensors
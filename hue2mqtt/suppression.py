@@ -0,0 +1,103 @@
+"""
+Redundant Command Suppression.
+
+Automations often repeat commands, e.g sending {"on": true} every minute.
+The bridge can only handle a limited number of commands, so fields that
+would not change the last known state of the lights are not sent to it.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .schema import LightState
+
+# Fields that set the state of a light, and the colour mode that they apply to.
+COMPARABLE_FIELDS: Dict[str, Optional[str]] = {
+    "on": None,
+    "bri": None,
+    "effect": None,
+    "ct": "ct",
+    "hue": "hs",
+    "sat": "hs",
+    "xy": "xy",
+}
+
+# Fields that only modify how the other fields are applied.
+MODIFIER_FIELDS = {"transitiontime"}
+
+
+def is_redundant(field: str, value: Any, state: LightState) -> bool:
+    """
+    Determine whether setting a field would not change the state of a light.
+
+    The state of unreachable lights is not trusted, and colours are only
+    compared if the light is in the colour mode that they apply to.
+    """
+    if field not in COMPARABLE_FIELDS or state.reachable is False:
+        return False
+
+    color_mode = COMPARABLE_FIELDS[field]
+    if color_mode is not None and state.color_mode != color_mode:
+        return False
+
+    current = getattr(state, field)
+    if field == "xy" and current is not None:
+        return tuple(current) == tuple(value)
+    return bool(current == value)
+
+
+def remove_redundant(
+    command: Dict[str, Any],
+    states: List[LightState],
+) -> Dict[str, Any]:
+    """
+    Remove the fields of a command that would not change any of the lights.
+
+    If only modifiers would remain, the whole command is redundant and an
+    empty command is returned. If the states of the lights are unknown,
+    the command is returned unchanged.
+    """
+    if not states:
+        return command
+
+    remaining = {
+        field: value
+        for field, value in command.items()
+        if not all(is_redundant(field, value, state) for state in states)
+    }
+    if remaining.keys() <= MODIFIER_FIELDS:
+        return {}
+    return remaining
+
+
+class PendingCommands:
+    """
+    The lights that have recently been sent a command.
+
+    The cached state of a light is not updated until the bridge sends an
+    event, so it cannot be trusted for a while after each command. Otherwise
+    a command that undoes the previous one would be suppressed.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self._deadlines: Dict[int, float] = {}
+
+    def add(self, light_ids: Iterable[int]) -> None:
+        """Record that a command has been sent to some lights."""
+        deadline = time.monotonic() + self.timeout
+        for light_id in light_ids:
+            self._deadlines[light_id] = deadline
+
+    def any_pending(self, light_ids: Iterable[int]) -> bool:
+        """Determine whether any of the lights have a recent command."""
+        now = time.monotonic()
+        pending = False
+        for light_id in light_ids:
+            deadline = self._deadlines.get(light_id)
+            if deadline is None:
+                continue
+            if deadline > now:
+                pending = True
+            else:
+                del self._deadlines[light_id]
+        return pending
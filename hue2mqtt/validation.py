@@ -0,0 +1,81 @@
+"""
+Command Payload Validation.
+
+Commands are usually small, e.g {"on": true}, so validating them by
+constructing a model and converting it back to a dictionary does far more
+work than is needed. Instead, only the keys that are present are validated.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Type
+
+from pydantic import BaseModel, ValidationError
+from pydantic.error_wrappers import ErrorList, ErrorWrapper
+from pydantic.errors import ExtraError
+
+# Types whose values are already valid if they have exactly that type.
+FAST_PATH_TYPES = (bool, int, float, str)
+
+
+class SetStateValidator:
+    """
+    Validates the payload of a command against a schema.
+
+    Values of the expected type are accepted as they are. Any other value is
+    validated by the schema field, so the result is the same as validating
+    the whole model. Unknown keys are rejected.
+    """
+
+    def __init__(self, model: Type[BaseModel]) -> None:
+        self._model = model
+        self._fields = model.__fields__
+        self._fast_path_types = {
+            name: field.outer_type_
+            for name, field in self._fields.items()
+            if field.outer_type_ in FAST_PATH_TYPES
+        }
+
+    def validate(self, data: Any) -> Dict[str, Any]:
+        """
+        Validate a decoded payload in a single pass.
+
+        Returns the valid fields that were set, ready to be used as keyword
+        arguments for the bridge.
+
+        Raises TypeError if the payload is not a dictionary, and
+        ValidationError if any of the fields are invalid.
+        """
+        if not isinstance(data, dict):
+            raise TypeError(f"Expected dictionary, got {type(data).__name__}")
+
+        state: Dict[str, Any] = {}
+        errors: List[ErrorList] = []
+        for key, value in data.items():
+            if type(value) is self._fast_path_types.get(key):
+                state[key] = value
+                continue
+
+            try:
+                field = self._fields[key]
+            except KeyError:
+                errors.append(ErrorWrapper(ExtraError(), loc=key))
+                continue
+
+            if value is None:
+                continue
+
+            value, error = field.validate(value, state, loc=key, cls=self._model)
+            if error:
+                errors.append(error)
+            else:
+                state[key] = value
+
+        if errors:
+            raise ValidationError(errors, self._model)
+
+        return state
+
+
+@lru_cache(maxsize=None)
+def get_validator(model: Type[BaseModel]) -> SetStateValidator:
+    """Get the validator for a schema, creating it on first use."""
+    return SetStateValidator(model)
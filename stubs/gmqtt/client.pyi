@@ -51,10 +51,10 @@ class Client:
     def is_connected(self) -> bool: ...
 
     @property
-    def on_message(self) -> Callable[[Client, str, bytes, int, Dict[str, int]], Coroutine[Any, Any, PubRecReasonCode]]: ...
+    def on_message(self) -> Callable[[Client, str, bytes, int, Dict[str, Any]], Coroutine[Any, Any, PubRecReasonCode]]: ...
 
     @on_message.setter
-    def on_message(self, f: Callable[[Client, str, bytes, int, Dict[str, int]], Coroutine[Any, Any, PubRecReasonCode]]) -> None: ...
+    def on_message(self, f: Callable[[Client, str, bytes, int, Dict[str, Any]], Coroutine[Any, Any, PubRecReasonCode]]) -> None: ...
 
     @property
     def on_connect(self) -> Callable[[Client, int, int, Dict[str, List[int]]], None]: ...
@@ -110,4 +110,5 @@ class Client:
         payloadOptional: Optional[Union[List[Any], Tuple[Any, ...], Dict[Any, Any], int, float, str, bytes]] = None,
         qos: int = 0,
         retain: bool = False,
+        **kwargs: Any,
     ) -> None: ...
@@ -0,0 +1,7 @@
+"""Stubs for gmqtt.mqtt.handler."""
+
+class MQTTError(Exception): ...
+
+class MQTTConnectError(MQTTError):
+    message: str
+    def __init__(self, code: int) -> None: ...
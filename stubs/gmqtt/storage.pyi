@@ -0,0 +1,11 @@
+"""Stubs for gmqtt.storage."""
+from typing import List, Tuple
+
+class PersistentStorage:
+    def __init__(self) -> None: ...
+    def push_message(self, mid: int, raw_package: bytes) -> None: ...
+    def remove_message_by_mid(self, mid: int) -> None: ...
+    @property
+    def is_empty(self) -> bool: ...
+    def clear(self) -> None: ...
+    def get_all(self) -> List[Tuple[int, bytes]]: ...
@@ -0,0 +1,42 @@
+"""Test MQTT payload encoding."""
+
+import pytest
+from pydantic import BaseModel
+
+from hue2mqtt.mqtt.encoding import get_encoder
+
+
+class StubModel(BaseModel):
+    """Test BaseModel."""
+
+    foo: str
+    bar: int = 3
+
+
+def test_json_encoding() -> None:
+    """Test that JSON is the default and is not advertised."""
+    encode, content_type = get_encoder("json")
+    assert encode(StubModel(foo="bees")) == '{"foo": "bees", "bar": 3}'
+    assert content_type is None
+
+
+def test_msgpack_encoding() -> None:
+    """Test that payloads can be encoded with msgpack."""
+    msgpack = pytest.importorskip("msgpack")
+    encode, content_type = get_encoder("msgpack")
+    assert msgpack.unpackb(encode(StubModel(foo="bees"))) == {"foo": "bees", "bar": 3}
+    assert content_type == "application/msgpack"
+
+
+def test_cbor_encoding() -> None:
+    """Test that payloads can be encoded with CBOR."""
+    cbor2 = pytest.importorskip("cbor2")
+    encode, content_type = get_encoder("cbor")
+    assert cbor2.loads(encode(StubModel(foo="bees"))) == {"foo": "bees", "bar": 3}
+    assert content_type == "application/cbor"
+
+
+def test_unknown_encoding() -> None:
+    """Test that an unknown encoding is rejected."""
+    with pytest.raises(ValueError):
+        get_encoder("bees")
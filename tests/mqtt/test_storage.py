@@ -0,0 +1,39 @@
+"""Test the inflight message storage."""
+
+import asyncio
+
+import pytest
+
+from hue2mqtt.mqtt.storage import InflightStorage
+
+
+def test_inflight_count() -> None:
+    """Test that unacknowledged messages are counted."""
+    storage = InflightStorage()
+    storage.push_message(1, b"foo")
+    storage.push_message(2, b"bar")
+    assert storage.inflight == 2
+
+    storage.remove_message_by_mid(1)
+    storage.remove_message_by_mid(1)
+    assert storage.inflight == 1
+
+    storage.clear()
+    assert storage.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_for_capacity() -> None:
+    """Test that waiters are woken once there is capacity."""
+    storage = InflightStorage()
+    await storage.wait_for_capacity(1)
+
+    storage.push_message(1, b"foo")
+    storage.push_message(2, b"bar")
+    waiter = asyncio.ensure_future(storage.wait_for_capacity(2))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    storage.remove_message_by_mid(1)
+    await asyncio.wait_for(waiter, 1)
+    assert storage.window._capacity_waiters == []
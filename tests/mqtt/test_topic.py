@@ -112,3 +112,10 @@ def test_topic_match() -> None:
         t = Topic(parts)
         assert t.match(example)
         assert not t.match("u85932q4fds9/3£2####")
+
+
+def test_topic_immutable() -> None:
+    """Test that topics cannot be modified after construction."""
+    t = Topic(["bees"])
+    with pytest.raises(AttributeError):
+        t.parts = ("hive",)
@@ -1,7 +1,7 @@
 """Test the MQTT Wrapper class."""
 
 import asyncio
-from typing import Match
+from typing import Callable, Dict, List, Match, Tuple
 
 import gmqtt
 import pytest
@@ -181,3 +181,178 @@ async def test_publish_bad_topic_error() -> None:
         wr_pub.publish("bees/", StubModel(foo="bar"))
 
     await wr_pub.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_request_response() -> None:
+    """Test that the response to a request is sent to the response topic."""
+    published = asyncio.Event()
+    calls = []
+
+    async def test_handler(
+        match: Match[str],
+        payload: str,
+    ) -> BaseModel:
+        return StubModel(foo=match.group(1))
+
+    def publish(topic: str, payload: str, **kwargs: object) -> None:
+        calls.append((topic, payload, kwargs))
+        published.set()
+
+    wr = MQTTWrapper("foo", BROKER_INFO)
+    wr.subscribe_request("get/+", test_handler)
+    wr._client.publish = publish  # type: ignore[assignment,method-assign]
+
+    await wr.on_message(
+        wr._client,
+        "hue2mqtt/get/bees",
+        b"",
+        0,
+        {"response_topic": ["replies/1"], "correlation_data": [b"abc"]},
+    )
+    await asyncio.wait_for(published.wait(), 0.1)
+
+    topic, payload, kwargs = calls[0]
+    assert topic == "replies/1"
+    assert payload == '{"foo": "bees"}'
+    assert kwargs["correlation_data"] == b"abc"
+
+
+@pytest.mark.asyncio
+async def test_request_bad_response_topic() -> None:
+    """Test that a request with an unpublishable response topic is not answered."""
+    handled = asyncio.Event()
+
+    async def test_handler(
+        match: Match[str],
+        payload: str,
+    ) -> BaseModel:
+        handled.set()
+        return StubModel(foo=match.group(1))
+
+    def publish(topic: str, payload: str, **kwargs: object) -> None:
+        pytest.fail("A response was published")
+
+    wr = MQTTWrapper("foo", BROKER_INFO)
+    wr._client.publish = publish  # type: ignore[assignment,method-assign]
+    match = Topic.parse("hue2mqtt/get/+").match("hue2mqtt/get/bees")
+    assert match is not None
+
+    await wr._handle_request(
+        test_handler,
+        match,
+        "",
+        "hue2mqtt/get/bees",
+        {"response_topic": ["replies/+"]},
+    )
+    assert handled.is_set()
+
+
+def test_publish_topic_aliases() -> None:
+    """Test that topic aliases are used once negotiated with the broker."""
+    calls = []
+
+    def publish(topic: str, payload: str, **kwargs: object) -> None:
+        calls.append((topic, kwargs.get("topic_alias")))
+
+    broker_info = MQTTBrokerInfo(host="localhost", port=1883, topic_alias_maximum=1)
+    wr = MQTTWrapper("foo", broker_info)
+    wr._client.publish = publish  # type: ignore[assignment,method-assign]
+    wr.on_connect(wr._client, 0, 0, {"topic_alias_maximum": [10]})
+
+    wr.publish("replies/1", StubModel(foo="bar"), auto_prefix_topic=False)
+    wr.publish("bees/1", StubModel(foo="bar"))
+    wr.publish("bees/1", StubModel(foo="bar"))
+    wr.publish("bees/2", StubModel(foo="bar"))
+
+    # Response topics chosen by clients do not use up the aliases
+    assert calls == [
+        ("replies/1", None),
+        ("hue2mqtt/bees/1", 1),
+        ("", 1),
+        ("hue2mqtt/bees/2", None),
+    ]
+
+
+def test_publish_handle() -> None:
+    """Test that a publish handle publishes to its topic."""
+    calls = []
+
+    def publish(topic: str, payload: str, **kwargs: object) -> None:
+        calls.append((topic, payload, kwargs.get("retain")))
+
+    wr = MQTTWrapper("foo", BROKER_INFO)
+    wr._client.publish = publish  # type: ignore[assignment,method-assign]
+
+    handle = wr.publish_handle("bees/1", retain=True)
+    assert handle.topic == Topic(["hue2mqtt", "bees", "1"])
+    handle.publish(StubModel(foo="bar"))
+
+    assert calls == [("hue2mqtt/bees/1", '{"foo": "bar"}', True)]
+
+
+def test_publish_handle_bad_topic_error() -> None:
+    """Test that a handle cannot be obtained for an invalid topic."""
+    wr = MQTTWrapper("foo", BROKER_INFO)
+
+    with pytest.raises(ValueError):
+        wr.publish_handle("bees/+")
+
+
+def test_subscribe_shared() -> None:
+    """Test that shared subscriptions are used when a share group is given."""
+    subscriptions = []
+
+    def subscribe(topic: str) -> None:
+        subscriptions.append(topic)
+
+    wr = MQTTWrapper("foo", BROKER_INFO)
+    wr.subscribe("bees/+", stub_message_handler, share_group="hive")
+    wr.subscribe("wasps", stub_message_handler)
+    wr._client.subscribe = subscribe  # type: ignore[assignment,method-assign]
+    wr.on_connect(wr._client, 0, 0, {})
+
+    assert subscriptions == ["$share/hive/hue2mqtt/bees/+", "hue2mqtt/wasps"]
+
+
+def test_publisher_pool() -> None:
+    """Test that topics are sharded across a pool of publisher connections."""
+    calls: List[Tuple[str, str]] = []
+    subscriptions = []
+
+    broker_info = MQTTBrokerInfo(host="localhost", port=1883, publisher_connections=3)
+    wr = MQTTWrapper("foo", broker_info)
+    wr.subscribe("wasps", stub_message_handler)
+    assert [publisher.client._client_id for publisher in wr._publishers] == [
+        "foo",
+        "foo-publisher-1",
+        "foo-publisher-2",
+    ]
+
+    def recorder(client_id: str) -> Callable[..., None]:
+        def publish(topic: str, payload: str, **kwargs: object) -> None:
+            calls.append((client_id, topic))
+
+        return publish
+
+    def subscribe(topic: str) -> None:
+        subscriptions.append(topic)
+
+    for publisher in wr._publishers:
+        publisher.client.publish = recorder(  # type: ignore[method-assign]
+            publisher.client._client_id,
+        )
+        publisher.client.subscribe = subscribe  # type: ignore[assignment,method-assign]
+        wr.on_connect(publisher.client, 0, 0, {})
+
+    # Only the main connection subscribes
+    assert subscriptions == ["hue2mqtt/wasps"]
+
+    for i in range(10):
+        wr.publish(f"bees/{i}", StubModel(foo="bar"))
+        wr.publish(f"bees/{i}", StubModel(foo="bar"))
+
+    shards: Dict[str, str] = {}
+    for client_id, topic in calls:
+        assert shards.setdefault(topic, client_id) == client_id
+    assert len(set(shards.values())) > 1
@@ -0,0 +1,208 @@
+"""Test the processing of the CLIP v2 event stream."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List
+from unittest.mock import AsyncMock
+
+import aiohttp
+import aiohue
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from pydantic import parse_obj_as
+
+from hue2mqtt.clip import (
+    apply_group_update,
+    apply_light_update,
+    apply_sensor_update,
+    fetch_resources,
+    index_buttons,
+    parse_id_v1,
+    stream_updates,
+    to_bri,
+)
+from hue2mqtt.schema import GroupInfo, LightInfo, SensorInfo
+
+LIGHT = parse_obj_as(
+    LightInfo,
+    {
+        "id": 1,
+        "name": "Lounge Lamp",
+        "uniqueid": "00:17:88:01:ab:cd:ef:01-0b",
+        "state": {"on": False, "bri": 153, "ct": 366, "colormode": "ct"},
+        "manufacturername": "Signify Netherlands B.V.",
+        "modelid": "LCT012",
+        "productname": "Hue color candle",
+        "type": "Extended color light",
+        "swversion": "1.50.2_r30933",
+    },
+)
+
+SWITCH = parse_obj_as(
+    SensorInfo,
+    {
+        "id": 5,
+        "name": "Dimmer",
+        "type": "ZLLSwitch",
+        "modelid": "RWL021",
+        "manufacturername": "Signify Netherlands B.V.",
+        "productname": "Hue dimmer switch",
+        "uniqueid": "00:17:88:01:10:5c:6e:9f-02-fc00",
+        "swversion": "6.1.1.28573",
+        "state": {"buttonevent": 1002, "lastupdated": "2021-01-01T00:00:00"},
+    },
+)
+
+BUTTON_ID = "3ff8e2ae-7c3a-4ba6-a8bc-7fcf5a6e3b29"
+
+
+def event(resource: Dict[str, Any]) -> str:
+    """Encode an update to a resource as a server-sent event."""
+    return json.dumps([{"type": "update", "data": [resource]}])
+
+
+@pytest_asyncio.fixture
+async def bridge() -> AsyncIterator[aiohue.Bridge]:
+    """An aiohue bridge connected to a stand-in CLIP v2 event stream."""
+    requests: List[Dict[str, str]] = []
+
+    async def eventstream(request: web.Request) -> web.StreamResponse:
+        requests.append(dict(request.headers))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": hi\n\n")
+        resource = {"id_v1": "/lights/1", "on": {"on": True}}
+        message = f"id: {len(requests)}:0\ndata: {event(resource)}\n\n"
+        await response.write(message.encode())
+        return response
+
+    app = web.Application()
+    app.router.add_get("/eventstream/clip/v2", eventstream)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+
+    async with aiohttp.ClientSession() as session:
+        bridge = aiohue.Bridge(f"127.0.0.1:{port}", session, username="abc")
+        bridge.proto = "http"
+        bridge.requests = requests
+        yield bridge
+
+    await runner.cleanup()
+
+
+def test_parse_id_v1() -> None:
+    """Test that the v1 entity of a resource is found."""
+    assert parse_id_v1({"id_v1": "/lights/1"}) == ("lights", "1")
+    assert parse_id_v1({"id_v1": "/groups/0"}) == ("groups", "0")
+    assert parse_id_v1({"id_v1": ""}) is None
+    assert parse_id_v1({}) is None
+
+
+def test_apply_light_update() -> None:
+    """Test that only the changed fields of a light are updated."""
+    light = apply_light_update(LIGHT, {"on": {"on": True}, "dimming": {"brightness": 50}})
+
+    assert light.state is not None
+    assert light.state.on is True
+    assert light.state.bri == 127
+    assert light.state.ct == 366
+    assert light.name == LIGHT.name
+    assert LIGHT.state is not None
+    assert LIGHT.state.on is False
+
+
+def test_to_bri() -> None:
+    """Test that v2 brightness is rounded and clamped to the v1 range."""
+    assert to_bri(100) == 254
+    assert to_bri(99.6) == 253
+    assert to_bri(0.2) == 1
+    assert to_bri(0) == 1
+
+
+def test_apply_light_colour_update() -> None:
+    """Test that the colour mode follows the colour that was changed."""
+    light = apply_light_update(LIGHT, {"color": {"xy": {"x": 0.3, "y": 0.4}}})
+    assert light.state is not None
+    assert light.state.xy == (0.3, 0.4)
+    assert light.state.color_mode == "xy"
+
+    update = {"type": "zigbee_connectivity", "status": "connectivity_issue"}
+    light = apply_light_update(light, update)
+    assert light.state is not None
+    assert light.state.reachable is False
+
+
+def test_apply_group_update() -> None:
+    """Test that turning a group off turns all of its lights off."""
+    group = parse_obj_as(
+        GroupInfo,
+        {
+            "id": 1,
+            "name": "Lounge",
+            "lights": [1, 2],
+            "sensors": [],
+            "type": "Room",
+            "state": {"all_on": True, "any_on": True},
+            "action": {"on": True},
+        },
+    )
+
+    group = apply_group_update(group, {"on": {"on": False}})
+    assert group.action.on is False
+    assert group.state.all_on is False
+    assert group.state.any_on is False
+
+    group = apply_group_update(group, {"on": {"on": True}})
+    assert group.state.all_on is False
+    assert group.state.any_on is True
+
+
+def test_apply_button_update() -> None:
+    """Test that button events are converted to v1 button events."""
+    buttons = index_buttons(
+        [
+            {"id": BUTTON_ID, "type": "button", "metadata": {"control_id": 4}},
+            {"id": "b9bea6c4", "type": "light"},
+        ],
+    )
+    assert buttons == {BUTTON_ID: 4}
+
+    update = {"id": BUTTON_ID, "button": {"last_event": "long_release"}}
+    sensor = apply_sensor_update(SWITCH, update, buttons)
+    state = sensor.dict()["state"]
+    assert state["buttonevent"] == 4003
+    assert state["lastupdated"] != SWITCH.dict()["state"]["lastupdated"]
+
+    assert apply_sensor_update(SWITCH, {"id": "unknown"}, buttons) is SWITCH
+
+
+@pytest.mark.asyncio
+async def test_stream_updates_resumes(bridge: aiohue.Bridge) -> None:
+    """Test that the event stream is resumed from the last event."""
+    updates = stream_updates(bridge)
+
+    for _ in range(2):
+        event_type, resource = await asyncio.wait_for(updates.__anext__(), 1)
+        assert event_type == "update"
+        assert resource == {"id_v1": "/lights/1", "on": {"on": True}}
+    await updates.aclose()
+
+    assert "Last-Event-ID" not in bridge.requests[0]
+    assert bridge.requests[1]["Last-Event-ID"] == "1:0"
+    assert bridge.requests[0]["hue-application-key"] == "abc"
+
+
+@pytest.mark.asyncio
+async def test_fetch_resources_retries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the CLIP resources are fetched again if the bridge fails."""
+    monkeypatch.setattr("hue2mqtt.clip.RETRY_DELAY", 0)
+    resources = AsyncMock(side_effect=[aiohttp.ClientError("boom"), {"data": []}])
+    bridge = SimpleNamespace(clip=SimpleNamespace(resources=resources))
+
+    assert await fetch_resources(bridge) == []
+    assert resources.await_count == 2
@@ -1,8 +1,12 @@
 """Test that we can load config files."""
 
 from pathlib import Path
+from typing import Any, Dict
 
-from hue2mqtt.config import Hue2MQTTConfig
+import pytest
+from pydantic import ValidationError, parse_obj_as
+
+from hue2mqtt.config import EffectsInfo, HistoryInfo, Hue2MQTTConfig
 
 DATA_DIR = Path(__file__).resolve().parent.joinpath("data/configs")
 
@@ -12,3 +16,20 @@ def test_valid_config() -> None:
     with DATA_DIR.joinpath("valid.toml").open("rb") as fh:
         config = Hue2MQTTConfig.load_from_file(fh)
     assert config is not None
+
+
+@pytest.mark.parametrize("budget_share", [0, -0.5, 1.5])
+def test_invalid_effect_budget_share(budget_share: float) -> None:
+    """Test that the effect budget share must be a fraction of the rate limit."""
+    with pytest.raises(ValidationError):
+        parse_obj_as(EffectsInfo, {"budget_share": budget_share})
+
+
+@pytest.mark.parametrize(
+    "history",
+    [{"resolutions": [60, 0]}, {"buckets": 0}, {"samples": -1}],
+)
+def test_invalid_history(history: Dict[str, Any]) -> None:
+    """Test that history sizes and resolutions must be positive."""
+    with pytest.raises(ValidationError):
+        parse_obj_as(HistoryInfo, history)
@@ -0,0 +1,197 @@
+"""Test bridge discovery against stand-in responders."""
+
+import asyncio
+import struct
+from pathlib import Path
+from typing import AsyncIterator, Tuple, cast
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from hue2mqtt.discovery import (
+    DiscoveredBridge,
+    discover_bridges,
+    discover_mdns,
+    discover_ssdp,
+    load_cache,
+    parse_mdns_properties,
+    probe_subnet,
+    save_cache,
+)
+
+BRIDGE_ID = "ecb5fafffeabcdef"
+
+
+def mdns_response(bridge_id: str) -> bytes:
+    """Build the mDNS response of a bridge."""
+    name = b"".join(
+        bytes([len(label)]) + label
+        for label in [b"Philips Hue - ABCDEF", b"_hue", b"_tcp", b"local"]
+    )
+    txt = b"".join(
+        bytes([len(entry)]) + entry
+        for entry in [f"bridgeid={bridge_id}".encode(), b"modelid=BSB002"]
+    )
+    return (
+        struct.pack("!HHHHHH", 0, 0x8400, 0, 1, 0, 0)
+        + name
+        + b"\x00"
+        + struct.pack("!HHIH", 16, 1, 120, len(txt))
+        + txt
+    )
+
+
+class StandInResponder(asyncio.DatagramProtocol):
+    """Reply to every datagram with a fixed response."""
+
+    def __init__(self, response: bytes) -> None:
+        self.response = response
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast(asyncio.DatagramTransport, transport)
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.transport.sendto(self.response, addr)
+
+
+async def start_responder(response: bytes) -> Tuple[asyncio.BaseTransport, int]:
+    """Start a stand-in responder on a local port."""
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: StandInResponder(response),
+        local_addr=("127.0.0.1", 0),
+    )
+    return transport, transport.get_extra_info("sockname")[1]
+
+
+@pytest_asyncio.fixture
+async def bridge_port() -> AsyncIterator[int]:
+    """A stand-in for the config endpoint of a bridge."""
+
+    async def config(request: web.Request) -> web.Response:
+        return web.json_response({"name": "Philips Hue", "bridgeid": BRIDGE_ID.upper()})
+
+    app = web.Application()
+    app.router.add_get("/api/config", config)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    yield runner.addresses[0][1]
+    await runner.cleanup()
+
+
+def test_parse_mdns_properties() -> None:
+    """Test that the TXT properties are read from an mDNS response."""
+    assert parse_mdns_properties(mdns_response(BRIDGE_ID)) == {
+        "bridgeid": BRIDGE_ID,
+        "modelid": "BSB002",
+    }
+
+    with pytest.raises(ValueError):
+        parse_mdns_properties(mdns_response(BRIDGE_ID)[:-4])
+
+
+@pytest.mark.asyncio
+async def test_discover_mdns() -> None:
+    """Test that bridges are discovered using mDNS."""
+    transport, port = await start_responder(mdns_response(BRIDGE_ID))
+    try:
+        bridges = await discover_mdns(timeout=0.1, address=("127.0.0.1", port))
+    finally:
+        transport.close()
+    assert bridges == [
+        DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="mdns"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_discover_ssdp() -> None:
+    """Test that bridges are discovered using SSDP."""
+    response = (
+        b"HTTP/1.1 200 OK\r\n"
+        b"LOCATION: http://127.0.0.1:80/description.xml\r\n"
+        b"hue-bridgeid: ECB5FAFFFEABCDEF\r\n"
+        b"\r\n"
+    )
+    transport, port = await start_responder(response)
+    try:
+        bridges = await discover_ssdp(timeout=0.1, address=("127.0.0.1", port))
+    finally:
+        transport.close()
+    assert bridges == [
+        DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="ssdp"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_probe_subnet(bridge_port: int) -> None:
+    """Test that the hosts of a subnet are probed for bridges."""
+    async with aiohttp.ClientSession() as session:
+        bridges = await probe_subnet(session, "127.0.0.1/32", port=bridge_port)
+    assert bridges == [
+        DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="probe"),
+    ]
+
+
+def test_cache_expires(tmp_path: Path) -> None:
+    """Test that the cache is only loaded until it expires."""
+    cache_file = tmp_path.joinpath("bridges.json")
+    assert load_cache(cache_file) is None
+
+    bridges = [DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="ssdp")]
+    save_cache(cache_file, bridges)
+    assert load_cache(cache_file) == bridges
+    assert load_cache(cache_file, ttl=-1) is None
+
+
+@pytest.mark.asyncio
+async def test_discover_bridges_uses_cache(tmp_path: Path, bridge_port: int) -> None:
+    """Test that cached bridges are used if they respond at the same address."""
+    cache_file = tmp_path.joinpath("bridges.json")
+    bridges = [DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="ssdp")]
+    save_cache(cache_file, bridges)
+
+    async with aiohttp.ClientSession() as session:
+        found = await discover_bridges(
+            session,
+            cache_file=cache_file,
+            timeout=0.1,
+            probe_port=bridge_port,
+        )
+    assert found == bridges
+
+
+@pytest.mark.asyncio
+async def test_discover_bridges_searches_for_uncached_id(
+    tmp_path: Path,
+    bridge_port: int,
+) -> None:
+    """Test that the cache is not used if it does not have the selected bridge."""
+    cache_file = tmp_path.joinpath("bridges.json")
+    bridges = [DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="ssdp")]
+    save_cache(cache_file, bridges)
+
+    async with aiohttp.ClientSession() as session:
+        found = await discover_bridges(
+            session,
+            subnet="127.0.0.1/32",
+            bridge_id="001788abcdef",
+            cache_file=cache_file,
+            timeout=0.1,
+            probe_port=bridge_port,
+        )
+    assert DiscoveredBridge(id="ecb5faabcdef", host="127.0.0.1", source="probe") in found
+
+
+@pytest.mark.asyncio
+async def test_discover_bridges_rejects_invalid_subnet(tmp_path: Path) -> None:
+    """Test that an invalid subnet is reported, rather than ignored."""
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(ValueError):
+            await discover_bridges(
+                session,
+                subnet="192.168.1.0/33",
+                cache_file=tmp_path.joinpath("bridges.json"),
+            )
@@ -0,0 +1,136 @@
+"""Test local effects."""
+
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from pydantic import parse_obj_as
+
+from hue2mqtt.effects import (
+    EffectScheduler,
+    Keyframe,
+    breathe,
+    colorloop,
+    fade,
+    plan_effect,
+)
+from hue2mqtt.messages import EffectRequest
+from hue2mqtt.schema import GroupInfo, LightInfo, LightState
+
+
+def make_request(**request: Any) -> EffectRequest:
+    """Make an effect request for testing."""
+    return parse_obj_as(EffectRequest, request)
+
+
+def make_light(light_id: int) -> LightInfo:
+    """Make a light for testing."""
+    data: Dict[str, Any] = {
+        "id": light_id,
+        "name": f"Light {light_id}",
+        "uniqueid": f"00:17:88:01:ab:cd:ef:0{light_id}-0b",
+        "state": {"on": True, "bri": 254},
+        "manufacturername": "Signify Netherlands B.V.",
+        "modelid": "LCT012",
+        "productname": "Hue color candle",
+        "type": "Extended color light",
+        "swversion": "1.50.2_r30933",
+    }
+    return parse_obj_as(LightInfo, data)
+
+
+def test_fade_uses_native_transition() -> None:
+    """Test that a fade the bridge can transition natively is one command."""
+    request = make_request(effect="fade", duration=600, bri=54)
+    assert list(fade(request, "light", 1, None)) == [
+        Keyframe(0, "light", 1, {"on": True, "bri": 54, "transitiontime": 6000}),
+    ]
+
+
+def test_long_fade_is_split() -> None:
+    """Test that fades longer than the bridge supports are interpolated."""
+    request = make_request(effect="fade", duration=4 * 3600, bri=54)
+    start = parse_obj_as(LightState, {"on": True, "bri": 254})
+
+    keyframes = list(fade(request, "group", 2, start))
+    assert [keyframe.offset for keyframe in keyframes] == [0, 4800, 9600]
+    assert [keyframe.command["bri"] for keyframe in keyframes] == [187, 121, 54]
+    assert keyframes[0].command["transitiontime"] == 48000
+
+
+def test_breathe_is_limited_by_interval() -> None:
+    """Test that breathing is slowed down to stay within the budget."""
+    request = make_request(effect="breathe", duration=8, period=1, min_bri=10)
+
+    keyframes = list(breathe(request, "group", 1, interval=2))
+    assert [keyframe.offset for keyframe in keyframes] == [0, 2, 4, 6]
+    assert [keyframe.command["bri"] for keyframe in keyframes] == [254, 10, 254, 10]
+
+
+def test_colorloop_spreads_lights() -> None:
+    """Test that the lights of a colour loop are spread across the interval."""
+    request = make_request(effect="colorloop", duration=4, period=8)
+
+    keyframes = list(colorloop(request, [1, 2], interval=2))
+    assert [(keyframe.offset, keyframe.id) for keyframe in keyframes] == [
+        (0, 1),
+        (1, 2),
+        (2, 1),
+        (3, 2),
+    ]
+    assert keyframes[1].command["hue"] == 32768
+    assert keyframes[2].command == {"hue_inc": 16384, "transitiontime": 20}
+
+
+def test_plan_effect() -> None:
+    """Test that effects on groups use group actions within the budget."""
+    lights = [make_light(1), make_light(2)]
+    group = parse_obj_as(
+        GroupInfo,
+        {
+            "id": 3,
+            "name": "Lounge",
+            "lights": [1, 2],
+            "sensors": [],
+            "type": "Room",
+            "state": {"all_on": True, "any_on": True},
+            "action": {"on": True, "bri": 254},
+        },
+    )
+    intervals = {"light_interval": 0.2, "group_interval": 2, "min_interval": 0.5}
+
+    request = make_request(effect="breathe", duration=4, period=1)
+    keyframes = list(plan_effect(request, lights=lights, group=group, **intervals))
+    assert {(keyframe.kind, keyframe.id) for keyframe in keyframes} == {("group", 3)}
+    assert keyframes[1].offset == 2
+
+    request = make_request(effect="colorloop", duration=1)
+    keyframes = list(plan_effect(request, lights=lights, group=group, **intervals))
+    assert [keyframe.offset for keyframe in keyframes] == [0, 0.25, 0.5, 0.75]
+
+    fade_request = make_request(effect="fade", duration=1)
+    with pytest.raises(ValueError, match="target"):
+        plan_effect(fade_request, lights=lights, group=None, **intervals)
+    with pytest.raises(ValueError, match="No known lights"):
+        plan_effect(request, lights=[], group=None, **intervals)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancels_overlapping_effects() -> None:
+    """Test that an effect is cancelled by another effect on the same lights."""
+    sent: List[Keyframe] = []
+
+    async def send(keyframe: Keyframe) -> None:
+        sent.append(keyframe)
+
+    scheduler = EffectScheduler(send)
+    scheduler.start([1, 2], [Keyframe(0, "light", 1, {}), Keyframe(10, "light", 1, {})])
+    scheduler.start([3], [Keyframe(0, "light", 3, {})])
+    await asyncio.sleep(0.01)
+    assert [keyframe.id for keyframe in sent] == [1, 3]
+    assert scheduler.running == [frozenset({1, 2})]
+
+    scheduler.start([2], [])
+    await asyncio.sleep(0.01)
+    assert scheduler.running == []
+    assert scheduler.cancel([1]) == 0
@@ -0,0 +1,60 @@
+"""Test entity filtering."""
+
+from typing import Any, Dict
+
+from pydantic import parse_obj_as
+
+from hue2mqtt.config import FiltersInfo
+from hue2mqtt.filters import EntityFilter
+
+PLUG_RAW = {"name": "Kettle", "type": "On/Off plug-in unit", "modelid": "LOM001"}
+LAMP_RAW = {"name": "Lounge Lamp", "type": "Extended color light", "modelid": "LCT012"}
+ROOM_RAW = {"name": "Kitchen", "type": "Room", "lights": ["1"], "sensors": []}
+
+
+def make_filter(**settings: Any) -> EntityFilter:
+    """Make an entity filter for testing."""
+    return EntityFilter(parse_obj_as(FiltersInfo, settings))
+
+
+def test_no_rules_allows_everything() -> None:
+    """Test that every entity is allowed if there are no rules."""
+    entity_filter = make_filter()
+    assert entity_filter.allows("light", "1", PLUG_RAW)
+    assert entity_filter.allows("group", "1", ROOM_RAW)
+
+
+def test_exclude_rules() -> None:
+    """Test that entities matching any exclude rule are filtered."""
+    entity_filter = make_filter(
+        exclude=[{"type": "On/Off plug-in unit"}, {"name": "Test *"}],
+    )
+    assert not entity_filter.allows("light", "1", PLUG_RAW)
+    assert not entity_filter.allows("group", "3", {**ROOM_RAW, "name": "Test room"})
+    assert entity_filter.allows("light", "2", LAMP_RAW)
+
+
+def test_include_rules() -> None:
+    """Test that only entities matching an include rule are allowed."""
+    entity_filter = make_filter(
+        include=[{"entity_type": "light", "model": "LCT012"}, {"entity_type": "group"}],
+        exclude=[{"name": "Kitchen"}],
+    )
+    assert entity_filter.allows("light", "2", LAMP_RAW)
+    assert not entity_filter.allows("light", "1", PLUG_RAW)
+    assert not entity_filter.allows("group", "1", ROOM_RAW)
+    assert not entity_filter.allows("sensor", "4", {"name": "Hallway sensor"})
+
+
+def test_room_rules_follow_membership() -> None:
+    """Test that room rules are re-evaluated when the rooms change."""
+    entity_filter = make_filter(exclude=[{"room": "Kitchen"}])
+    entity_filter.update_rooms([("1", ROOM_RAW)])
+    assert not entity_filter.allows("light", "1", PLUG_RAW)
+    assert not entity_filter.allows("group", "1", ROOM_RAW)
+    assert entity_filter.allows("light", "2", LAMP_RAW)
+
+    room: Dict[str, Any] = {**ROOM_RAW, "lights": ["2"]}
+    entity_filter.update_rooms([("1", room)])
+    assert entity_filter.allows("light", "1", PLUG_RAW)
+    assert not entity_filter.allows("light", "2", LAMP_RAW)
@@ -0,0 +1,98 @@
+"""Test the leader election for high availability."""
+
+import re
+from typing import List, Match, Tuple
+
+import pytest
+
+from hue2mqtt.config import HAInfo
+from hue2mqtt.ha import LeaderElection
+from hue2mqtt.messages import HALeader
+
+SETTINGS = HAInfo(enabled=True, heartbeat_interval=0.01, lease_timeout=0)
+
+
+class ElectionRecorder:
+    """Records the messages and leadership changes of an election."""
+
+    def __init__(self) -> None:
+        self.published: List[HALeader] = []
+        self.changes: List[bool] = []
+
+    async def publish(self, message: HALeader) -> None:
+        """Record a published message."""
+        self.published.append(message)
+
+    async def on_change(self, is_leader: bool) -> None:
+        """Record a change in leadership."""
+        self.changes.append(is_leader)
+
+
+def make_election(
+    instance_id: str,
+    settings: HAInfo = SETTINGS,
+) -> Tuple[LeaderElection, ElectionRecorder]:
+    """Make an election with a recorder."""
+    recorder = ElectionRecorder()
+    election = LeaderElection(
+        instance_id,
+        settings,
+        publish=recorder.publish,
+        on_change=recorder.on_change,
+    )
+    return election, recorder
+
+
+def leader_match() -> Match[str]:
+    """Match for the leader topic."""
+    match = re.match("hue2mqtt/ha/leader", "hue2mqtt/ha/leader")
+    assert match is not None
+    return match
+
+
+@pytest.mark.asyncio
+async def test_claims_lapsed_leadership() -> None:
+    """Test that leadership is claimed if there is no leader."""
+    election, recorder = make_election("b")
+
+    await election.tick()
+    assert election.is_leader
+    assert recorder.changes == [True]
+    assert recorder.published == [HALeader(instance="b")]
+
+
+@pytest.mark.asyncio
+async def test_follows_live_leader() -> None:
+    """Test that leadership is not claimed whilst the leader sends heartbeats."""
+    election, recorder = make_election("b", HAInfo(enabled=True, lease_timeout=60))
+
+    await election.handle_leader(leader_match(), '{"instance": "a"}')
+    await election.tick()
+    assert election.leader == "a"
+    assert not election.is_leader
+    assert recorder.published == []
+
+
+@pytest.mark.asyncio
+async def test_lowest_id_wins() -> None:
+    """Test that the lowest ID wins when several instances claim the leadership."""
+    election, recorder = make_election("b")
+    await election.tick()
+
+    await election.handle_leader(leader_match(), '{"instance": "c"}')
+    assert election.is_leader
+
+    await election.handle_leader(leader_match(), '{"instance": "a"}')
+    assert not election.is_leader
+    assert recorder.changes == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_resign_allows_takeover() -> None:
+    """Test that a resigning leader can be replaced immediately."""
+    election, recorder = make_election("b", HAInfo(enabled=True, lease_timeout=60))
+
+    await election.handle_leader(leader_match(), '{"instance": "a"}')
+    await election.handle_leader(leader_match(), '{"instance": null}')
+    await election.tick()
+    assert election.is_leader
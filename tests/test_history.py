@@ -0,0 +1,106 @@
+"""Test the sensor history."""
+
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+from pydantic import parse_obj_as
+
+from hue2mqtt.config import HistoryInfo
+from hue2mqtt.history import SensorHistory, is_new_reading
+from hue2mqtt.messages import HistoryQuery
+from hue2mqtt.schema import SensorInfo
+
+UNIQUEID = "00:17:88:01:02:00:af:28-02-0406"
+
+
+def make_sensor(**state: Any) -> SensorInfo:
+    """Make a motion sensor for testing."""
+    data: Dict[str, Any] = {
+        "id": 7,
+        "name": "Hallway sensor",
+        "type": "ZLLPresence",
+        "modelid": "SML001",
+        "manufacturername": "Signify Netherlands B.V.",
+        "productname": "Hue motion sensor",
+        "uniqueid": UNIQUEID,
+        "swversion": "6.1.1.27575",
+        "state": state,
+    }
+    return parse_obj_as(SensorInfo, data)
+
+
+def make_query(**query: Any) -> HistoryQuery:
+    """Make a history query for testing."""
+    return parse_obj_as(HistoryQuery, query)
+
+
+@pytest.fixture
+def history() -> SensorHistory:
+    """A sensor history with small buffers."""
+    settings = parse_obj_as(
+        HistoryInfo,
+        {"enabled": True, "samples": 3, "resolutions": [60], "buckets": 2},
+    )
+    return SensorHistory(settings)
+
+
+def test_samples_are_bounded(history: SensorHistory) -> None:
+    """Test that only the most recent readings are kept."""
+    for i in range(5):
+        history.record(make_sensor(presence=i % 2 == 0), timestamp=i)
+
+    report = history.query(UNIQUEID, make_query(field="presence"))
+    assert [(sample.time, sample.value) for sample in report.samples] == [
+        (2, 1),
+        (3, 0),
+        (4, 1),
+    ]
+    assert report.rollups == []
+
+
+def test_rollups(history: SensorHistory) -> None:
+    """Test that readings are rolled up at each resolution."""
+    for timestamp, value in [(0, 10), (30, 20), (60, 5), (150, 1), (170, 3)]:
+        history.record(make_sensor(temperature=value), timestamp=timestamp)
+
+    query = make_query(field="temperature", resolution=60)
+    report = history.query(UNIQUEID, query)
+    assert [(b.start, b.count, b.min, b.max, b.mean) for b in report.rollups] == [
+        (60, 1, 5, 5, 5),
+        (120, 2, 1, 3, 2),
+    ]
+
+    query = make_query(field="temperature", resolution=60, since=60)
+    assert len(history.query(UNIQUEID, query, now=200).rollups) == 1
+
+    with pytest.raises(ValueError, match="not recorded"):
+        history.query(UNIQUEID, make_query(field="temperature", resolution=3600))
+    with pytest.raises(KeyError):
+        history.query(UNIQUEID, make_query(field="lightlevel"))
+
+
+def test_save_and_load(history: SensorHistory, tmp_path: Path) -> None:
+    """Test that the history can be saved and loaded again."""
+    history.record(make_sensor(lightlevel=12000), timestamp=100)
+    path = tmp_path.joinpath("history", "sensors.json")
+    history.save(path)
+
+    loaded = SensorHistory(history.settings)
+    loaded.load(path)
+    for resolution in (None, 60):
+        query = make_query(field="lightlevel", resolution=resolution)
+        assert loaded.query(UNIQUEID, query) == history.query(UNIQUEID, query)
+
+
+def test_is_new_reading() -> None:
+    """Test that only changes to readings are recorded."""
+    sensor = make_sensor(presence=True, lastupdated="2021-07-10T12:28:17")
+    assert is_new_reading(None, sensor)
+
+    renamed = sensor.copy(update={"name": "Landing sensor"})
+    assert not is_new_reading(sensor, renamed)
+
+    pressed_again = make_sensor(presence=True, lastupdated="2021-07-10T12:29:01")
+    assert is_new_reading(sensor, pressed_again)
+    assert is_new_reading(sensor, make_sensor(presence=False))
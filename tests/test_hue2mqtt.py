@@ -0,0 +1,674 @@
+"""Test the Hue2MQTT bridge logic against a stand-in Hue Bridge."""
+
+import asyncio
+import re
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from unittest.mock import AsyncMock, call, patch
+
+import aiohue
+import pytest
+import pytest_asyncio
+from gmqtt.mqtt.handler import MQTTConnectError
+from pydantic import parse_obj_as
+
+from hue2mqtt.config import FilterRule, FiltersInfo
+from hue2mqtt.effects import Keyframe
+from hue2mqtt.filters import EntityFilter
+from hue2mqtt.ha import LeaderElection
+from hue2mqtt.hue2mqtt import Hue2MQTT
+from hue2mqtt.messages import HALeader
+
+DATA_DIR = Path(__file__).resolve().parent.joinpath("data/configs")
+
+LIGHT_RAW = {
+    "name": "Lounge Lamp",
+    "uniqueid": "00:17:88:01:ab:cd:ef:01-0b",
+    "state": {"on": False, "bri": 153, "reachable": True},
+    "manufacturername": "Signify Netherlands B.V.",
+    "modelid": "LCT012",
+    "productname": "Hue color candle",
+    "type": "Extended color light",
+    "swversion": "1.50.2_r30933",
+}
+
+GROUP_RAW = {
+    "name": "Lounge",
+    "lights": ["1"],
+    "sensors": [],
+    "type": "Room",
+    "state": {"all_on": False, "any_on": False},
+    "class": "Living room",
+    "action": {"on": False},
+}
+
+
+class StubItems:
+    """Stand-in for the aiohue collection of items."""
+
+    def __init__(self, raw: Dict[str, Dict[str, Any]]) -> None:
+        self._items = {
+            idx: SimpleNamespace(id=idx, raw=item_raw, set_state=AsyncMock())
+            for idx, item_raw in raw.items()
+        }
+        self.update = AsyncMock()
+
+    def __iter__(self) -> Any:
+        return iter(self._items)
+
+    def __getitem__(self, idx: str) -> Any:
+        return self._items[idx]
+
+
+@pytest_asyncio.fixture
+async def hue2mqtt() -> Hue2MQTT:
+    """A Hue2MQTT instance with a stand-in bridge and no broker."""
+    h = Hue2MQTT(verbose=False, config_file=str(DATA_DIR.joinpath("valid.toml")))
+    h._bridge = SimpleNamespace(
+        lights=StubItems({"1": LIGHT_RAW}),
+        groups=StubItems({"1": GROUP_RAW}),
+        sensors=StubItems({}),
+        config=SimpleNamespace(
+            name="Philips Hue",
+            mac="ec:b5:fa:ab:cd:ef",
+            apiversion="1.45.0",
+            update=AsyncMock(),
+        ),
+    )
+    return h
+
+
+def capture_publishes(h: Hue2MQTT) -> List[Tuple[str, Any]]:
+    """Record the messages published by the bridge."""
+    published: List[Tuple[str, Any]] = []
+
+    def publish(
+        topic: str,
+        payload: Any,
+        retain: bool,
+        properties: Any,
+        **kwargs: Any,
+    ) -> None:
+        published.append((topic, payload))
+
+    h._mqtt._publish = publish  # type: ignore[assignment,method-assign]
+    return published
+
+
+@pytest.mark.asyncio
+async def test_reconcile_publishes_everything_when_empty(hue2mqtt: Hue2MQTT) -> None:
+    """Test that entities that have never been published are published."""
+    published = capture_publishes(hue2mqtt)
+
+    assert await hue2mqtt.reconcile() == 2
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+        "hue2mqtt/group/1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reconcile_only_publishes_drift(hue2mqtt: Hue2MQTT) -> None:
+    """Test that only entities that differ from the cache are published."""
+    published = capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    published.clear()
+
+    assert await hue2mqtt.reconcile() == 0
+    assert published == []
+
+    hue2mqtt._bridge.lights["1"].raw = {**LIGHT_RAW, "state": {"on": True}}
+    assert await hue2mqtt.reconcile() == 1
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+    ]
+    assert hue2mqtt._metrics.counters["reconcile_drift_lights"] == 2
+
+
+@pytest.mark.asyncio
+async def test_reconcile_survives_invalid_entity(hue2mqtt: Hue2MQTT) -> None:
+    """Test that periodic reconciliation keeps running if an entity is invalid."""
+    hue2mqtt.config.reconciliation.interval = 0.001
+    hue2mqtt.config.reconciliation.jitter = 0
+    capture_publishes(hue2mqtt)
+    hue2mqtt._bridge.lights["1"].raw = {"name": "Broken"}
+    task = asyncio.ensure_future(hue2mqtt._reconcile_periodically())
+    await asyncio.sleep(0.05)
+
+    assert not task.done()
+    assert hue2mqtt._metrics.counters["reconcile_runs"] >= 2
+    assert hue2mqtt._metrics.counters["invalid_entities"] >= 2
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_initial_publish_skips_invalid_entity(hue2mqtt: Hue2MQTT) -> None:
+    """Test that an invalid entity does not prevent the others from being published."""
+    published = capture_publishes(hue2mqtt)
+    hue2mqtt._bridge.lights["1"].raw = {"name": "Broken"}
+
+    await hue2mqtt._publish_initial_state()
+
+    assert [topic for topic, _ in published] == ["hue2mqtt/group/1"]
+    assert hue2mqtt._metrics.counters["invalid_entities"] == 1
+
+
+@pytest.mark.asyncio
+async def test_event_stream_resubscribes_after_stall(hue2mqtt: Hue2MQTT) -> None:
+    """Test that a stalled event stream is resubscribed."""
+    published = capture_publishes(hue2mqtt)
+    hue2mqtt.config.events.enable_watchdog = True
+    hue2mqtt.config.events.stall_timeout = 0.05
+    received = asyncio.Event()
+    subscriptions = 0
+
+    async def listen_events() -> AsyncIterator[Any]:
+        nonlocal subscriptions
+        subscriptions += 1
+        if subscriptions > 1:
+            yield aiohue.lights.Light("1", {**LIGHT_RAW, "name": "Lamp"}, [], None)
+            received.set()
+        await asyncio.sleep(10)
+
+    hue2mqtt._bridge.listen_events = listen_events
+    task = asyncio.ensure_future(hue2mqtt._listen_events())
+    await asyncio.wait_for(received.wait(), 1)
+    task.cancel()
+
+    assert hue2mqtt._metrics.counters["event_stream_restarts"] == 1
+    assert hue2mqtt._metrics.timings["event_stream_stall"].count == 1
+    hue2mqtt._bridge.config.update.assert_awaited_once()
+    assert published[-1][1].name == "Lamp"
+
+
+@pytest.mark.asyncio
+async def test_clip_events_update_cached_state(hue2mqtt: Hue2MQTT) -> None:
+    """Test that only the changed fields of CLIP v2 events are published."""
+    hue2mqtt.config.events.backend = "v2"
+    published = capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    published.clear()
+
+    async def stream_events(last_event_id: Any) -> AsyncIterator[Dict[str, Any]]:
+        updates = [
+            {"id_v1": "/lights/1", "dimming": {"brightness": 100}},
+            {"id_v1": "/lights/9", "on": {"on": True}},
+        ]
+        yield {"id": "1:0", "data": [{"type": "update", "data": updates}]}
+        received.set()
+        await asyncio.sleep(10)
+
+    received = asyncio.Event()
+    hue2mqtt._bridge.clip = SimpleNamespace(
+        stream_events=stream_events,
+        resources=AsyncMock(return_value={"data": []}),
+    )
+    task = asyncio.ensure_future(hue2mqtt._listen_events())
+    await asyncio.wait_for(received.wait(), 1)
+    task.cancel()
+
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+    ]
+    state = published[0][1].state
+    assert (state.on, state.bri, state.reachable) == (False, 254, True)
+    assert hue2mqtt._metrics.counters["clip_events_ignored"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_applies_settings_without_reconnecting(
+    hue2mqtt: Hue2MQTT,
+    tmp_path: Path,
+) -> None:
+    """Test that changing other settings does not reconnect to the broker or bridge."""
+    config = DATA_DIR.joinpath("valid.toml").read_text()
+    config_file = tmp_path.joinpath("hue2mqtt.toml")
+    config_file.write_text(config + "\n[reconciliation]\ninterval = 60\n")
+    hue2mqtt._config_file = str(config_file)
+    hue2mqtt._reconnect_mqtt = AsyncMock()  # type: ignore[method-assign]
+    hue2mqtt._reconnect_bridge = AsyncMock()  # type: ignore[method-assign]
+
+    await hue2mqtt._reload()
+
+    assert hue2mqtt.config.reconciliation.interval == 60
+    hue2mqtt._reconnect_mqtt.assert_not_awaited()
+    hue2mqtt._reconnect_bridge.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_reload_starts_enabled_background_tasks(
+    hue2mqtt: Hue2MQTT,
+    tmp_path: Path,
+) -> None:
+    """Test that background tasks enabled by a reload are started."""
+    config = DATA_DIR.joinpath("valid.toml").read_text()
+    config_file = tmp_path.joinpath("hue2mqtt.toml")
+    config_file.write_text(
+        config
+        + "\n[reconciliation]\nenabled = true\n"
+        + "\n[runtime]\nlag_monitor_interval = 0\n",
+    )
+    hue2mqtt._config_file = str(config_file)
+    hue2mqtt.config.runtime.lag_monitor_interval = 0
+    hue2mqtt._start_background_tasks()
+    assert hue2mqtt._tasks == []
+
+    await hue2mqtt._reload()
+
+    assert len(hue2mqtt._tasks) == 1
+    hue2mqtt._stop_background_tasks()
+
+
+@pytest.mark.asyncio
+async def test_reload_reconnects_changed_bridge(
+    hue2mqtt: Hue2MQTT,
+    tmp_path: Path,
+) -> None:
+    """Test that changing the bridge settings reconnects to the bridge."""
+    config = DATA_DIR.joinpath("valid.toml").read_text()
+    config_file = tmp_path.joinpath("hue2mqtt.toml")
+    config_file.write_text(config.replace('username = "foo"', 'username = "bar"'))
+    hue2mqtt._config_file = str(config_file)
+    hue2mqtt._reconnect_mqtt = AsyncMock()  # type: ignore[method-assign]
+    hue2mqtt._reconnect_bridge = AsyncMock()  # type: ignore[method-assign]
+
+    await hue2mqtt._reload()
+
+    assert hue2mqtt.config.hue.username == "bar"
+    hue2mqtt._reconnect_mqtt.assert_not_awaited()
+    hue2mqtt._reconnect_bridge.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_mqtt_reverts_if_refused(hue2mqtt: Hue2MQTT) -> None:
+    """Test that the old MQTT settings are used if the broker refuses the new ones."""
+    old_config = hue2mqtt.config.copy(deep=True)
+    hue2mqtt.config.mqtt.host = "new.example.com"
+    hue2mqtt._publish_bridge_status = AsyncMock()  # type: ignore[method-assign]
+    connect = AsyncMock(side_effect=[MQTTConnectError(5), None])
+
+    with patch("hue2mqtt.hue2mqtt.MQTTWrapper.connect", connect), patch(
+        "hue2mqtt.hue2mqtt.MQTTWrapper.disconnect",
+        AsyncMock(),
+    ):
+        await hue2mqtt._reconnect_mqtt(old_config)
+
+    assert connect.await_count == 2
+    assert hue2mqtt.config.mqtt == old_config.mqtt
+
+
+@pytest.mark.asyncio
+async def test_reload_keeps_config_if_invalid(
+    hue2mqtt: Hue2MQTT,
+    tmp_path: Path,
+) -> None:
+    """Test that an invalid config file is not applied."""
+    config_file = tmp_path.joinpath("hue2mqtt.toml")
+    config_file.write_text("[mqtt]\nbees = 1\n")
+    hue2mqtt._config_file = str(config_file)
+    old_config = hue2mqtt.config
+
+    await hue2mqtt._reload()
+
+    assert hue2mqtt.config is old_config
+
+
+@pytest.mark.asyncio
+async def test_group_state_derived_from_lights(hue2mqtt: Hue2MQTT) -> None:
+    """Test that groups are published when the state of their lights changes."""
+    hue2mqtt.config.groups.derive_state = True
+    published = capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    published.clear()
+
+    light = hue2mqtt._bridge.lights["1"]
+    light.raw = {**LIGHT_RAW, "state": {"on": True}}
+    hue2mqtt.handle_event(aiohue.lights.Light(light.id, light.raw, [], None))
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+        "hue2mqtt/group/1",
+    ]
+    assert published[1][1].state.all_on
+
+    # The event from the bridge matches the derived state, so is not published.
+    published.clear()
+    group_raw = {
+        **GROUP_RAW,
+        "state": {"all_on": True, "any_on": True},
+        "action": {"on": True, "bri": 254},
+    }
+    hue2mqtt.handle_event(aiohue.groups.Group("1", group_raw, [], None))
+    assert published == []
+    assert hue2mqtt._metrics.counters["group_states_confirmed"] == 1
+    assert hue2mqtt._state.groups[1].action.bri == 254
+
+
+@pytest.mark.asyncio
+async def test_initial_publish_waits_for_capacity(hue2mqtt: Hue2MQTT) -> None:
+    """Test that the initial state is published in chunks as the broker catches up."""
+    hue2mqtt.config.initial_publish.chunk_size = 1
+    hue2mqtt.config.initial_publish.max_inflight = 1
+    published = capture_publishes(hue2mqtt)
+    hue2mqtt._mqtt._storage.push_message(1, b"foo")
+
+    task = asyncio.ensure_future(hue2mqtt._publish_initial_state())
+    await asyncio.sleep(0)
+    assert published == []
+
+    hue2mqtt._mqtt._storage.remove_message_by_mid(1)
+    await asyncio.wait_for(task, 1)
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+        "hue2mqtt/group/1",
+    ]
+    assert hue2mqtt._metrics.timings["initial_publish"].count == 1
+
+
+@pytest.mark.asyncio
+async def test_initial_publish_skips_live_updates(hue2mqtt: Hue2MQTT) -> None:
+    """Test that entities published by live events are not overwritten."""
+    hue2mqtt.config.initial_publish.chunk_size = 1
+    published = capture_publishes(hue2mqtt)
+
+    task = asyncio.ensure_future(hue2mqtt._publish_initial_state())
+    while not published:
+        await asyncio.sleep(0)
+    assert len(published) == 1
+
+    group_raw = {**GROUP_RAW, "name": "Living Room"}
+    hue2mqtt.handle_event(aiohue.groups.Group("1", group_raw, [], None))
+    await asyncio.wait_for(task, 1)
+    assert len(published) == 2
+    assert published[1][1].name == "Living Room"
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_is_measured(hue2mqtt: Hue2MQTT) -> None:
+    """Test that the lag of the event loop is recorded."""
+    hue2mqtt.config.runtime.lag_monitor_interval = 0.01
+    task = asyncio.ensure_future(hue2mqtt._monitor_loop_lag())
+    await asyncio.sleep(0)
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    task.cancel()
+
+    assert hue2mqtt._metrics.timings["loop_lag"].max >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_redundant_commands_suppressed(hue2mqtt: Hue2MQTT) -> None:
+    """Test that commands that would not change a light are not sent."""
+    hue2mqtt.config.commands.suppress_redundant = True
+    capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+
+    light = hue2mqtt._bridge.lights["1"]
+    light.uniqueid = LIGHT_RAW["uniqueid"]
+    light.name = LIGHT_RAW["name"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+
+    await hue2mqtt.handle_set_light(match, '{"on": false}')
+    light.set_state.assert_not_called()
+    assert hue2mqtt._metrics.counters["commands_suppressed"] == 1
+
+    await hue2mqtt.handle_set_light(match, '{"on": false, "bri": 100}')
+    light.set_state.assert_called_once_with(bri=100)
+    assert hue2mqtt._metrics.counters["command_fields_suppressed"] == 1
+
+    light.set_state.reset_mock()
+    await hue2mqtt.handle_set_light(match, '{"on": false, "force": true}')
+    light.set_state.assert_called_once_with(on=False)
+
+
+@pytest.mark.asyncio
+async def test_toggle_not_suppressed_before_event(hue2mqtt: Hue2MQTT) -> None:
+    """Test that a command undoing one that the bridge has not confirmed is sent."""
+    hue2mqtt.config.commands.suppress_redundant = True
+    capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+
+    light = hue2mqtt._bridge.lights["1"]
+    light.uniqueid = LIGHT_RAW["uniqueid"]
+    light.name = LIGHT_RAW["name"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+
+    # The cached state is still off, as no event has arrived.
+    await hue2mqtt.handle_set_light(match, '{"on": true}')
+    await hue2mqtt.handle_set_light(match, '{"on": false}')
+    assert light.set_state.await_args_list == [call(on=True), call(on=False)]
+    assert "commands_suppressed" not in hue2mqtt._metrics.counters
+
+
+@pytest.mark.asyncio
+async def test_scene_recalled_with_group_action(hue2mqtt: Hue2MQTT) -> None:
+    """Test that a captured scene is recalled with as few commands as possible."""
+    capture_publishes(hue2mqtt)
+    hue2mqtt._bridge.lights["1"].raw = {**LIGHT_RAW, "state": {"on": True, "bri": 50}}
+    await hue2mqtt.reconcile()
+    match = re.match("(.*)", "evening")
+    assert match is not None
+
+    await hue2mqtt.handle_capture_scene(match, '{"group": 1}')
+    scenes = await hue2mqtt.handle_get_scenes(match, "")
+    evening = {LIGHT_RAW["uniqueid"]: {"on": True, "bri": 50}}
+    assert scenes.dict() == {"scenes": {"evening": evening}}
+
+    # The group only contains one light, so the light is set directly.
+    await hue2mqtt.handle_set_scene(match, '{"transitiontime": 10}')
+    light = hue2mqtt._bridge.lights["1"]
+    light.set_state.assert_awaited_once_with(on=True, bri=50, transitiontime=10)
+    assert hue2mqtt._metrics.counters["scene_light_commands"] == 1
+    assert hue2mqtt._metrics.timings["scene_recall"].count == 1
+
+
+@pytest.mark.asyncio
+async def test_effect_cancelled_by_command(hue2mqtt: Hue2MQTT) -> None:
+    """Test that a normal command cancels an effect on the light."""
+    hue2mqtt.config.commands.suppress_redundant = True
+    capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    light = hue2mqtt._bridge.lights["1"]
+    light.uniqueid = LIGHT_RAW["uniqueid"]
+    light.name = LIGHT_RAW["name"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+
+    await hue2mqtt.handle_light_effect(match, '{"effect": "breathe", "duration": 60}')
+    await asyncio.sleep(0.01)
+    light.set_state.assert_awaited_once_with(on=True, bri=254, transitiontime=20)
+    assert hue2mqtt._metrics.counters["effect_commands"] == 1
+
+    # The cached state matches, but the light is mid-effect so it is still sent.
+    light.set_state.reset_mock()
+    await hue2mqtt.handle_set_light(match, '{"on": false}')
+    light.set_state.assert_awaited_once_with(on=False)
+    assert hue2mqtt._effects.running == []
+    assert hue2mqtt._metrics.counters["effects_cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_effect_cancellation_broadcast(hue2mqtt: Hue2MQTT) -> None:
+    """Test that effects are only sent by the leader, and cancelled everywhere."""
+    published = capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    hue2mqtt._election = LeaderElection(
+        "a",
+        hue2mqtt.config.ha,
+        publish=AsyncMock(),
+        on_change=AsyncMock(),
+    )
+    hue2mqtt._election.leader = "b"
+    light = hue2mqtt._bridge.lights["1"]
+    light.uniqueid = LIGHT_RAW["uniqueid"]
+    light.name = LIGHT_RAW["name"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+
+    # Every instance runs the effect, but only the leader sends it
+    await hue2mqtt.handle_light_effect(match, '{"effect": "breathe", "duration": 60}')
+    await asyncio.sleep(0.01)
+    light.set_state.assert_not_awaited()
+    assert hue2mqtt._effects.running == [frozenset({1})]
+
+    # A command to this instance tells the others to cancel the effect
+    published.clear()
+    await hue2mqtt.handle_set_light(match, '{"on": false}')
+    assert hue2mqtt._effects.running == []
+    assert [topic for topic, _ in published] == ["hue2mqtt/ha/effects/cancel"]
+    assert published[0][1].dict() == {"instance": "a", "lights": [1]}
+
+    # A command to another instance cancels the effect here
+    await hue2mqtt.handle_light_effect(match, '{"effect": "breathe", "duration": 60}')
+    cancel = re.match("(.*)", "hue2mqtt/ha/effects/cancel")
+    assert cancel is not None
+    await hue2mqtt._handle_effects_cancelled(cancel, '{"instance": "a", "lights": [1]}')
+    assert hue2mqtt._effects.running == [frozenset({1})]
+    await hue2mqtt._handle_effects_cancelled(cancel, '{"instance": "b", "lights": [1]}')
+    assert hue2mqtt._effects.running == []
+
+
+@pytest.mark.asyncio
+async def test_effects_share_budget(hue2mqtt: Hue2MQTT) -> None:
+    """Test that concurrent effects share the budget for effects."""
+    hue2mqtt.config.effects.min_interval = 0
+    capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    light = hue2mqtt._bridge.lights["1"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+
+    # Another effect is running on a different light
+    hue2mqtt._effects.start([2], [Keyframe(60, "light", 2, {})])
+    request = '{"effect": "breathe", "duration": 1, "period": 0.1}'
+    await hue2mqtt.handle_light_effect(match, request)
+    await asyncio.sleep(0.01)
+
+    # Each effect may use half of the light budget, which is half the rate limit
+    light.set_state.assert_awaited_once_with(on=True, bri=254, transitiontime=4)
+    hue2mqtt._effects.cancel_all()
+    assert hue2mqtt._effects.running == []
+
+
+@pytest.mark.asyncio
+async def test_set_lights_by_room(hue2mqtt: Hue2MQTT) -> None:
+    """Test that a command to a room is sent to the lights in it."""
+    hue2mqtt.config.commands.suppress_redundant = True
+    capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    light = hue2mqtt._bridge.lights["1"]
+
+    match = re.match("(.*)", "Lounge")
+    assert match is not None
+    await hue2mqtt.handle_set_room(match, '{"on": true, "bri": 153}')
+    light.set_state.assert_awaited_once_with(on=True)
+    assert hue2mqtt._metrics.counters["fan_out_light_commands"] == 1
+
+    light.set_state.reset_mock()
+    match = re.match("(.*)", str(LIGHT_RAW["name"]))
+    assert match is not None
+    await hue2mqtt.handle_set_light_by_name(match, '{"on": false, "force": true}')
+    light.set_state.assert_awaited_once_with(on=False)
+
+
+@pytest.mark.asyncio
+async def test_sensor_history_query(hue2mqtt: Hue2MQTT) -> None:
+    """Test that changes to sensors are recorded and can be queried."""
+    hue2mqtt.config.history.enabled = True
+    capture_publishes(hue2mqtt)
+    sensor_raw = {
+        "name": "Hallway sensor",
+        "type": "ZLLPresence",
+        "modelid": "SML001",
+        "manufacturername": "Signify Netherlands B.V.",
+        "productname": "Hue motion sensor",
+        "uniqueid": "00:17:88:01:02:00:af:28-02-0406",
+        "swversion": "6.1.1.27575",
+        "state": {"presence": True},
+    }
+    for presence in (True, True, False):
+        raw = {**sensor_raw, "state": {"presence": presence}}
+        hue2mqtt.handle_event(aiohue.sensors.GenericSensor("7", raw, [], None))
+
+    match = re.match("(.*)", str(sensor_raw["uniqueid"]))
+    assert match is not None
+    report = await hue2mqtt.handle_get_history(match, '{"field": "presence"}')
+    assert [sample["value"] for sample in report.dict()["samples"]] == [1, 0]
+
+    report = await hue2mqtt.handle_get_history(match, '{"field": "bri"}')
+    assert "Invalid query" in report.dict()["error"]
+
+
+@pytest.mark.asyncio
+async def test_filtered_entities_ignored(hue2mqtt: Hue2MQTT) -> None:
+    """Test that filtered entities are not published and reject commands."""
+    hue2mqtt.config.filters.exclude = parse_obj_as(
+        List[FilterRule],
+        [{"entity_type": "light", "room": "Lounge"}],
+    )
+    hue2mqtt._filter = EntityFilter(hue2mqtt.config.filters)
+    published = capture_publishes(hue2mqtt)
+
+    assert await hue2mqtt.reconcile() == 1
+    assert [topic for topic, _ in published] == ["hue2mqtt/group/1"]
+
+    hue2mqtt.handle_event(aiohue.lights.Light("1", LIGHT_RAW, [], None))
+    assert hue2mqtt._metrics.counters["events_filtered"] == 1
+    assert len(published) == 1
+
+    light = hue2mqtt._bridge.lights["1"]
+    light.uniqueid = LIGHT_RAW["uniqueid"]
+    light.name = LIGHT_RAW["name"]
+    match = re.match("(.*)", str(LIGHT_RAW["uniqueid"]))
+    assert match is not None
+    await hue2mqtt.handle_set_light(match, "not json")
+    light.set_state.assert_not_called()
+    assert hue2mqtt._metrics.counters["commands_filtered"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_filters_applied_to_cache(hue2mqtt: Hue2MQTT) -> None:
+    """Test that new filters forget and fetch entities without a restart."""
+    published = capture_publishes(hue2mqtt)
+    await hue2mqtt.reconcile()
+    published.clear()
+
+    settings = parse_obj_as(FiltersInfo, {"exclude": [{"room": "Lounge"}]})
+    await hue2mqtt._apply_filters(EntityFilter(settings))
+    assert hue2mqtt._state.lights == {}
+    assert hue2mqtt._state.groups == {}
+    assert hue2mqtt._state.light_by_id(1) is None
+
+    await hue2mqtt._apply_filters(EntityFilter(FiltersInfo()))
+    assert list(hue2mqtt._state.lights) == [LIGHT_RAW["uniqueid"]]
+    assert [topic for topic, _ in published] == [
+        "hue2mqtt/light/00:17:88:01:ab:cd:ef:01-0b",
+        "hue2mqtt/group/1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_status_only_reasserted_after_last_will(hue2mqtt: Hue2MQTT) -> None:
+    """Test that the leader only republishes the status to undo a last will."""
+    published = capture_publishes(hue2mqtt)
+    match = re.match("(.*)", "hue2mqtt/status")
+    assert match is not None
+
+    await hue2mqtt._publish_leader(HALeader(instance="a"))
+    assert [topic for topic, _ in published] == ["hue2mqtt/ha/leader"]
+
+    await hue2mqtt._publish_bridge_status()
+    published.clear()
+    await hue2mqtt._handle_status(match, '{"online": true}')
+    assert published == []
+    await hue2mqtt._handle_status(match, '{"online": false}')
+    assert [topic for topic, _ in published] == ["hue2mqtt/status"]
+
+    # The bridge is unreachable, so the status should stay offline
+    await hue2mqtt._publish_bridge_status(online=False)
+    published.clear()
+    await hue2mqtt._handle_status(match, '{"online": false}')
+    assert published == []
@@ -0,0 +1,71 @@
+"""Test the priority lanes."""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from hue2mqtt.config import LanesInfo
+from hue2mqtt.lanes import COMMAND, STATE, STATUS, LaneScheduler
+from hue2mqtt.metrics import Metrics
+
+
+def test_runs_immediately_when_not_running() -> None:
+    """Test that jobs run immediately if the scheduler is not running."""
+    lanes = LaneScheduler(LanesInfo(enabled=True), Metrics())
+    ran: List[str] = []
+    lanes.submit(STATE, lambda: ran.append("state"))
+    assert ran == ["state"]
+
+
+@pytest.mark.asyncio
+async def test_commands_preempt_state() -> None:
+    """Test that commands are run before queued state publishes."""
+    metrics = Metrics()
+    lanes = LaneScheduler(LanesInfo(enabled=True, state_weight=2), metrics)
+    task = asyncio.ensure_future(lanes.run())
+    await asyncio.sleep(0)
+
+    ran: List[str] = []
+    for i in range(5):
+        lanes.submit(STATE, lambda i=i: ran.append(f"state{i}"))  # type: ignore[misc]
+    lanes.submit(STATUS, lambda: ran.append("status"))
+    lanes.submit(COMMAND, lambda: ran.append("command"))
+    await asyncio.sleep(0.01)
+
+    assert ran == ["command", "status", "state0", "state1", "state2", "state3", "state4"]
+    assert metrics.timings["lane_state_latency"].count == 5
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_stop_runs_queued_jobs() -> None:
+    """Test that queued jobs are not lost when the scheduler stops."""
+    lanes = LaneScheduler(LanesInfo(enabled=True), Metrics())
+    task = asyncio.ensure_future(lanes.run())
+    await asyncio.sleep(0)
+
+    ran: List[str] = []
+    lanes.submit(STATE, lambda: ran.append("state"))
+    lanes.stop()
+    task.cancel()
+
+    assert ran == ["state"]
+    lanes.submit(STATE, lambda: ran.append("after"))
+    assert ran == ["state", "after"]
+
+
+@pytest.mark.asyncio
+async def test_wait_drained() -> None:
+    """Test waiting for the jobs queued in a lane to be run."""
+    lanes = LaneScheduler(LanesInfo(enabled=True, state_weight=1), Metrics())
+    await lanes.wait_drained(STATE)
+    task = asyncio.ensure_future(lanes.run())
+    await asyncio.sleep(0)
+
+    ran: List[int] = []
+    for i in range(3):
+        lanes.submit(STATE, lambda i=i: ran.append(i))  # type: ignore[misc]
+    await asyncio.wait_for(lanes.wait_drained(STATE), 1)
+    assert ran == [0, 1, 2]
+    task.cancel()
@@ -0,0 +1,88 @@
+"""Test the logging configuration."""
+
+import json
+import logging
+import queue
+from unittest.mock import patch
+
+from hue2mqtt.log import JSONFormatter, LazyQueueHandler, RateLimitFilter
+
+
+def make_record(msg: str, *args: object, **extra: object) -> logging.LogRecord:
+    """Make a log record for testing."""
+    record = logging.LogRecord("hue2mqtt", logging.WARNING, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter() -> None:
+    """Test that records are formatted as JSON with their extra fields."""
+    record = make_record("Updating %s", "Lamp", entity="abc", rate_limited=True)
+    data = json.loads(JSONFormatter().format(record))
+
+    assert data["level"] == "WARNING"
+    assert data["logger"] == "hue2mqtt"
+    assert data["message"] == "Updating Lamp"
+    assert data["entity"] == "abc"
+    assert "rate_limited" not in data
+    assert "args" not in data
+
+
+def test_rate_limit_filter() -> None:
+    """Test that repetitive messages are only logged once per interval."""
+    rate_limit = RateLimitFilter(10)
+
+    with patch("hue2mqtt.log.time.monotonic", return_value=100):
+        assert rate_limit.filter(make_record("Unknown light: %s", "a", rate_limited=True))
+        assert not rate_limit.filter(
+            make_record("Unknown light: %s", "b", rate_limited=True),
+        )
+        assert not rate_limit.filter(
+            make_record("Unknown light: %s", "c", rate_limited=True),
+        )
+        assert rate_limit.filter(make_record("Unknown light: %s", "d"))
+
+    with patch("hue2mqtt.log.time.monotonic", return_value=111):
+        record = make_record("Unknown light: %s", "e", rate_limited=True)
+        assert rate_limit.filter(record)
+    assert record.getMessage() == "Unknown light: e (2 similar messages suppressed)"
+
+
+def test_rate_limit_filter_per_entity() -> None:
+    """Test that messages about different entities are limited separately."""
+    rate_limit = RateLimitFilter(10)
+
+    with patch("hue2mqtt.log.time.monotonic", return_value=100):
+        for entity in ("a", "b"):
+            record = make_record("Bad JSON: %s", "{", entity=entity, rate_limited=True)
+            assert rate_limit.filter(record)
+        record = make_record("Bad JSON: %s", "{", entity="a", rate_limited=True)
+        assert not rate_limit.filter(record)
+
+
+def test_rate_limit_filter_forgets_old_messages() -> None:
+    """Test that messages which have not been logged for an interval are forgotten."""
+    rate_limit = RateLimitFilter(10)
+
+    with patch("hue2mqtt.log.time.monotonic", return_value=100):
+        for entity in ("a", "b"):
+            record = make_record("Bad JSON: %s", "{", entity=entity, rate_limited=True)
+            assert rate_limit.filter(record)
+        record = make_record("Bad JSON: %s", "{", entity="a", rate_limited=True)
+        assert not rate_limit.filter(record)
+
+    with patch("hue2mqtt.log.time.monotonic", return_value=111):
+        record = make_record("Bad JSON: %s", "{", entity="c", rate_limited=True)
+        assert rate_limit.filter(record)
+    assert [key[3] for key in rate_limit._last] == ["a", "c"]
+
+
+def test_lazy_queue_handler() -> None:
+    """Test that records are queued without being formatted."""
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.handle(make_record("Updating %s", "Lamp"))
+
+    record = records.get_nowait()
+    assert record.msg == "Updating %s"
+    assert record.args == ("Lamp",)
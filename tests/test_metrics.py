@@ -0,0 +1,37 @@
+"""Test the runtime metrics."""
+
+from hue2mqtt.metrics import Metrics
+
+
+def test_increment() -> None:
+    """Test that counters can be incremented."""
+    metrics = Metrics()
+    metrics.increment("foo")
+    metrics.increment("foo", 2)
+    assert metrics.counters == {"foo": 3}
+
+
+def test_observe() -> None:
+    """Test that durations are summarised."""
+    metrics = Metrics()
+    metrics.observe("foo", 2)
+    metrics.observe("foo", 1)
+
+    summary = metrics.timings["foo"]
+    assert summary.count == 2
+    assert summary.total == 3
+    assert summary.last == 1
+    assert summary.max == 2
+
+
+def test_report_is_snapshot() -> None:
+    """Test that a report is not changed by later observations."""
+    metrics = Metrics()
+    metrics.increment("foo")
+    metrics.observe("bar", 1)
+    report = metrics.report()
+
+    metrics.increment("foo")
+    metrics.observe("bar", 1)
+    assert report.counters == {"foo": 1}
+    assert report.timings["bar"].count == 1
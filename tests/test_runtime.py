@@ -0,0 +1,70 @@
+"""Test the runtime configuration."""
+
+import asyncio
+import sys
+
+import pytest
+from pydantic import parse_obj_as
+
+from hue2mqtt.config import RuntimeInfo
+from hue2mqtt.runtime import Offloader, build_models, create_event_loop
+from hue2mqtt.schema import GroupInfo, SensorInfo
+
+GROUP_RAW = {
+    "name": "Lounge",
+    "lights": ["1"],
+    "sensors": [],
+    "type": "Room",
+    "state": {"all_on": False, "any_on": False},
+    "action": {"on": False},
+}
+
+SENSOR_RAW = {
+    "name": "Hallway sensor",
+    "type": "ZLLPresence",
+    "modelid": "SML001",
+    "manufacturername": "Signify Netherlands B.V.",
+    "productname": "Hue motion sensor",
+    "uniqueid": "00:17:88:01:02:00:af:28-02-0406",
+    "swversion": "6.1.1.27575",
+    "state": {"presence": True},
+}
+
+
+def test_create_event_loop_falls_back(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the asyncio event loop is used if uvloop is not installed."""
+    monkeypatch.setitem(sys.modules, "uvloop", None)
+    loop = create_event_loop("uvloop")
+    try:
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+        assert type(loop).__module__.startswith("asyncio")
+    finally:
+        loop.close()
+
+
+def test_build_models() -> None:
+    """Test that models are built from the raw items."""
+    groups, errors = build_models(GroupInfo, [("1", GROUP_RAW), ("2", GROUP_RAW)])
+    assert [group.id for group in groups] == [1, 2]
+    assert errors == []
+
+
+def test_build_models_skips_invalid() -> None:
+    """Test that invalid items are skipped and reported."""
+    groups, errors = build_models(GroupInfo, [("1", GROUP_RAW), ("2", {"name": "Bad"})])
+    assert [group.id for group in groups] == [1]
+    assert [idx for idx, _ in errors] == ["2"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", ["none", "thread", "process"])
+async def test_offloader(executor: str) -> None:
+    """Test that work can be offloaded to each kind of executor."""
+    offloader = Offloader(parse_obj_as(RuntimeInfo, {"executor": executor, "workers": 1}))
+    try:
+        groups, _ = await offloader.run(build_models, GroupInfo, [("1", GROUP_RAW)])
+        sensors, _ = await offloader.run(build_models, SensorInfo, [("4", SENSOR_RAW)])
+    finally:
+        offloader.shutdown()
+    assert groups[0].name == "Lounge"
+    assert sensors[0].dict()["state"]["presence"] is True
@@ -0,0 +1,99 @@
+"""Test local scenes."""
+
+import asyncio
+import time
+from typing import Any, Dict
+
+import pytest
+from pydantic import parse_obj_as
+
+from hue2mqtt.pacing import Pacer
+from hue2mqtt.scenes import SceneStore, capture_state, plan_recall
+from hue2mqtt.schema import GroupInfo, LightSetState, LightState
+
+
+def make_group(group_id: int, *lights: int) -> GroupInfo:
+    """Make a group for testing."""
+    data: Dict[str, Any] = {
+        "id": group_id,
+        "name": f"Group {group_id}",
+        "lights": list(lights),
+        "sensors": [],
+        "type": "Room",
+        "state": {"all_on": False, "any_on": False},
+        "action": {"on": False},
+    }
+    return parse_obj_as(GroupInfo, data)
+
+
+def test_capture_state() -> None:
+    """Test that only the colour of the current colour mode is captured."""
+    state = parse_obj_as(
+        LightState,
+        {"on": True, "bri": 100, "ct": 366, "xy": (0.4, 0.4), "color_mode": "ct"},
+    )
+    assert capture_state(state) == {"on": True, "bri": 100, "ct": 366}
+
+    state = state.copy(update={"color_mode": None})
+    assert capture_state(state) == {"on": True, "bri": 100, "xy": (0.4, 0.4)}
+
+    state = parse_obj_as(LightState, {"on": False, "bri": 100})
+    assert capture_state(state) == {"on": False}
+
+
+def test_plan_recall_uses_group() -> None:
+    """Test that lights in the same state are set by a matching group."""
+    groups = [make_group(1, 1, 2), make_group(2, 1, 2, 3)]
+    evening = {"on": True, "bri": 100}
+
+    plan = plan_recall({1: evening, 2: evening, 3: evening}, groups)
+    assert plan.groups == [(2, evening)]
+    assert plan.lights == []
+
+    plan = plan_recall({1: evening, 2: evening, 3: {"on": False}}, groups)
+    assert plan.groups == [(1, evening)]
+    assert plan.lights == [(3, {"on": False})]
+
+
+def test_plan_recall_without_matching_group() -> None:
+    """Test that lights are set one at a time if no group matches."""
+    evening = {"on": True, "bri": 100}
+
+    plan = plan_recall({1: evening, 3: evening}, [make_group(1, 1, 2)])
+    assert plan.groups == []
+    assert plan.lights == [(1, evening), (3, evening)]
+
+
+def test_scene_store() -> None:
+    """Test that captured scenes replace configured ones."""
+    state = parse_obj_as(LightSetState, {"on": True, "ct": 400})
+    store = SceneStore({"evening": {"light-1": state}})
+    assert store.get("evening") == {"light-1": {"on": True, "ct": 400}}
+    assert store.get("morning") is None
+
+    store.capture("evening", {"light-1": {"on": False}})
+    assert store.scenes == {"evening": {"light-1": {"on": False}}}
+
+
+def test_scene_store_reload() -> None:
+    """Test that reloading replaces the configured scenes and keeps captured ones."""
+    state = parse_obj_as(LightSetState, {"on": True, "ct": 400})
+    store = SceneStore({"evening": {"light-1": state}, "morning": {"light-1": state}})
+    store.capture("evening", {"light-1": {"on": False}})
+    store.capture("night", {"light-2": {"on": False}})
+
+    store.load({"evening": {"light-2": state}})
+
+    assert store.scenes == {
+        "evening": {"light-2": {"on": True, "ct": 400}},
+        "night": {"light-2": {"on": False}},
+    }
+
+
+@pytest.mark.asyncio
+async def test_pacer_spaces_out_requests() -> None:
+    """Test that concurrent requests are spread out by the interval."""
+    pacer = Pacer(0.02)
+    start = time.monotonic()
+    await asyncio.gather(*(pacer.wait() for _ in range(4)))
+    assert time.monotonic() - start >= 0.06
@@ -0,0 +1,125 @@
+"""Test the in-memory state cache."""
+
+from typing import List
+
+import pytest
+from pydantic import parse_obj_as
+
+from hue2mqtt.messages import StateQuery
+from hue2mqtt.schema import GroupInfo, LightInfo
+from hue2mqtt.state import StateCache
+
+
+def make_light(light_id: int, *, on: bool = False, reachable: bool = True) -> LightInfo:
+    """Make a light for testing."""
+    return parse_obj_as(
+        LightInfo,
+        {
+            "id": light_id,
+            "name": f"Light {light_id}",
+            "uniqueid": f"00:17:88:01:00:00:00:{light_id:02}-0b",
+            "state": {"on": on, "reachable": reachable},
+            "manufacturername": "Signify Netherlands B.V.",
+            "modelid": "LCT012",
+            "productname": "Hue color candle",
+            "type": "Extended color light",
+            "swversion": "1.50.2_r30933",
+        },
+    )
+
+
+def make_group(group_id: int, name: str, lights: List[int]) -> GroupInfo:
+    """Make a room for testing."""
+    return parse_obj_as(
+        GroupInfo,
+        {
+            "id": group_id,
+            "name": name,
+            "lights": lights,
+            "sensors": [],
+            "type": "Room",
+            "state": {"all_on": False, "any_on": False},
+            "action": {},
+        },
+    )
+
+
+@pytest.fixture
+def cache() -> StateCache:
+    """A state cache with some lights in it."""
+    cache = StateCache()
+    cache.update_light(make_light(1, on=True))
+    cache.update_light(make_light(2))
+    cache.update_light(make_light(3, reachable=False))
+    cache.update_group(make_group(1, "Lounge", [1, 2]))
+    return cache
+
+
+def test_update_light(cache: StateCache) -> None:
+    """Test that the latest state of a light replaces the old one."""
+    cache.update_light(make_light(2, on=True))
+    assert len(cache.lights) == 3
+    light = cache.lights["00:17:88:01:00:00:00:02-0b"]
+    assert light.state is not None
+    assert light.state.on
+
+
+def test_name_index(cache: StateCache) -> None:
+    """Test that lights and rooms can be found by name once renamed."""
+    assert [x.id for x in cache.lights_named("Light 2")] == [2]
+    assert len(cache.lights_of_type("Extended color light")) == 3
+
+    cache.update_light(make_light(2).copy(update={"name": "Lamp"}))
+    assert cache.lights_named("Light 2") == []
+    assert [x.id for x in cache.lights_named("Lamp")] == [2]
+
+    assert [x.id for x in cache.rooms_named("Lounge")] == [1]
+    cache.update_group(make_group(1, "Living Room", [1, 2]))
+    assert cache.rooms_named("Lounge") == []
+    assert [x.id for x in cache.rooms_named("Living Room")] == [1]
+
+
+def test_query_lights_all(cache: StateCache) -> None:
+    """Test that an empty query matches all lights."""
+    assert len(cache.query_lights(StateQuery())) == 3
+
+
+def test_query_lights_filters(cache: StateCache) -> None:
+    """Test that lights can be filtered."""
+    assert [x.id for x in cache.query_lights(StateQuery(room="Lounge"))] == [1, 2]
+    assert [x.id for x in cache.query_lights(StateQuery(on=True))] == [1]
+    assert [x.id for x in cache.query_lights(StateQuery(reachable=False))] == [3]
+    assert cache.query_lights(StateQuery(room="Kitchen")) == []
+
+
+def test_query_groups(cache: StateCache) -> None:
+    """Test that groups can be filtered."""
+    assert len(cache.query_groups(StateQuery(room="Lounge"))) == 1
+    assert cache.query_groups(StateQuery(on=True)) == []
+
+    with pytest.raises(ValueError):
+        cache.query_groups(StateQuery(reachable=True))
+
+
+def test_groups_with_light(cache: StateCache) -> None:
+    """Test that groups can be found by their lights."""
+    cache.update_group(make_group(2, "Kitchen", [2, 3]))
+    assert [group.id for group in cache.groups_with_light(2)] == [1, 2]
+
+    cache.update_group(make_group(2, "Kitchen", [3]))
+    assert [group.id for group in cache.groups_with_light(2)] == [1]
+    assert cache.groups_with_light(4) == []
+
+
+def test_derive_group_state(cache: StateCache) -> None:
+    """Test that the state of a group is derived from its lights."""
+    state = cache.derive_group_state(cache.groups[1])
+    assert state is not None
+    assert (state.all_on, state.any_on) == (False, True)
+
+    cache.update_light(make_light(2, on=True))
+    state = cache.derive_group_state(cache.groups[1])
+    assert state is not None
+    assert (state.all_on, state.any_on) == (True, True)
+
+    assert cache.derive_group_state(make_group(2, "Kitchen", [1, 4])) is None
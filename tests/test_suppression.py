@@ -0,0 +1,60 @@
+"""Test redundant command suppression."""
+
+from typing import Any, Dict
+from unittest.mock import patch
+
+from pydantic import parse_obj_as
+
+from hue2mqtt.schema import LightState
+from hue2mqtt.suppression import PendingCommands, is_redundant, remove_redundant
+
+
+def make_state(**state: Any) -> LightState:
+    """Make a light state for testing."""
+    data: Dict[str, Any] = {"on": True, "bri": 254, "reachable": True, **state}
+    return parse_obj_as(LightState, data)
+
+
+def test_is_redundant() -> None:
+    """Test that fields that match the state of the light are redundant."""
+    state = make_state(ct=366, xy=(0.4, 0.4), color_mode="ct")
+
+    assert is_redundant("on", value=True, state=state)
+    assert is_redundant("bri", 254, state)
+    assert is_redundant("ct", 366, state)
+    assert not is_redundant("bri", 100, state)
+    assert not is_redundant("alert", "select", state)
+
+
+def test_is_redundant_color_mode() -> None:
+    """Test that colours are only compared in the colour mode they apply to."""
+    state = make_state(ct=366, xy=(0.4, 0.4), color_mode="xy")
+
+    assert is_redundant("xy", (0.4, 0.4), state)
+    assert not is_redundant("ct", 366, state)
+
+
+def test_is_redundant_unreachable() -> None:
+    """Test that the state of an unreachable light is not trusted."""
+    assert not is_redundant("on", value=True, state=make_state(reachable=False))
+
+
+def test_remove_redundant() -> None:
+    """Test that only the fields that would change a light are kept."""
+    states = [make_state(), make_state(bri=100)]
+
+    assert remove_redundant({"on": True, "bri": 254}, states) == {"bri": 254}
+    assert remove_redundant({"on": True, "transitiontime": "4"}, states) == {}
+    assert remove_redundant({"on": True}, []) == {"on": True}
+
+
+def test_pending_commands_expire() -> None:
+    """Test that lights are only pending for the timeout after a command."""
+    pending = PendingCommands(2)
+    with patch("hue2mqtt.suppression.time.monotonic", return_value=100):
+        pending.add([1, 2])
+        assert pending.any_pending([3, 1])
+        assert not pending.any_pending([3])
+
+    with patch("hue2mqtt.suppression.time.monotonic", return_value=102):
+        assert not pending.any_pending([1, 2])
@@ -0,0 +1,55 @@
+"""Test the command payload validation."""
+
+from typing import Any, Dict
+
+import pytest
+from pydantic import ValidationError, parse_obj_as
+
+from hue2mqtt.schema import GroupSetState, LightSetState
+from hue2mqtt.validation import get_validator
+
+VALID_PAYLOADS = [
+    {"on": True},
+    {"on": "true", "bri": 254},
+    {"bri": 12.0, "transitiontime": 4},
+    {"xy": [0.3, 0.4], "hue_inc": -10},
+    {"alert": "select", "effect": None},
+]
+
+
+@pytest.mark.parametrize("payload", VALID_PAYLOADS)
+def test_matches_model_validation(payload: Dict[str, Any]) -> None:
+    """Test that the result is the same as validating the whole model."""
+    expected = parse_obj_as(LightSetState, payload).dict(exclude_none=True)
+    assert get_validator(LightSetState).validate(payload) == expected
+
+
+def test_group_fields() -> None:
+    """Test that fields specific to a schema are accepted."""
+    assert get_validator(GroupSetState).validate({"scene": "abc"}) == {"scene": "abc"}
+
+    with pytest.raises(ValidationError):
+        get_validator(LightSetState).validate({"scene": "abc"})
+
+
+def test_rejects_unknown_key() -> None:
+    """Test that unknown keys are rejected."""
+    with pytest.raises(ValidationError):
+        get_validator(LightSetState).validate({"on": True, "bees": 1})
+
+
+def test_rejects_invalid_value() -> None:
+    """Test that invalid values are rejected."""
+    with pytest.raises(ValidationError):
+        get_validator(LightSetState).validate({"bri": "bees"})
+
+
+def test_rejects_non_dictionary() -> None:
+    """Test that payloads that are not dictionaries are rejected."""
+    with pytest.raises(TypeError):
+        get_validator(LightSetState).validate([1, 2])
+
+
+def test_validator_is_cached() -> None:
+    """Test that validators are only created once per schema."""
+    assert get_validator(LightSetState) is get_validator(LightSetState)